@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+JSON extraction microbenchmark - the tolerant extractor vs the original fence-strip + json.loads parser
+Runs over the malformed LLM output corpus in tests/fixtures/llm_outputs.jsonl
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.core.json_extract import extract_json_object, validate_stage_output
+
+CORPUS = os.path.join(os.path.dirname(__file__), "tests", "fixtures", "llm_outputs.jsonl")
+
+def legacy_parse(response_text: str):
+    """TAMSAgent._parse_json_response before tolerant extraction"""
+    try:
+        response_text = response_text.strip()
+        if response_text.startswith('```json'):
+            response_text = response_text[7:]
+        if response_text.endswith('```'):
+            response_text = response_text[:-3]
+        return json.loads(response_text)
+    except json.JSONDecodeError:
+        return None
+
+def tolerant_parse(response_text: str):
+    return extract_json_object(response_text)[0]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="JSON extraction microbenchmark")
+    parser.add_argument("--iterations", type=int, default=20000, help="Parses per corpus entry")
+    return parser.parse_args()
+
+def bench(parse, text: str, iterations: int) -> float:
+    """Mean microseconds per call"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        parse(text)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+def main():
+    args = parse_args()
+    with open(CORPUS, encoding="utf-8") as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    print(f"{'case':<34} {'legacy_us':>9} {'tolerant_us':>11} {'legacy_ok':>9} {'tolerant_ok':>11}")
+    totals = {"legacy": 0, "tolerant": 0}
+    for case in corpus:
+        results = {}
+        for name, parse in (("legacy", legacy_parse), ("tolerant", tolerant_parse)):
+            data = parse(case["raw"])
+            ok = isinstance(data, dict) and not validate_stage_output(case["stage"], dict(data))
+            totals[name] += ok
+            results[name] = (bench(parse, case["raw"], args.iterations), ok)
+        print(f"{case['name']:<34} {results['legacy'][0]:>9.1f} {results['tolerant'][0]:>11.1f} "
+              f"{str(results['legacy'][1]):>9} {str(results['tolerant'][1]):>11}")
+    print(f"\nUsable outputs: legacy {totals['legacy']}/{len(corpus)}, tolerant {totals['tolerant']}/{len(corpus)}")
+
+if __name__ == "__main__":
+    main()
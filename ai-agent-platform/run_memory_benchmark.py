@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Agent memory benchmark - process RSS while one TAMS agent runs many executions
+Shows the bounded execution history keeps memory flat; --unbounded reproduces the old list behaviour
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import resource
+import sys
+import time
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.agents.tams_agent import TAMSAgent
+from src.agents.execution_history import ExecutionHistory
+from src.core.mock_llm import MOCK_STAGE_RESPONSES
+
+def rss_mb() -> float:
+    """Current resident set size (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="RSS of a long-lived TAMS agent")
+    parser.add_argument("--executions", type=int, default=100000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--report-every", type=int, default=10000)
+    parser.add_argument("--history-size", type=int, default=None, help="Override AGENT_EXECUTION_HISTORY_SIZE")
+    parser.add_argument("--unbounded", action="store_true", help="Keep every execution, as before the ring buffer")
+    return parser.parse_args()
+
+async def main():
+    args = parse_args()
+    config = {"stage1_prematch": False}
+    if args.history_size is not None:
+        config["execution_history_size"] = args.history_size
+    agent = TAMSAgent(config=config)
+    if args.unbounded:
+        agent.execution_history = ExecutionHistory(maxlen=None)
+
+    # In-process stand-in for the LLM so only agent bookkeeping is measured
+    async def fake_call(prompt, stage="stage1", use_cache=True):
+        return json.dumps(MOCK_STAGE_RESPONSES[stage])
+
+    agent.llm_provider = type("StubProvider", (), {
+        "call_with_fallback": staticmethod(fake_call),
+        "get_prompt_budget": staticmethod(lambda: 8000)
+    })()
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run_one(n: int):
+        async with semaphore:
+            await agent.execute({
+                "timestamp": "2024-12-16T14:30:00Z", "merchant": f"Merchant {n % 500}", "amount": 10.0 + n % 300,
+                "transaction_type": "Card-Not-Present", "user_id": f"user_{n % 1000}", "alert_id": f"alert_{n}"
+            })
+
+    print(f"{'executions':>10} {'rss_mb':>8} {'history':>8} {'elapsed_s':>9}")
+    started, done = time.monotonic(), 0
+    while done < args.executions:
+        chunk = min(args.report_every, args.executions - done)
+        await asyncio.gather(*[run_one(done + i) for i in range(chunk)])
+        done += chunk
+        gc.collect()
+        print(f"{done:>10} {rss_mb():>8.1f} {len(agent.execution_history):>8} {time.monotonic() - started:>9.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Mock LLM server for load testing TAMS without real LLM quota
+Serves OpenAI, Anthropic and Ollama wire formats with configurable latency and faults
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.core.mock_llm import MockLLMServer, parse_latency
+
+FORMAT_PATHS = {
+    "openai": "/v1/chat/completions",
+    "anthropic": "/v1/messages",
+    "ollama": "/api/generate"
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mock LLM server for TAMS load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("MOCK_LLM_PORT", "8089")))
+    parser.add_argument("--latency", default=os.getenv("MOCK_LLM_LATENCY", "lognormal:800,0.5"),
+                        help="fixed:MS, lognormal:MEDIAN_MS[,SIGMA] or histogram:PATH.json")
+    parser.add_argument("--error-429-rate", type=float, default=float(os.getenv("MOCK_LLM_429_RATE", "0")))
+    parser.add_argument("--error-5xx-rate", type=float, default=float(os.getenv("MOCK_LLM_5XX_RATE", "0")))
+    parser.add_argument("--timeout-rate", type=float, default=float(os.getenv("MOCK_LLM_TIMEOUT_RATE", "0")))
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--format", choices=list(FORMAT_PATHS), default="openai",
+                        help="Wire format used by --benchmark")
+    parser.add_argument("--benchmark", type=int, default=0, metavar="N",
+                        help="Run N TAMS analyses against the mock server and report throughput")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent analyses for --benchmark")
+    return parser.parse_args()
+
+async def run_benchmark(base_url: str, args):
+    """Run TAMS analyses through the real client stack against the mock server"""
+    os.environ["CUSTOM_LLM_URL"] = base_url + FORMAT_PATHS[args.format]
+    os.environ["CUSTOM_LLM_FORMAT"] = args.format
+    os.environ["CUSTOM_LLM_MODEL"] = "gpt-4o"
+    for key in ("OPENAI_API_KEY", "ANTHROPIC_API_KEY", "ONEGPT_JWT_TOKEN"):
+        os.environ.pop(key, None)
+
+    # Imported after the environment points the client at the mock server
+    from src.agents.tams_agent import create_tams_agent
+    from src.core.llm_client import llm_provider
+
+    # Distinct alerts so the response cache does not hide the I/O
+    alerts = [
+        {
+            "timestamp": "2024-12-16T14:30:00Z",
+            "merchant": f"Load Test Merchant {i}",
+            "amount": 100.0 + i,
+            "transaction_type": "Card-Not-Present",
+            "user_id": f"user_{i % 50}"
+        }
+        for i in range(args.benchmark)
+    ]
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    failures = 0
+
+    async def analyze(alert):
+        nonlocal failures
+        async with semaphore:
+            started = time.monotonic()
+            result = await create_tams_agent().execute(alert)
+            latencies.append(time.monotonic() - started)
+            if result.get("status") == "failed":
+                failures += 1
+
+    print(f"🏁 Running {args.benchmark} analyses at concurrency {args.concurrency} ({args.format} format)")
+    started = time.monotonic()
+    await asyncio.gather(*(analyze(alert) for alert in alerts))
+    elapsed = time.monotonic() - started
+    await llm_provider.client.close()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"✅ {args.benchmark} analyses in {elapsed:.2f}s ({args.benchmark / elapsed:.2f}/s)")
+    print(f"📊 Latency p50 {p50 * 1000:.0f}ms, p95 {p95 * 1000:.0f}ms, failed {failures}")
+
+async def main():
+    args = parse_args()
+    server = MockLLMServer(
+        latency=parse_latency(args.latency),
+        error_429_rate=args.error_429_rate,
+        error_5xx_rate=args.error_5xx_rate,
+        timeout_rate=args.timeout_rate,
+        seed=args.seed
+    )
+    base_url = await server.start(args.host, args.port)
+    print(f"🧪 Mock LLM server on {base_url} (latency {args.latency})")
+    for name, path in FORMAT_PATHS.items():
+        print(f"   {name:<10} CUSTOM_LLM_URL={base_url}{path} CUSTOM_LLM_FORMAT={name}")
+
+    try:
+        if args.benchmark:
+            await run_benchmark(base_url, args)
+            print(f"📈 Server stats: {server.stats}")
+        else:
+            while True:
+                await asyncio.sleep(3600)
+    finally:
+        await server.stop()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n👋 Mock LLM server stopped")
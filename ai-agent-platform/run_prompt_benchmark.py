@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Prompt size benchmark - token counts of TAMS prompt data in the v1.1 (JSON) and v1.3 (compact table) formats
+Uses synthetic transaction histories and the configured tokenizer (LLM_TOKENIZER)
+"""
+
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.core.prompt_format import serializer_for
+from src.core.tokens import token_counter
+
+MERCHANTS = [
+    ("Amazon", "5399"), ("Starbucks", "5814"), ("Walmart Supercenter", "5411"), ("Shell Oil", "5541"),
+    ("Netflix.com", "4899"), ("Uber Trip", "4121"), ("Whole Foods Market", "5411"), ("Apple Store", "5732"),
+    ("Delta Air Lines", "3058"), ("CVS Pharmacy", "5912"), ("Home Depot", "5200"), ("Spotify USA", "5815")
+]
+
+def synthetic_history(size: int, seed: int = 7):
+    """Transaction history in the shape returned by TAMSAgent._get_transaction_history"""
+    rng = random.Random(seed)
+    start = datetime(2024, 9, 16, tzinfo=timezone.utc)
+    history = []
+    for _ in range(size):
+        merchant, mcc = rng.choice(MERCHANTS)
+        timestamp = start + timedelta(seconds=rng.randint(0, 90 * 86400))
+        history.append({
+            "timestamp": timestamp.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "merchant": merchant,
+            "amount": round(rng.lognormvariate(3.5, 0.9), 2),
+            "transaction_type": rng.choice(["Card-Present", "Card-Not-Present"]),
+            "mcc": mcc
+        })
+    return sorted(history, key=lambda t: t["timestamp"], reverse=True)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Token savings of compact prompt serialization")
+    parser.add_argument("--sizes", default="10,50,200,1000", help="Comma-separated history sizes")
+    parser.add_argument("--baseline", default="v1.1", help="Prompt version to compare against")
+    parser.add_argument("--candidate", default="v1.3", help="Prompt version to measure")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    baseline, candidate = serializer_for(args.baseline), serializer_for(args.candidate)
+    print(f"Tokenizer: {token_counter.tokenizer.name}")
+    print(f"{'rows':>6} {args.baseline + ' tokens':>14} {args.candidate + ' tokens':>14} {'saved':>8}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        history = synthetic_history(size)
+        before = token_counter.count(baseline.records(history, dictionary=("merchant",)))
+        after = token_counter.count(candidate.records(history, dictionary=("merchant",)))
+        print(f"{size:>6} {before:>14} {after:>14} {1 - after / before:>8.1%}")
+
+if __name__ == "__main__":
+    main()
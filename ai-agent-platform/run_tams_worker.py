@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+TAMS queue worker - consumes alerts from Redis Streams or a local SQLite queue
+Run more copies of this process to scale out within the same consumer group
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.core.alert_queue import create_alert_queue
+from src.agents.tams_worker import TAMSWorkerPool
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="TAMS alert worker pool")
+    parser.add_argument("--backend", choices=["redis", "sqlite"], default=os.getenv("TAMS_QUEUE_BACKEND", "redis"))
+    parser.add_argument("--concurrency", type=int, default=None, help="Concurrent analyses in this process")
+    parser.add_argument("--publish", metavar="FILE", help="Enqueue alerts from a JSON array or NDJSON file and exit")
+    return parser.parse_args()
+
+def load_alerts(path: str):
+    with open(path) as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+async def main():
+    args = parse_args()
+    queue = create_alert_queue(args.backend)
+
+    if args.publish:
+        alerts = load_alerts(args.publish)
+        for alert in alerts:
+            await queue.publish(alert)
+        print(f"📥 Enqueued {len(alerts)} alerts ({args.backend})")
+        await queue.close()
+        return
+
+    pool = TAMSWorkerPool(queue, concurrency=args.concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, pool.stop)
+
+    print(f"👷 TAMS worker {pool.consumer_name} consuming from {args.backend} with {pool.concurrency} workers")
+    try:
+        await pool.run()
+    finally:
+        await queue.close()
+        print(f"👋 TAMS worker stopped: {pool.stats}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
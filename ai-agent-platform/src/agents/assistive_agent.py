@@ -93,6 +93,10 @@ class AssistiveAgent(BaseAgent):
                 "status": "failed",
                 "error": error_msg
             }
+        
+        finally:
+            # Cancellation is not an Exception; no-op once the execution has finished
+            self.fail_execution("Execution cancelled")
     
     def validate_input(self, input_data: Dict[str, Any]) -> bool:
         """Validate input data"""
@@ -1,8 +1,11 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional, List
 from enum import Enum
+import contextvars
+import os
 import uuid
 from datetime import datetime
+from .execution_history import ExecutionContext, ExecutionHistory, DatabaseExecutionSpill
 
 class AgentStatus(Enum):
     IDLE = "idle"
@@ -23,10 +26,33 @@ class BaseAgent(ABC):
         self.name = name
         self.type = agent_type
         self.config = config or {}
-        self.status = AgentStatus.IDLE
         self.created_at = datetime.utcnow()
-        self.last_execution = None
-        self.execution_history = []
+        
+        # Bounded history; evicted entries optionally go to the agent_executions table
+        history_size = self.config.get("execution_history_size", int(os.getenv("AGENT_EXECUTION_HISTORY_SIZE", "100")))
+        spill = self.config.get("execution_spill", os.getenv("AGENT_EXECUTION_SPILL", "false").lower() == "true")
+        self.execution_history = ExecutionHistory(history_size, DatabaseExecutionSpill(name) if spill else None)
+        
+        # Each concurrent execution has its own context; status is derived from them
+        self._current_execution = contextvars.ContextVar(f"agent_execution_{self.id}", default=None)
+        self._latest_execution: Optional[ExecutionContext] = None
+        self._running = 0
+        self._last_status = AgentStatus.IDLE
+    
+    @property
+    def status(self) -> AgentStatus:
+        """RUNNING while any execution is in flight, else the outcome of the last one"""
+        return AgentStatus.RUNNING if self._running else self._last_status
+    
+    @status.setter
+    def status(self, value: AgentStatus):
+        self._last_status = value
+    
+    @property
+    def last_execution(self) -> Optional[Dict[str, Any]]:
+        """The calling task's execution if it has one, else the most recently started execution"""
+        context = self._current_execution.get() or self._latest_execution
+        return context.to_dict() if context else None
     
     @abstractmethod
     async def execute(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -38,37 +64,33 @@ class BaseAgent(ABC):
         """Validate input data"""
         pass
     
-    def start_execution(self, input_data: Dict[str, Any]):
+    def start_execution(self, input_data: Dict[str, Any]) -> ExecutionContext:
         """Start agent execution"""
-        self.status = AgentStatus.RUNNING
-        self.last_execution = {
-            'id': str(uuid.uuid4()),
-            'started_at': datetime.utcnow(),
-            'input_data': input_data,
-            'status': 'running'
-        }
+        context = ExecutionContext(input_data)
+        self._current_execution.set(context)
+        self._latest_execution = context
+        self._running += 1
+        return context
     
-    def complete_execution(self, output_data: Dict[str, Any]):
+    def complete_execution(self, output_data: Dict[str, Any], context: ExecutionContext = None):
         """Complete agent execution"""
-        self.status = AgentStatus.COMPLETED
-        if self.last_execution:
-            self.last_execution.update({
-                'completed_at': datetime.utcnow(),
-                'output_data': output_data,
-                'status': 'completed'
-            })
-            self.execution_history.append(self.last_execution)
-    
-    def fail_execution(self, error: str):
+        self._finish_execution(context, AgentStatus.COMPLETED, output_data=output_data)
+    
+    def fail_execution(self, error: str, context: ExecutionContext = None):
         """Fail agent execution"""
-        self.status = AgentStatus.FAILED
-        if self.last_execution:
-            self.last_execution.update({
-                'completed_at': datetime.utcnow(),
-                'error': error,
-                'status': 'failed'
-            })
-            self.execution_history.append(self.last_execution)
+        self._finish_execution(context, AgentStatus.FAILED, error=error)
+    
+    def _finish_execution(self, context: Optional[ExecutionContext], status: AgentStatus,
+                          output_data: Dict[str, Any] = None, error: str = None):
+        context = context or self._current_execution.get()
+        if context is None or context.status != 'running':
+            return
+        context.finish(status.value, output_data=output_data, error=error)
+        self._running = max(0, self._running - 1)
+        self._last_status = status
+        if self._current_execution.get() is context:
+            self._current_execution.set(None)
+        self.execution_history.append(context.to_dict())
     
     def get_status(self) -> Dict[str, Any]:
         """Get agent status"""
@@ -79,7 +101,7 @@ class BaseAgent(ABC):
             'status': self.status.value,
             'created_at': self.created_at.isoformat(),
             'last_execution': self.last_execution,
-            'execution_count': len(self.execution_history)
+            'execution_count': self.execution_history.total
         }
 
 class AgentRegistry:
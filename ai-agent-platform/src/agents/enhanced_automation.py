@@ -55,6 +55,10 @@ class EnhancedAutomationAgent(AutomationAgent):
                 "status": "failed",
                 "error": error_msg
             }
+        
+        finally:
+            # Cancellation is not an Exception; no-op once the execution has finished
+            self.fail_execution("Execution cancelled")
     
     async def _execute_with_retry(self, input_data: Dict[str, Any], context: str = "") -> Dict[str, Any]:
         """Execute workflow with retry logic"""
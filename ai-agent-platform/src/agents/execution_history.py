@@ -0,0 +1,160 @@
+from typing import Dict, Any, Optional, List, Callable
+from collections import deque
+from datetime import datetime
+import json
+import queue
+import threading
+import uuid
+
+class ExecutionContext:
+    """State of a single agent execution; concurrent executions each get their own"""
+
+    def __init__(self, input_data: Dict[str, Any]):
+        self.id = str(uuid.uuid4())
+        self.started_at = datetime.utcnow()
+        self.input_data = input_data
+        self.status = 'running'
+        self.completed_at: Optional[datetime] = None
+        self.output_data: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+
+    def finish(self, status: str, output_data: Dict[str, Any] = None, error: str = None):
+        self.status = status
+        self.completed_at = datetime.utcnow()
+        self.output_data = output_data
+        self.error = error
+
+    def to_dict(self) -> Dict[str, Any]:
+        """History entry in the shape agents have always reported"""
+        entry = {
+            'id': self.id,
+            'started_at': self.started_at,
+            'input_data': self.input_data,
+            'status': self.status
+        }
+        if self.completed_at is not None:
+            entry['completed_at'] = self.completed_at
+        if self.output_data is not None:
+            entry['output_data'] = self.output_data
+        if self.error is not None:
+            entry['error'] = self.error
+        return entry
+
+class ExecutionHistory:
+    """Ring buffer of the most recent execution entries
+
+    Holds at most maxlen entries; the oldest entry is handed to the optional
+    spill (e.g. DatabaseExecutionSpill) as it is evicted. Supports len(),
+    iteration and indexing/slicing like the list it replaces; `total`
+    counts every execution ever recorded.
+    """
+
+    def __init__(self, maxlen: int = 100, spill: Optional["DatabaseExecutionSpill"] = None):
+        self._entries = deque(maxlen=maxlen)
+        self.spill = spill
+        self.total = 0
+
+    @property
+    def maxlen(self) -> int:
+        return self._entries.maxlen
+
+    def append(self, entry: Dict[str, Any]):
+        if self.spill is not None and len(self._entries) == self._entries.maxlen:
+            # With maxlen 0 nothing is kept, so the new entry itself is evicted
+            self.spill.put(self._entries[0] if self._entries else entry)
+        self._entries.append(entry)
+        self.total += 1
+
+    def recent(self, n: int) -> List[Dict[str, Any]]:
+        """Up to n most recent entries, oldest first"""
+        return list(self._entries)[-n:] if n > 0 else []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(list(self._entries))
+
+    def __getitem__(self, index):
+        return list(self._entries)[index]
+
+def _jsonable(value: Any) -> Any:
+    """Round-trip through JSON so datetimes and other objects fit a JSON column"""
+    return json.loads(json.dumps(value, default=str)) if value is not None else None
+
+class DatabaseExecutionSpill:
+    """Writes evicted history entries to the agent_executions table from a background thread
+
+    put() never blocks the event loop: entries are queued and inserted in
+    batches by a daemon thread. If the queue is full the entry is dropped
+    and counted.
+    """
+
+    def __init__(self, agent_name: str, session_factory: Callable = None, batch_size: int = 50,
+                 max_pending: int = 10000):
+        self.agent_name = agent_name
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.stats = {"spilled": 0, "dropped": 0, "errors": 0}
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+
+    def put(self, entry: Dict[str, Any]):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"{self.agent_name}-history-spill", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def flush(self):
+        """Block until every queued entry has been written (or failed)"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        from ..core.models import Agent, AgentExecution
+        if self.session_factory is None:
+            from ..core.database import SessionLocal
+            self.session_factory = SessionLocal
+
+        db = self.session_factory()
+        try:
+            agent = db.query(Agent).filter(Agent.name == self.agent_name).first()
+            db.add_all([
+                AgentExecution(
+                    agent_id=agent.id if agent else None,
+                    status=entry.get('status'),
+                    input_data=_jsonable(entry.get('input_data')),
+                    output_data=_jsonable(entry.get('output_data')),
+                    error_message=entry.get('error'),
+                    started_at=entry.get('started_at'),
+                    completed_at=entry.get('completed_at')
+                )
+                for entry in batch
+            ])
+            db.commit()
+            self.stats["spilled"] += len(batch)
+        except Exception as e:
+            db.rollback()
+            self.stats["errors"] += 1
+            print(f"⚠️  Could not spill {len(batch)} {self.agent_name} executions to the database: {e}")
+        finally:
+            db.close()
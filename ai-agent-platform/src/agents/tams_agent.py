@@ -1,11 +1,145 @@
 from .base import BaseAgent, AgentType
 from ..core.llm_client import llm_provider
-from typing import Dict, Any, List
-import json
+from ..core.tokens import prompt_size_guard
+from ..core.stage_dag import StageDAG
+from ..core.genuine_matcher import genuine_alert_matcher
+from ..core.behavior_features import behavioral_feature_extractor
+from ..core.feature_store import user_feature_store
+from ..core.reference_data import ReferenceData, ReferenceDataCache
+from ..core.prompt_format import PROMPT_VERSIONS, prompt_version_at_least, serializer_for
+from ..core.html_render import render_stage1_html, render_stage2_html, render_stage3_html, render_skipped_html
+from ..core.json_extract import stage_output_parser, validate_stage_output, build_regeneration_prompt
+from ..core.stage_policy import ShortCircuitPolicy
+from ..core.alert_cache import AlertResultCache
+from ..core.sop_rules import SOPRuleEngine
+from ..core.alert_packing import AlertPacker, packed_output, parse_packed_response, split_shared_features, format_feature_matrix
+from typing import Dict, Any, List, AsyncIterator
 import asyncio
 from datetime import datetime, timedelta
 import os
 
+# Stage 2 task instructions shared by every prompt version (verbatim from v1.1)
+STAGE2_CHECKS = """TASK:
+Based on the provided data, perform the following behavioral checks and provide your assessment:
+1.  **Merchant Analysis:**
+    * Is the current merchant new for the user compared to the 3-month history?
+    * Is the current MCC unusual or a first-time MCC for the user in the last 3 months?
+    * If the merchant is not new, is the transaction frequency or amount for this merchant significantly different from past patterns with this merchant?
+2.  **Transaction Amount Analysis:**
+    * Is the current transaction amount significantly higher or lower than the user's average transaction amount in the last 3 months?
+    * Is the amount unusual for this specific MCC based on the user's history with this MCC?
+3.  **Time & Frequency Analysis:**
+    * Does the time of day/day of week of the current transaction deviate significantly from the user's established patterns in the last 3 months?
+    * Is the overall transaction frequency (e.g., multiple transactions today if unusual) notably different from the user's norm?
+4.  **Transaction Type Analysis:**
+    * Is the current transaction type (e.g., Card-Not-Present vs. Card-Present) a deviation from the user's typical transaction types in the last 3 months?
+
+Based on your analysis of the above points, provide:
+- An overall 'anomalyRating' (Low, Medium, High).
+- A list of 'keyAnomalousObservations' (bullet points of specific deviations found).
+- A 'behavioralSummary' (a brief narrative summarizing how the current transaction compares to the user's 3-month historical behavior).
+- Classify the CURRENT TRANSACTION ALERT as either 'Likely Genuine' or 'Requires Further Analysis'."""
+
+# v1.1 also asks the model to write the HTML preview
+STAGE2_TASK = STAGE2_CHECKS + """
+- Provide a HTML preview code with 
+    - Heading of Anomaly Rating with h4 size and black color with bold style and provide text color to rating word with green or yellow or red based on 
+      the rating
+    - Provide all key observations in bullet points one by one in small text size
+    - Provide the behavioral summary at the end with italic style and small text size
+    
+Respond with a JSON object:
+{
+  "classification": "Likely Genuine" | "Requires Further Analysis",
+  "anomalyRating": "Low" | "Medium" | "High",
+  "keyAnomalousObservations": ["string observation 1", "string observation 2", ...],
+  "behavioralSummary": "A brief summary.",
+  "htmlContent": "HTML Preview of final result"
+}"""
+
+# Later versions request only the structured fields; htmlContent is rendered server-side
+STAGE2_STRUCTURED_OUTPUT = """Respond with a JSON object:
+{
+  "classification": "Likely Genuine" | "Requires Further Analysis",
+  "anomalyRating": "Low" | "Medium" | "High",
+  "keyAnomalousObservations": ["string observation 1", "string observation 2", ...],
+  "behavioralSummary": "A brief summary."
+}"""
+
+STAGE2_STRUCTURED_TASK = STAGE2_CHECKS + "\n\n" + STAGE2_STRUCTURED_OUTPUT
+
+# Stage 1 similarity rules (verbatim from v1.1)
+STAGE1_TASK = """TASK:
+1.Perform Similarity Analysis (Two-Step Process):
+Step 1: Create a Filtered Working Dataset from Genuine Alerts.
+Action: From the provided list named "RECENTLY CONFIRMED GENUINE ALERTS", you must create a new, temporary dataset.
+Inclusion Criteria: This new dataset should only contain transactions from the original list whose Timestamp is older than 24 hours from the current Timestamp.
+Step 2: Compare Against the Filtered Dataset.
+Source: Use the filtered working dataset you created in Step 1.
+Action: Compare the "CURRENT TRANSACTION ALERT" against each transaction in your working dataset.
+Comparison Attributes & Rule: A high degree of similarity is determined by matching the following attributes. If at least three of these four attributes match a single genuine transaction, classify the alert as 'Likely Genuine' with 'High' confidence:
+-Merchant
+-Transaction Type
+-Amount (must be within a +/-10% range)
+-Timestamp
+2. Classify the CURRENT TRANSACTION ALERT as either 'Likely Genuine' or 'Requires Further Analysis'.
+3. If 'Likely Genuine', provide a confidence score (High, Medium, Low) and a brief rationale (e.g., 'Matches 3 out of 4 key attributes with genuine transaction X from {days_back} days ago')."""
+
+# Stage 1 response instructions: v1.1 verbatim, then structured fields only
+STAGE1_OUTPUT = """4. Provide a HTML preview code with
+    - Classification heading in it with h4 size and start from left alignment and with respective red and green color
+    - Tabular format with check marks of acceptance and rejection with full width used in medium font size and keep background of table as white and border as black and add a comparison column with tick mark icon in it for matched status and use Attribute, Current Transaction, Recent Genuine Transaction, Comparison Status columns
+    - Add respective danger and acceptance color and styling in it with either red color or green color
+    - Don't provide any note in HTML Preview
+Respond with a JSON object:
+{
+  "classification": "Likely Genuine" | "Requires Further Analysis",
+  "confidenceScore": "High" | "Medium" | "Low" | null,
+  "rationale": "brief explanation" | null,
+  "htmlContent": "HTML Preview of final result"
+}"""
+
+STAGE1_STRUCTURED_OUTPUT = """Respond with a JSON object:
+{
+  "classification": "Likely Genuine" | "Requires Further Analysis",
+  "confidenceScore": "High" | "Medium" | "Low" | null,
+  "rationale": "brief explanation" | null
+}"""
+
+# Stage 3 response instructions: v1.1 verbatim, then structured fields only
+STAGE3_OUTPUT = """Format your response as a JSON object with these fields:
+- 'keyFindings' (array of strings, 3-4 main issues or concerns based on SOP checks and behavioral context)
+- 'riskFactors' (array of strings, specific risk factors identified from SOP checks and behavioral context)
+- 'recommendations' (array of strings, 2-3 recommended actions for the analyst)
+- 'riskRating' (number from 1-10)
+- 'htmlContent' (HTML Preview of final result in below structured format)
+    - display numeric circular icon with rating number in it with background as per the rating number and align it horizontally centered
+    - list all key findings with bullet points - keep heading with h4 size black and bold and bullet points in small text size
+    - list all recommendations with bullet points - keep heading with h4 size black and bold and bullet points in small text size
+    - list all riskFactors with bullet points - keep heading with h4 size black and bold and bullet points in small text size
+    - don't add any extra heading and all except above mentioned points
+
+{
+  "keyFindings": ["finding1", "finding2", ...],
+  "riskFactors": ["factor1", "factor2", ...],
+  "recommendations": ["rec1", "rec2", ...],
+  "riskRating": 1-10,
+  "htmlContent": "HTML Preview of final result"
+}"""
+
+STAGE3_STRUCTURED_OUTPUT = """Format your response as a JSON object with these fields:
+- 'keyFindings' (array of strings, 3-4 main issues or concerns based on SOP checks and behavioral context)
+- 'riskFactors' (array of strings, specific risk factors identified from SOP checks and behavioral context)
+- 'recommendations' (array of strings, 2-3 recommended actions for the analyst)
+- 'riskRating' (number from 1-10)
+
+{
+  "keyFindings": ["finding1", "finding2", ...],
+  "riskFactors": ["factor1", "factor2", ...],
+  "recommendations": ["rec1", "rec2", ...],
+  "riskRating": 1-10
+}"""
+
 class TAMSAgent(BaseAgent):
     """TAMS AI-Assist agent implementing 3-stage fraud analysis"""
     
@@ -13,46 +147,287 @@ class TAMSAgent(BaseAgent):
         super().__init__(name, AgentType.AUTOMATION, config)
         self.version = config.get("version", "v1.1") if config else "v1.1"
         self.llm_provider = llm_provider
+        self.prompt_guard = prompt_size_guard
+        self.feature_extractor = behavioral_feature_extractor
+        
+        # Rolling per-user aggregates; users are loaded from the data sources on first use
+        use_store = self.config.get("feature_store", os.getenv("TAMS_FEATURE_STORE", "true").lower() == "true")
+        self.feature_store = user_feature_store if use_store else None
+        
+        # "v1.1" reproduces the original prompts verbatim; later versions are listed in PROMPT_VERSIONS
+        self.prompt_version = self.config.get("prompt_version", os.getenv("TAMS_PROMPT_VERSION", "v1.5"))
+        if self.prompt_version not in PROMPT_VERSIONS:
+            print(f"⚠️  Unknown TAMS prompt version {self.prompt_version}, using the v1.1 prompts")
+        
+        # Clear Stage 1 cases are decided by the deterministic matcher without an LLM call
+        prematch = self.config.get("stage1_prematch", os.getenv("TAMS_STAGE1_PREMATCH", "true").lower() == "true")
+        self.stage1_matcher = genuine_alert_matcher if prematch else None
+        
+        # Risk intelligence and SOP tables, compiled once per TTL instead of per alert
+        self.reference_data = ReferenceDataCache(self._load_reference_data)
+        
+        # Arithmetic and lookup SOP checks are computed, not left to the LLM
+        self.sop_rules = SOPRuleEngine(self.config.get("sop_utilization_threshold"))
+        
+        # Unusable stage output gets this many short "corrected JSON only" re-generations
+        self.output_parser = stage_output_parser
+        self.regenerate_attempts = int(self.config.get("json_regenerate_attempts", os.getenv("TAMS_JSON_REGENERATE_ATTEMPTS", "1")))
+        
+        # Declarative early exits, e.g. no Stage 3 for a confident genuine match with low anomaly
+        self.short_circuit = ShortCircuitPolicy.from_config(self.config)
+        
+        # Re-submitted alerts (same alert_id or same features) reuse the stored or running analysis
+        use_alert_cache = self.config.get("alert_cache", os.getenv("TAMS_ALERT_CACHE", "true").lower() == "true")
+        self.alert_cache = AlertResultCache() if use_alert_cache else None
+        
+        # Bursts of alerts from one user share one LLM call per stage (v1.4+ prompts only)
+        use_packing = self.config.get("packing", os.getenv("TAMS_PACKING", "false").lower() == "true")
+        self.packer = AlertPacker() if use_packing else None
     
     async def execute(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute 3-stage TAMS analysis"""
-        self.start_execution(input_data)
+        """Execute 3-stage TAMS analysis, reusing the result of an identical recent alert"""
+        if self.alert_cache is None:
+            return await self._analyze(input_data)
+        return await self.alert_cache.get_or_run(input_data, lambda: self._analyze(input_data), self.prompt_version)
+    
+    def invalidate_cached_results(self, user_id: str) -> int:
+        """Forget stored analyses for a user, e.g. after a new genuine confirmation"""
+        return self.alert_cache.invalidate_user(user_id) if self.alert_cache else 0
+    
+    async def _analyze(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Run the 3-stage analysis"""
+        context = self.start_execution(input_data)
         
         try:
-            # Stage 1: Genuine Alert Correlation
-            stage1_result = await self._stage1_genuine_correlation(input_data)
-            
-            # Stage 2: Behavioral Anomaly Detection
-            stage2_result = await self._stage2_behavioral_analysis(input_data)
-            
-            # Stage 3: Comprehensive Risk Assessment
-            stage3_result = await self._stage3_risk_assessment(input_data, stage1_result, stage2_result)
+            # Stages 1 and 2 are independent and run concurrently; Stage 3 needs Stage 2
+            results, timings = await self._build_stage_dag(input_data).run()
             
             # Combine results
-            final_result = {
-                "status": "completed",
-                "analysis": {
-                    "stage1_genuine_correlation": stage1_result,
-                    "stage2_behavioral_analysis": stage2_result,
-                    "stage3_risk_assessment": stage3_result
-                },
-                "final_recommendation": self._generate_final_recommendation(stage1_result, stage2_result, stage3_result),
-                "version": self.version
-            }
+            final_result = self._build_final_result(results["stage1"], results["stage2"], results["stage3"])
+            final_result["stage_timings_ms"] = {stage: round(ms, 2) for stage, ms in timings.items()}
             
-            self.complete_execution(final_result)
+            self.complete_execution(final_result, context)
             return final_result
             
         except Exception as e:
             error_msg = f"TAMS analysis failed: {str(e)}"
-            self.fail_execution(error_msg)
+            self.fail_execution(error_msg, context)
             return {"status": "failed", "error": error_msg}
+        
+        finally:
+            # Cancellation is not an Exception; no-op once the execution has finished
+            self.fail_execution("TAMS analysis cancelled", context)
+    
+    def _build_stage_dag(self, input_data: Dict[str, Any]) -> StageDAG:
+        """Declare the analysis stages and their dependencies"""
+        dag = StageDAG()
+        stages = [
+            # Stage 1: Genuine Alert Correlation
+            ("stage1", lambda deps: self._stage1_genuine_correlation(input_data), []),
+            # Stage 2: Behavioral Anomaly Detection
+            ("stage2", lambda deps: self._stage2_behavioral_analysis(input_data), []),
+            # Stage 3: Comprehensive Risk Assessment
+            ("stage3", lambda deps: self._stage3_risk_assessment(input_data, deps["stage2"]), ["stage2"])
+        ]
+        for name, run, depends_on in stages:
+            if self.short_circuit is not None:
+                # A stage that may be skipped also waits for the stages its rules look at
+                depends_on = sorted(set(depends_on) | self.short_circuit.dependencies(name))
+                run = self._skippable(name, run, input_data)
+            dag.add_stage(name, run, depends_on=depends_on)
+        return dag
+    
+    def _skippable(self, stage: str, run, input_data: Dict[str, Any]):
+        """Wrap a DAG stage so the short-circuit policy can replace it"""
+        async def run_or_skip(deps: Dict[str, Any]) -> Dict[str, Any]:
+            skipped = await self._short_circuit(stage, deps, input_data)
+            if skipped is not None:
+                return self._render_html(stage, input_data, skipped)
+            return await run(deps)
+        return run_or_skip
+    
+    async def _short_circuit(self, stage: str, results: Dict[str, Any], input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Stand-in result if the policy skips `stage`; never skips an alert that fires a high-severity SOP rule"""
+        rule = self.short_circuit.match(stage, results) if self.short_circuit is not None else None
+        if rule is None:
+            return None
+        if self.sop_rules.blocking_rules((await self._sop_facts([input_data]))[0]):
+            self.short_circuit.block(rule)
+            return None
+        return self.short_circuit.skip(rule, stage)
+    
+    async def execute_stream(self, input_data: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Execute 3-stage TAMS analysis, yielding stage events as they happen
+        
+        Events: stage_started, stage_partial (raw token deltas), stage_completed
+        (parsed stage JSON) or stage_skipped (short-circuit policy), then a
+        final completed or failed event. A re-submitted alert with a stored
+        result yields only the completed event.
+        """
+        if self.alert_cache is not None:
+            cached = self.alert_cache.lookup(input_data, self.prompt_version)
+            if cached is not None:
+                yield {"event": "completed", "result": cached}
+                return
+            generation = self.alert_cache.generation(input_data.get("user_id"))
+        
+        context = self.start_execution(input_data)
+        
+        try:
+            results = {}
+            
+            for stage in ("stage1", "stage2", "stage3"):
+                skipped = await self._short_circuit(stage, results, input_data)
+                if skipped is not None:
+                    results[stage] = self._render_html(stage, input_data, skipped)
+                    yield {"event": "stage_skipped", "stage": stage, "result": skipped, "rule": skipped["skippedBy"]}
+                    continue
+                
+                if stage == "stage1":
+                    genuine_alerts = await self._genuine_alerts_for(input_data.get("user_id"))
+                    prematched = self._prematch_stage1(input_data, genuine_alerts)
+                    if prematched is not None:
+                        results[stage] = prematched
+                        yield {"event": "stage_started", "stage": stage}
+                        yield {"event": "stage_completed", "stage": stage, "result": prematched, "fallback": False}
+                        continue
+                    prompt = await self._build_stage1_prompt(input_data, genuine_alerts)
+                elif stage == "stage2":
+                    prompt = await self._build_stage2_prompt(input_data)
+                else:
+                    prompt = await self._build_stage3_prompt(input_data, results["stage2"])
+                
+                yield {"event": "stage_started", "stage": stage}
+                async for chunk in self.llm_provider.stream_with_fallback(prompt, stage):
+                    if "delta" in chunk:
+                        yield {"event": "stage_partial", "stage": stage, "delta": chunk["delta"]}
+                    else:
+                        self._observe_stage_cost(stage, prompt, chunk["text"])
+                        parsed = await self._parse_stage_response(stage, chunk["text"])
+                        if stage == "stage3":
+                            results[stage] = await self._finish_stage3(input_data, results["stage2"], parsed)
+                        else:
+                            results[stage] = self._render_html(stage, input_data, parsed, genuine_alerts)
+                        yield {
+                            "event": "stage_completed",
+                            "stage": stage,
+                            "result": results[stage],
+                            "fallback": chunk["fallback"]
+                        }
+            
+            final_result = self._build_final_result(results["stage1"], results["stage2"], results["stage3"])
+            
+            self.complete_execution(final_result, context)
+            if self.alert_cache is not None:
+                self.alert_cache.store(input_data, final_result, self.prompt_version, generation)
+            yield {"event": "completed", "result": final_result}
+            
+        except Exception as e:
+            error_msg = f"TAMS analysis failed: {str(e)}"
+            self.fail_execution(error_msg, context)
+            yield {"event": "failed", "error": error_msg}
+        
+        finally:
+            # Cancelled, or the consumer closed the stream early
+            self.fail_execution("TAMS analysis cancelled", context)
+    
+    async def execute_batch(self, alerts: AsyncIterator[Dict[str, Any]], concurrency: int = 8,
+                            start: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """Analyze a stream of alerts with bounded concurrency, yielding results as they complete
+        
+        Every input position gets exactly one result line with its index, the
+        alert_id if present, and either the analysis or an error; a bad item
+        never fails the batch. Items before `start` are skipped. Each line
+        carries `cursor`, the number of leading items that are finished, so an
+        interrupted job can resume with start=cursor (items after the cursor
+        that had already finished are analyzed again).
+        """
+        running: Dict[asyncio.Future, tuple] = {}
+        finished = set()
+        cursor = start
+        index = -1
+        exhausted = False
+        iterator = alerts.__aiter__()
+        
+        async def analyze(item) -> Dict[str, Any]:
+            if not isinstance(item, dict) or not self.validate_input(item):
+                return {"status": "error", "error": "Invalid alert: timestamp, merchant, amount, transaction_type and user_id are required"}
+            try:
+                result = await self.execute(item)
+            except Exception as e:
+                return {"status": "error", "error": f"TAMS analysis failed: {str(e)}"}
+            if result.get("status") == "failed":
+                return {"status": "error", "error": result.get("error")}
+            return {"status": "completed", "result": result}
+        
+        try:
+            while True:
+                # Keep up to `concurrency` alerts in flight, reading input only as slots free up
+                while not exhausted and len(running) < concurrency:
+                    try:
+                        item = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    index += 1
+                    if index < start:
+                        continue
+                    alert_id = item.get("alert_id") if isinstance(item, dict) else None
+                    running[asyncio.ensure_future(analyze(item))] = (index, alert_id)
+                
+                if not running:
+                    break
+                
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    item_index, alert_id = running.pop(task)
+                    finished.add(item_index)
+                    while cursor in finished:
+                        finished.discard(cursor)
+                        cursor += 1
+                    yield {"index": item_index, "alert_id": alert_id, **task.result(), "cursor": cursor}
+        finally:
+            for task in running:
+                task.cancel()
     
     async def _stage1_genuine_correlation(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Stage 1: Genuine Alert Correlation Analysis using exact v1.1 prompt"""
+        genuine_alerts = await self._genuine_alerts_for(input_data.get("user_id"))
+        prematched = self._prematch_stage1(input_data, genuine_alerts)
+        if prematched is not None:
+            return prematched
+        if self._packing():
+            return await self.packer.submit("stage1", input_data.get("user_id"), {"input": input_data}, self._run_pack)
+        return await self._stage1_llm(input_data, genuine_alerts)
+    
+    async def _stage1_llm(self, input_data: Dict[str, Any], genuine_alerts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Stage 1 for one alert through the LLM"""
+        prompt = await self._build_stage1_prompt(input_data, genuine_alerts)
+        response = await self.llm_provider.call_with_fallback(prompt, "stage1")
+        self._observe_stage_cost("stage1", prompt, response)
+        return self._render_html("stage1", input_data, await self._parse_stage_response("stage1", response), genuine_alerts)
+    
+    def _prematch_stage1(self, input_data: Dict[str, Any], genuine_alerts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Apply the Stage 1 rule deterministically; None when the case needs the LLM"""
+        if self.stage1_matcher is None:
+            return None
+        try:
+            return self.stage1_matcher.match(input_data, genuine_alerts)
+        except (TypeError, ValueError) as e:
+            # Unparseable timestamps or amounts are left to the LLM
+            print(f"⚠️  Stage 1 pre-match skipped: {e}")
+            return None
+    
+    async def _build_stage1_prompt(self, input_data: Dict[str, Any], genuine_alerts: List[Dict[str, Any]] = None) -> str:
+        """Build the Stage 1 genuine alert correlation prompt"""
         
         # Get recent genuine alerts (filtered for 24+ hours old)
-        genuine_alerts = await self._get_genuine_alerts(input_data.get("user_id"))
+        if genuine_alerts is None:
+            genuine_alerts = await self._genuine_alerts_for(input_data.get("user_id"))
+        return self._fit_prompt(self._render_stage1_prompt, input_data, genuine_alerts=genuine_alerts)
+    
+    def _render_stage1_prompt(self, input_data: Dict[str, Any], genuine_alerts: List[Dict[str, Any]]) -> str:
+        """Render the Stage 1 prompt text"""
         days_back = 30
         
         # Use exact prompt from v1.1
@@ -64,45 +439,53 @@ Analyze the CURRENT TRANSACTION ALERT:
 - Transaction Type: {input_data.get('transaction_type')}
 
 Compare it against the following RECENTLY CONFIRMED GENUINE ALERTS (last {days_back} days) for this user/segment:
-{json.dumps(genuine_alerts, indent=2)}
-
-TASK:
-1.Perform Similarity Analysis (Two-Step Process):
-Step 1: Create a Filtered Working Dataset from Genuine Alerts.
-Action: From the provided list named "RECENTLY CONFIRMED GENUINE ALERTS", you must create a new, temporary dataset.
-Inclusion Criteria: This new dataset should only contain transactions from the original list whose Timestamp is older than 24 hours from the current Timestamp.
-Step 2: Compare Against the Filtered Dataset.
-Source: Use the filtered working dataset you created in Step 1.
-Action: Compare the "CURRENT TRANSACTION ALERT" against each transaction in your working dataset.
-Comparison Attributes & Rule: A high degree of similarity is determined by matching the following attributes. If at least three of these four attributes match a single genuine transaction, classify the alert as 'Likely Genuine' with 'High' confidence:
--Merchant
--Transaction Type
--Amount (must be within a +/-10% range)
--Timestamp
-2. Classify the CURRENT TRANSACTION ALERT as either 'Likely Genuine' or 'Requires Further Analysis'.
-3. If 'Likely Genuine', provide a confidence score (High, Medium, Low) and a brief rationale (e.g., 'Matches 3 out of 4 key attributes with genuine transaction X from {days_back} days ago').
-4. Provide a HTML preview code with
-    - Classification heading in it with h4 size and start from left alignment and with respective red and green color
-    - Tabular format with check marks of acceptance and rejection with full width used in medium font size and keep background of table as white and border as black and add a comparison column with tick mark icon in it for matched status and use Attribute, Current Transaction, Recent Genuine Transaction, Comparison Status columns
-    - Add respective danger and acceptance color and styling in it with either red color or green color
-    - Don't provide any note in HTML Preview
-Respond with a JSON object:
-{{
-  "classification": "Likely Genuine" | "Requires Further Analysis",
-  "confidenceScore": "High" | "Medium" | "Low" | null,
-  "rationale": "brief explanation" | null,
-  "htmlContent": "HTML Preview of final result"
-}}"""
+{serializer_for(self.prompt_version).records(genuine_alerts, dictionary=("merchant",))}
 
-        response = await self.llm_provider.call_with_fallback(prompt, "stage1")
-        return self._parse_json_response(response)
+{STAGE1_TASK.format(days_back=days_back)}
+{STAGE1_STRUCTURED_OUTPUT if self._prompt_at_least("v1.4") else STAGE1_OUTPUT}"""
+        return prompt
     
     async def _stage2_behavioral_analysis(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Stage 2: Behavioral Anomaly Detection using exact v1.1 prompt"""
+        if self._packing():
+            return await self.packer.submit("stage2", input_data.get("user_id"), {"input": input_data}, self._run_pack)
+        return await self._stage2_llm(input_data)
+    
+    async def _stage2_llm(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Stage 2 for one alert through the LLM"""
+        prompt = await self._build_stage2_prompt(input_data)
+        response = await self.llm_provider.call_with_fallback(prompt, "stage2")
+        self._observe_stage_cost("stage2", prompt, response)
+        return self._render_html("stage2", input_data, await self._parse_stage_response("stage2", response))
+    
+    async def _build_stage2_prompt(self, input_data: Dict[str, Any]) -> str:
+        """Build the Stage 2 behavioral anomaly prompt
+        
+        Behavioral features need parseable timestamps; when the alert or its
+        history has one that is not ISO 8601, the raw history is sent instead.
+        """
+        
+        if self._prompt_at_least("v1.2"):
+            try:
+                features = await self._stage2_features(input_data)
+                return self._render_stage2_features_prompt(input_data, features)
+            except (TypeError, ValueError) as e:
+                print(f"⚠️  Behavioral features unavailable, sending raw history instead: {e}")
         
         # Get user transaction history (3 months)
         transaction_history = await self._get_transaction_history(input_data.get("user_id"))
-        
+        return self._fit_prompt(self._render_stage2_prompt, input_data, transaction_history=transaction_history)
+    
+    async def _stage2_features(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Behavioral features for an alert, from the feature store when enabled"""
+        if self.feature_store is not None:
+            await self._ensure_user_loaded(input_data.get("user_id"))
+            return self.feature_store.features_for(input_data)
+        transaction_history = await self._get_transaction_history(input_data.get("user_id"))
+        return self.feature_extractor.extract(input_data, transaction_history)
+    
+    def _render_stage2_prompt(self, input_data: Dict[str, Any], transaction_history: List[Dict[str, Any]]) -> str:
+        """Render the Stage 2 prompt text"""
         # Use exact prompt from v1.1
         prompt = f"""You are an AI assistant specializing in detecting behavioral anomalies in financial transactions.
 Analyze the CURRENT TRANSACTION ALERT by comparing it against the USER'S TRANSACTION HISTORY from the past 3 months.
@@ -114,53 +497,72 @@ CURRENT TRANSACTION ALERT:
 - Transaction Type: {input_data.get('transaction_type')}
 
 USER'S TRANSACTION HISTORY (Past 3 Months):
-{json.dumps(transaction_history, indent=2)}
+{serializer_for(self.prompt_version).records(transaction_history, dictionary=("merchant",))}
 
-TASK:
-Based on the provided data, perform the following behavioral checks and provide your assessment:
-1.  **Merchant Analysis:**
-    * Is the current merchant new for the user compared to the 3-month history?
-    * Is the current MCC unusual or a first-time MCC for the user in the last 3 months?
-    * If the merchant is not new, is the transaction frequency or amount for this merchant significantly different from past patterns with this merchant?
-2.  **Transaction Amount Analysis:**
-    * Is the current transaction amount significantly higher or lower than the user's average transaction amount in the last 3 months?
-    * Is the amount unusual for this specific MCC based on the user's history with this MCC?
-3.  **Time & Frequency Analysis:**
-    * Does the time of day/day of week of the current transaction deviate significantly from the user's established patterns in the last 3 months?
-    * Is the overall transaction frequency (e.g., multiple transactions today if unusual) notably different from the user's norm?
-4.  **Transaction Type Analysis:**
-    * Is the current transaction type (e.g., Card-Not-Present vs. Card-Present) a deviation from the user's typical transaction types in the last 3 months?
-
-Based on your analysis of the above points, provide:
-- An overall 'anomalyRating' (Low, Medium, High).
-- A list of 'keyAnomalousObservations' (bullet points of specific deviations found).
-- A 'behavioralSummary' (a brief narrative summarizing how the current transaction compares to the user's 3-month historical behavior).
-- Classify the CURRENT TRANSACTION ALERT as either 'Likely Genuine' or 'Requires Further Analysis'.
-- Provide a HTML preview code with 
-    - Heading of Anomaly Rating with h4 size and black color with bold style and provide text color to rating word with green or yellow or red based on 
-      the rating
-    - Provide all key observations in bullet points one by one in small text size
-    - Provide the behavioral summary at the end with italic style and small text size
+{STAGE2_STRUCTURED_TASK if self._prompt_at_least("v1.4") else STAGE2_TASK}"""
+        return prompt
     
-Respond with a JSON object:
-{{
-  "classification": "Likely Genuine" | "Requires Further Analysis",
-  "anomalyRating": "Low" | "Medium" | "High",
-  "keyAnomalousObservations": ["string observation 1", "string observation 2", ...],
-  "behavioralSummary": "A brief summary.",
-  "htmlContent": "HTML Preview of final result"
-}}"""
+    def _render_stage2_features_prompt(self, input_data: Dict[str, Any], features: Dict[str, Any]) -> str:
+        """Render the Stage 2 prompt with precomputed behavioral features instead of raw history"""
+        prompt = f"""You are an AI assistant specializing in detecting behavioral anomalies in financial transactions.
+Analyze the CURRENT TRANSACTION ALERT by comparing it against the USER'S BEHAVIORAL FEATURES computed from the past 3 months of transactions.
 
-        response = await self.llm_provider.call_with_fallback(prompt, "stage2")
-        return self._parse_json_response(response)
+CURRENT TRANSACTION ALERT:
+- Timestamp: {input_data.get('timestamp')}
+- Merchant: {input_data.get('merchant')}
+- Transaction Amount: {input_data.get('amount')}
+- Transaction Type: {input_data.get('transaction_type')}
+
+USER'S BEHAVIORAL FEATURES (Past 3 Months; exact values, use them as given):
+Amounts: *_mean/*_std/*_z are the mean, standard deviation and z-score of the current amount against all history (user_) or history with the same MCC (mcc_).
+Time: hours and days of week are UTC (0=Monday); *_deviation is the circular distance from the usual value, *_concentration is 0 (spread out) to 1 (always the same).
+Velocity: txns_today includes the current alert; velocity_ratio is txns_today / avg_txns_per_day.
+{self.feature_extractor.format_table(features)}
+
+{STAGE2_STRUCTURED_TASK if self._prompt_at_least("v1.4") else STAGE2_TASK}"""
+        return prompt
     
-    async def _stage3_risk_assessment(self, input_data: Dict[str, Any], stage1_result: Dict[str, Any], stage2_result: Dict[str, Any]) -> Dict[str, Any]:
+    async def _stage3_risk_assessment(self, input_data: Dict[str, Any], stage2_result: Dict[str, Any]) -> Dict[str, Any]:
         """Stage 3: Comprehensive Risk Assessment using exact v1.1 prompt"""
+        if self._packing():
+            return await self.packer.submit("stage3", input_data.get("user_id"),
+                                            {"input": input_data, "stage2": stage2_result}, self._run_pack)
+        return await self._stage3_llm(input_data, stage2_result)
+    
+    async def _stage3_llm(self, input_data: Dict[str, Any], stage2_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Stage 3 for one alert through the LLM"""
+        prompt = await self._build_stage3_prompt(input_data, stage2_result)
+        response = await self.llm_provider.call_with_fallback(prompt, "stage3")
+        self._observe_stage_cost("stage3", prompt, response)
+        return await self._finish_stage3(input_data, stage2_result, await self._parse_stage_response("stage3", response))
+    
+    async def _finish_stage3(self, input_data: Dict[str, Any], stage2_result: Dict[str, Any],
+                             result: Dict[str, Any]) -> Dict[str, Any]:
+        """Replace the canned LLM fallback with a rules-only assessment of this alert"""
+        if not result.get("fallback"):
+            return self._render_html("stage3", input_data, result)
+        facts = (await self._sop_facts([input_data]))[0]
+        return self.sop_rules.rules_only_assessment(facts, stage2_result.get("anomalyRating"))
+    
+    async def _sop_facts(self, alerts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Deterministic SOP check results for alerts, evaluated in one batch"""
+        reference = await self.reference_data.get()
+        profiles = {}
+        for user_id in {alert.get("user_id") for alert in alerts}:
+            profiles[user_id] = await self._user_profile_for(user_id)
+        return self.sop_rules.evaluate_batch(reference, alerts, [profiles[alert.get("user_id")] for alert in alerts])
+    
+    async def _build_stage3_prompt(self, input_data: Dict[str, Any], stage2_result: Dict[str, Any]) -> str:
+        """Build the Stage 3 comprehensive risk assessment prompt"""
         
         # Get user profile and risk intelligence data
-        user_profile = await self._get_user_profile(input_data.get("user_id"))
-        risk_intelligence = await self._get_risk_intelligence_data()
-        sop_checklist = await self._get_sop_checklist()
+        user_profile = await self._user_profile_for(input_data.get("user_id"))
+        reference = await self.reference_data.get()
+        sop_checklist = reference.sop_checklist
+        if self._prompt_at_least("v1.5"):
+            risk_section = self._render_sop_facts((await self._sop_facts([input_data]))[0])
+        else:
+            risk_section = self._render_risk_intelligence(reference.risk_intelligence)
         
         # Use exact prompt from v1.1
         prompt = f"""You are a financial fraud analysis AI assistant. Analyze the following alert details and associated data to provide a structured risk assessment.
@@ -182,43 +584,254 @@ USER PROFILE & HISTORY:
 - Outstanding Balance: {user_profile.get('outstanding_balance')}
 - User Status: {user_profile.get('user_status')}
 
-RISK INTELLIGENCE DATA:
-- High-Risk Merchants: {risk_intelligence.get('high_risk_merchants')}
-- High-Risk Countries: {risk_intelligence.get('high_risk_countries')}
-- Risky Currencies For User: {risk_intelligence.get('risky_currencies')}
-- MCC Risk Data: {risk_intelligence.get('mcc_risk_data')}
+{risk_section}
 
 STANDARD OPERATING PROCEDURE (SOP) - CHECKLIST FOR ANALYSIS (Rules 3, 4, 5):
 Please perform the following checks and use your findings, along with the behavioral anomaly assessment, to inform your overall assessment:
-{json.dumps(sop_checklist, indent=2)}
+{serializer_for(self.prompt_version).items(sop_checklist)}
 
 TASK:
 1. Analyze this alert and associated data based *strictly* on the SOP checklist provided above, considering the prior behavioral anomaly assessment.
 2. Determine the risk level on a scale of 1-10 (1=Very Low, 10=Very High).
 3. Provide your analysis in a structured format.
 
-Format your response as a JSON object with these fields:
-- 'keyFindings' (array of strings, 3-4 main issues or concerns based on SOP checks and behavioral context)
-- 'riskFactors' (array of strings, specific risk factors identified from SOP checks and behavioral context)
-- 'recommendations' (array of strings, 2-3 recommended actions for the analyst)
-- 'riskRating' (number from 1-10)
-- 'htmlContent' (HTML Preview of final result in below structured format)
-    - display numeric circular icon with rating number in it with background as per the rating number and align it horizontally centered
-    - list all key findings with bullet points - keep heading with h4 size black and bold and bullet points in small text size
-    - list all recommendations with bullet points - keep heading with h4 size black and bold and bullet points in small text size
-    - list all riskFactors with bullet points - keep heading with h4 size black and bold and bullet points in small text size
-    - don't add any extra heading and all except above mentioned points
+{STAGE3_STRUCTURED_OUTPUT if self._prompt_at_least("v1.4") else STAGE3_OUTPUT}"""
+        return prompt
+    
+    @staticmethod
+    def _render_risk_intelligence(risk_intelligence: Dict[str, Any]) -> str:
+        """Raw risk intelligence lists (v1.1 wording)"""
+        return f"""RISK INTELLIGENCE DATA:
+- High-Risk Merchants: {risk_intelligence.get('high_risk_merchants')}
+- High-Risk Countries: {risk_intelligence.get('high_risk_countries')}
+- Risky Currencies For User: {risk_intelligence.get('risky_currencies')}
+- MCC Risk Data: {risk_intelligence.get('mcc_risk_data')}"""
+    
+    @staticmethod
+    def _render_sop_facts(facts: Dict[str, Any]) -> str:
+        """SOP arithmetic and risk intelligence as exact check results instead of the raw reference lists"""
+        def answer(value) -> str:
+            return "Not provided" if value is None else ("Yes" if value else "No")
+        
+        if facts["transaction_credit_utilization_pct"] is None:
+            utilization = "Not provided (no credit limit)"
+        else:
+            utilization = (f"{facts['transaction_credit_utilization_pct']}% of credit limit {facts['credit_limit']}; "
+                           f"High Transaction Credit Utilization (> {facts['utilization_threshold_pct']}%): "
+                           f"{answer(facts['high_transaction_credit_utilization'])}")
+        merchant = answer(facts["high_risk_merchant"])
+        if facts["matched_merchants"]:
+            merchant += f" (matches {', '.join(facts['matched_merchants'])})"
+        return f"""SOP RULE CHECKS (computed exactly from the alert, user profile and current reference lists; use them as facts):
+- Transaction-Level Credit Utilization: {utilization}
+- Merchant On High-Risk Merchant List: {merchant}
+- Merchant Country Is High-Risk: {answer(facts["high_risk_country"])}
+- Currency Is Risky For User: {answer(facts["risky_currency"])}
+- MCC Risk: {facts["mcc_risk"]}"""
+    
+    def _prompt_at_least(self, version: str) -> bool:
+        return prompt_version_at_least(self.prompt_version, version)
+    
+    def _packing(self) -> bool:
+        return self.packer is not None and self._prompt_at_least("v1.4")
+    
+    async def _run_pack(self, stage: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run one stage for a pack of alerts from the same user, one result per item
+        
+        A single alert uses the ordinary prompt. Alerts the packed response
+        leaves out or answers invalidly are re-run on their own.
+        """
+        if len(items) == 1:
+            return [await self._run_unpacked(stage, items[0])]
+        
+        user_id = items[0]["input"].get("user_id")
+        genuine_alerts = await self._genuine_alerts_for(user_id) if stage == "stage1" else None
+        if stage == "stage1":
+            prompt = self._fit_prompt(self._render_packed_stage1_prompt, items, genuine_alerts=genuine_alerts)
+        elif stage == "stage2":
+            try:
+                prompt = await self._build_packed_stage2_prompt(items)
+            except (TypeError, ValueError) as e:
+                # Each alert falls back to the raw-history prompt on its own
+                print(f"⚠️  Behavioral features unavailable for packed alerts, analyzing them one by one: {e}")
+                return list(await asyncio.gather(*[self._run_unpacked(stage, item) for item in items]))
+        else:
+            prompt = await self._build_packed_stage3_prompt(items)
+        
+        response = await self.llm_provider.call_with_fallback(prompt, stage)
+        # One packed call answers every alert, so its cost is averaged over them
+        self._observe_stage_cost(stage, prompt, response, len(items))
+        parsed = parse_packed_response(stage, response, len(items))
+        
+        async def finish(item: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+            if result is None:
+                self.packer.record_fallback()
+                return await self._run_unpacked(stage, item)
+            if stage == "stage3":
+                return await self._finish_stage3(item["input"], item["stage2"], result)
+            return self._render_html(stage, item["input"], result, genuine_alerts)
+        
+        return list(await asyncio.gather(*[finish(item, result) for item, result in zip(items, parsed)]))
+    
+    async def _run_unpacked(self, stage: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        if stage == "stage1":
+            return await self._stage1_llm(item["input"], await self._genuine_alerts_for(item["input"].get("user_id")))
+        if stage == "stage2":
+            return await self._stage2_llm(item["input"])
+        return await self._stage3_llm(item["input"], item["stage2"])
+    
+    def _packed_alert_table(self, items: List[Dict[str, Any]]) -> str:
+        rows = [{"alert": i, **{field: item["input"].get(field) for field in ("timestamp", "merchant", "amount", "transaction_type")}}
+                for i, item in enumerate(items, 1)]
+        return serializer_for(self.prompt_version).records(rows, dictionary=("merchant",))
+    
+    def _render_packed_stage1_prompt(self, items: List[Dict[str, Any]], genuine_alerts: List[Dict[str, Any]]) -> str:
+        """Stage 1 prompt for several alerts of one user; the genuine alerts are listed once"""
+        days_back = 30
+        return f"""You are a financial fraud analysis AI assistant specializing in identifying genuine transaction patterns.
+Analyze each of the following {len(items)} CURRENT TRANSACTION ALERTS for the same user independently:
+{self._packed_alert_table(items)}
 
-{{
-  "keyFindings": ["finding1", "finding2", ...],
-  "riskFactors": ["factor1", "factor2", ...],
-  "recommendations": ["rec1", "rec2", ...],
-  "riskRating": 1-10,
-  "htmlContent": "HTML Preview of final result"
-}}"""
+Compare each alert against the following RECENTLY CONFIRMED GENUINE ALERTS (last {days_back} days) for this user/segment:
+{serializer_for(self.prompt_version).records(genuine_alerts, dictionary=("merchant",))}
 
-        response = await self.llm_provider.call_with_fallback(prompt, "stage3")
-        return self._parse_json_response(response)
+Apply the task below to each CURRENT TRANSACTION ALERT separately.
+{STAGE1_TASK.format(days_back=days_back)}
+{packed_output(STAGE1_STRUCTURED_OUTPUT)}"""
+    
+    async def _build_packed_stage2_prompt(self, items: List[Dict[str, Any]]) -> str:
+        """Stage 2 prompt for several alerts of one user; shared history or features are sent once"""
+        user_id = items[0]["input"].get("user_id")
+        header = f"""You are an AI assistant specializing in detecting behavioral anomalies in financial transactions.
+Analyze each of the following {len(items)} CURRENT TRANSACTION ALERTS for the same user independently:
+{self._packed_alert_table(items)}"""
+        
+        if self.feature_store is not None:
+            await self._ensure_user_loaded(user_id)
+            features = [self.feature_store.features_for(item["input"]) for item in items]
+        else:
+            history = await self._get_transaction_history(user_id)
+            features = [self.feature_extractor.extract(item["input"], history) for item in items]
+        shared, varying = split_shared_features(features)
+        return f"""{header}
+
+Compare each alert against the USER'S BEHAVIORAL FEATURES computed from the past 3 months of transactions (exact values, use them as given).
+Amounts: *_mean/*_std/*_z are the mean, standard deviation and z-score of the alert amount against all history (user_) or history with the same MCC (mcc_).
+Time: hours and days of week are UTC (0=Monday); *_deviation is the circular distance from the usual value, *_concentration is 0 (spread out) to 1 (always the same).
+Velocity: txns_today includes the alert; velocity_ratio is txns_today / avg_txns_per_day.
+Same for every alert:
+{self.feature_extractor.format_table(shared)}
+Per alert (one column per alert number):
+{format_feature_matrix(features, varying)}
+
+Apply the checks below to each CURRENT TRANSACTION ALERT separately.
+{STAGE2_CHECKS}
+
+{packed_output(STAGE2_STRUCTURED_OUTPUT)}"""
+    
+    async def _build_packed_stage3_prompt(self, items: List[Dict[str, Any]]) -> str:
+        """Stage 3 prompt for several alerts of one user; profile and SOP checklist are sent once
+        
+        v1.5 prompts state each alert's SOP rule checks; earlier versions list
+        the raw risk intelligence once for the pack.
+        """
+        user_profile = await self._user_profile_for(items[0]["input"].get("user_id"))
+        reference = await self.reference_data.get()
+        facts = await self._sop_facts([item["input"] for item in items]) if self._prompt_at_least("v1.5") else None
+        alerts = []
+        for i, item in enumerate(items, 1):
+            input_data, stage2_result = item["input"], item["stage2"]
+            alert = f"""ALERT {i}:
+- Merchant: {input_data.get('merchant')}
+- Transaction Amount: {input_data.get('amount')}
+- Transaction Type: {input_data.get('transaction_type')}
+- Timestamp: {input_data.get('timestamp')}
+BEHAVIORAL ANOMALY ASSESSMENT (from previous analysis step - Rule 2):
+- Anomaly Rating: {stage2_result.get('anomalyRating')}
+- Key Anomalous Observations: {stage2_result.get('keyAnomalousObservations')}
+- Behavioral Summary: {stage2_result.get('behavioralSummary')}"""
+            if facts is not None:
+                alert += "\n" + self._render_sop_facts(facts[i - 1])
+            alerts.append(alert)
+        alerts_section = "\n\n".join(alerts)
+        shared_risk = "" if facts is not None else "\n\n" + self._render_risk_intelligence(reference.risk_intelligence)
+        
+        return f"""You are a financial fraud analysis AI assistant. Analyze each of the following {len(items)} alerts for the same user and provide a structured risk assessment for each.
+Consider each alert's preceding Behavioral Anomaly Assessment.
+
+{alerts_section}
+
+USER PROFILE & HISTORY:
+- Credit Limit: {user_profile.get('credit_limit')}
+- Outstanding Balance: {user_profile.get('outstanding_balance')}
+- User Status: {user_profile.get('user_status')}{shared_risk}
+
+STANDARD OPERATING PROCEDURE (SOP) - CHECKLIST FOR ANALYSIS (Rules 3, 4, 5):
+Please perform the following checks for each alert and use your findings, along with its behavioral anomaly assessment, to inform your assessment:
+{serializer_for(self.prompt_version).items(reference.sop_checklist)}
+
+TASK:
+1. Analyze each alert and its associated data based *strictly* on the SOP checklist provided above, considering its prior behavioral anomaly assessment.
+2. Determine each alert's risk level on a scale of 1-10 (1=Very Low, 10=Very High).
+3. Provide your analysis in a structured format.
+
+{packed_output(STAGE3_STRUCTURED_OUTPUT)}"""
+    
+    def _observe_stage_cost(self, stage: str, prompt: str, response: str, alerts: int = 1):
+        """Feed the policy's per-stage token averages used to estimate what skips save"""
+        if self.short_circuit is not None:
+            self.short_circuit.observe(stage, prompt, response, alerts)
+    
+    def _render_html(self, stage: str, input_data: Dict[str, Any], result: Dict[str, Any],
+                     genuine_alerts: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Fill htmlContent from the structured fields when the prompt version does not ask the LLM for it"""
+        if not self._prompt_at_least("v1.4") or "error" in result:
+            return result
+        
+        if result.get("skipped"):
+            result["htmlContent"] = render_skipped_html(result)
+        elif stage == "stage1":
+            try:
+                genuine, matched = genuine_alert_matcher.best_match(input_data, genuine_alerts or [])
+            except (TypeError, ValueError):
+                genuine, matched = None, None
+            result["htmlContent"] = render_stage1_html(input_data, result.get("classification"), genuine, matched)
+        elif stage == "stage2":
+            result["htmlContent"] = render_stage2_html(result)
+        else:
+            result["htmlContent"] = render_stage3_html(result)
+        return result
+    
+    def _fit_prompt(self, render, input_data: Dict[str, Any], **sections: List[Dict[str, Any]]) -> str:
+        """Render a stage prompt, dropping the oldest data rows if it would overflow the model context"""
+        budget = self.config.get("prompt_token_budget") or self.llm_provider.get_prompt_budget()
+        prompt, trimmed = self.prompt_guard.fit(
+            lambda **rows: render(input_data, **rows),
+            sections,
+            budget
+        )
+        if trimmed:
+            print(f"⚠️  TAMS prompt trimmed to fit {budget} tokens: {trimmed} rows dropped")
+        return prompt
+    
+    def _build_final_result(self, stage1: Dict[str, Any], stage2: Dict[str, Any], stage3: Dict[str, Any]) -> Dict[str, Any]:
+        """Combine stage results into the TAMS response"""
+        return {
+            "status": "completed",
+            "analysis": {
+                "stage1_genuine_correlation": stage1,
+                "stage2_behavioral_analysis": stage2,
+                "stage3_risk_assessment": stage3
+            },
+            "final_recommendation": self._generate_final_recommendation(stage1, stage2, stage3),
+            "version": self.version,
+            "prompt_version": self.prompt_version,
+            "skipped_stages": {
+                stage: result["skippedBy"]
+                for stage, result in (("stage1", stage1), ("stage2", stage2), ("stage3", stage3))
+                if result.get("skipped")
+            }
+        }
     
     def _generate_final_recommendation(self, stage1: Dict[str, Any], stage2: Dict[str, Any], stage3: Dict[str, Any]) -> Dict[str, Any]:
         """Generate final recommendation based on all three stages"""
@@ -279,6 +892,30 @@ Format your response as a JSON object with these fields:
                 "Update customer behavior patterns"
             ]
     
+    async def _ensure_user_loaded(self, user_id: str):
+        """Load a user into the feature store from the data sources on first use"""
+        if not await self.feature_store.has_user(user_id):
+            await self.feature_store.load(
+                user_id,
+                await self._get_transaction_history(user_id),
+                await self._get_genuine_alerts(user_id),
+                await self._get_user_profile(user_id)
+            )
+    
+    async def _genuine_alerts_for(self, user_id: str) -> List[Dict[str, Any]]:
+        """Recent genuine alerts, from the feature store when enabled"""
+        if self.feature_store is None:
+            return await self._get_genuine_alerts(user_id)
+        await self._ensure_user_loaded(user_id)
+        return self.feature_store.genuine_alerts(user_id)
+    
+    async def _user_profile_for(self, user_id: str) -> Dict[str, Any]:
+        """User profile, from the feature store when enabled"""
+        if self.feature_store is None:
+            return await self._get_user_profile(user_id)
+        await self._ensure_user_loaded(user_id)
+        return self.feature_store.profile(user_id)
+    
     async def _get_genuine_alerts(self, user_id: str) -> List[Dict[str, Any]]:
         """Get recent genuine alerts for the user (filtered for 24+ hours old)"""
         # Mock data - in production, this would query the database
@@ -332,6 +969,13 @@ Format your response as a JSON object with these fields:
             "average_monthly_spend": 800.00
         }
     
+    async def _load_reference_data(self) -> ReferenceData:
+        """Load and compile the Stage 3 reference tables (used by the reference data cache)"""
+        risk_intelligence, sop_checklist = await asyncio.gather(
+            self._get_risk_intelligence_data(), self._get_sop_checklist()
+        )
+        return ReferenceData(risk_intelligence, sop_checklist)
+    
     async def _get_risk_intelligence_data(self) -> Dict[str, Any]:
         """Get risk intelligence data"""
         # Mock data - in production, this would query risk databases
@@ -362,21 +1006,39 @@ Format your response as a JSON object with these fields:
 
     
     def _parse_json_response(self, response_text: str) -> Dict[str, Any]:
-        """Parse JSON response from LLM"""
-        try:
-            # Clean up response text
-            response_text = response_text.strip()
-            if response_text.startswith('```json'):
-                response_text = response_text[7:]
-            if response_text.endswith('```'):
-                response_text = response_text[:-3]
-            
-            return json.loads(response_text)
-        except json.JSONDecodeError as e:
+        """Parse the first JSON object in an LLM response, repairing common defects"""
+        data, status = self.output_parser.extract(response_text)
+        if data is None:
+            reason = "no JSON object found" if status == "missing" else "JSON object could not be repaired"
             return {
-                "error": f"Failed to parse JSON response: {str(e)}",
+                "error": f"Failed to parse JSON response: {reason}",
                 "raw_response": response_text
             }
+        return data
+    
+    async def _parse_stage_response(self, stage: str, response_text: str) -> Dict[str, Any]:
+        """Parse and validate a stage response, re-generating just the JSON if it is unusable"""
+        data = self._parse_json_response(response_text)
+        problems = [data["error"]] if "error" in data else validate_stage_output(stage, data)
+        if problems and "error" not in data:
+            self.output_parser.stats["schema_invalid"] += 1
+        
+        for _ in range(self.regenerate_attempts):
+            if not problems:
+                break
+            prompt = build_regeneration_prompt(stage, response_text, problems)
+            response_text = await self.llm_provider.call_with_fallback(prompt, stage)
+            data = self._parse_json_response(response_text)
+            if data.get("fallback"):
+                # The LLM was unavailable: the canned response is no repair, but it stands in like any outage
+                self.output_parser.stats["regeneration_failed"] += 1
+                return data
+            problems = [data["error"]] if "error" in data else validate_stage_output(stage, data)
+            self.output_parser.stats["regenerated" if not problems else "regeneration_failed"] += 1
+        
+        if problems:
+            return {"error": f"Invalid {stage} response: {'; '.join(problems)}", "raw_response": response_text}
+        return data
     
     def validate_input(self, input_data: Dict[str, Any]) -> bool:
         """Validate input data for TAMS analysis"""
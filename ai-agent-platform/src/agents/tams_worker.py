@@ -0,0 +1,89 @@
+from .tams_agent import TAMSAgent, create_tams_agent
+from ..core.alert_queue import AlertQueue, QueueMessage
+import asyncio
+import os
+import socket
+import time
+
+class TAMSWorkerPool:
+    """Async worker pool that consumes alerts from a queue and runs TAMS analysis
+
+    Each worker leases one alert at a time, runs TAMSAgent.execute and writes
+    the outcome to the results stream before acking. Failed analyses are
+    retried with exponential backoff up to max_attempts, then dead-lettered;
+    alerts that fail validation are dead-lettered straight away. Scale out by
+    starting more processes on the same queue (consumer group).
+    """
+
+    def __init__(self, queue: AlertQueue, agent: TAMSAgent = None, concurrency: int = None,
+                 max_attempts: int = None, retry_backoff: float = None, consumer_name: str = None):
+        self.queue = queue
+        self.agent = agent or create_tams_agent()
+        self.concurrency = concurrency or int(os.getenv("TAMS_WORKER_CONCURRENCY", "8"))
+        self.max_attempts = max_attempts or int(os.getenv("TAMS_WORKER_MAX_ATTEMPTS", "3"))
+        self.retry_backoff = retry_backoff if retry_backoff is not None else float(os.getenv("TAMS_WORKER_RETRY_BACKOFF_SECONDS", "2"))
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        self.stats = {"processed": 0, "completed": 0, "retried": 0, "dead_lettered": 0}
+        self._stopping = asyncio.Event()
+
+    async def run(self):
+        """Run workers until stop() is called; in-flight alerts are finished first"""
+        workers = [
+            asyncio.ensure_future(self._worker(f"{self.consumer_name}-{i}"))
+            for i in range(self.concurrency)
+        ]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def _worker(self, consumer: str):
+        while not self._stopping.is_set():
+            try:
+                messages = await self.queue.read(consumer, count=1, block_ms=1000)
+            except Exception as e:
+                print(f"⚠️  TAMS worker {consumer} could not read from queue: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            for message in messages:
+                await self.process(message)
+
+    async def process(self, message: QueueMessage):
+        """Analyze one alert and ack, retry or dead-letter it"""
+        self.stats["processed"] += 1
+        alert = message.payload
+
+        if not isinstance(alert, dict) or not self.agent.validate_input(alert):
+            self.stats["dead_lettered"] += 1
+            await self.queue.dead_letter(message, "Invalid alert: missing required fields")
+            return
+
+        started = time.monotonic()
+        try:
+            result = await self.agent.execute(alert)
+            error = result.get("error") if result.get("status") == "failed" else None
+        except Exception as e:
+            result, error = None, f"TAMS analysis failed: {str(e)}"
+
+        if error is None:
+            await self.queue.publish_result({
+                "message_id": message.id,
+                "alert_id": alert.get("alert_id"),
+                "user_id": alert.get("user_id"),
+                "attempts": message.attempts + 1,
+                "execution_time_ms": (time.monotonic() - started) * 1000,
+                "result": result
+            })
+            await self.queue.ack(message)
+            self.stats["completed"] += 1
+        elif message.attempts + 1 < self.max_attempts:
+            self.stats["retried"] += 1
+            await self.queue.retry(message, error, delay=self.retry_backoff * (2 ** message.attempts))
+        else:
+            self.stats["dead_lettered"] += 1
+            await self.queue.dead_letter(message, error)
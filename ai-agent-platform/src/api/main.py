@@ -4,6 +4,7 @@ from fastapi.security import HTTPBearer
 import os
 
 from ..core.database import engine, Base
+from ..core.llm_client import llm_provider
 from ..tools import registry  # Initialize tools
 from .routers import agents, executions, tools, workflows, health, flowise, rag, evaluation, crews, tams
 
@@ -42,6 +43,26 @@ app.include_router(evaluation.router, prefix="/api/v1/evaluation", tags=["evalua
 app.include_router(crews.router, prefix="/api/v1/crews", tags=["crews"])
 app.include_router(tams.router, prefix="/api/v1/tams", tags=["tams"])
 
+@app.on_event("startup")
+async def warm_up_llm_connections():
+    """Pre-open pooled LLM connections so the first alert skips the handshake"""
+    if os.getenv("LLM_POOL_WARMUP", "true").lower() == "true":
+        await llm_provider.client.warm_up()
+
+@app.on_event("startup")
+async def load_tams_reference_data():
+    """Compile TAMS reference tables and keep them refreshed in the background"""
+    try:
+        await tams.tams_agent.reference_data.start()
+    except Exception as e:
+        print(f"⚠️  TAMS reference data not loaded at startup, will load on first alert: {e}")
+
+@app.on_event("shutdown")
+async def close_llm_connections():
+    """Close pooled LLM connections"""
+    await llm_provider.client.close()
+    await tams.tams_agent.reference_data.stop()
+
 @app.get("/")
 async def root():
     return {"message": "AI Agent Platform API", "version": "0.1.0"}
\ No newline at end of file
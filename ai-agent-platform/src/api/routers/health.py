@@ -1,6 +1,17 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from ...core.database import get_db
+from ...core.llm_pool import llm_session_pool
+from ...core.llm_cache import llm_response_cache
+from ...core.llm_singleflight import llm_single_flight
+from ...core.llm_limits import llm_rate_limiter
+from ...core.llm_routing import llm_router
+from ...core.llm_client import llm_provider
+from ...core.tokens import token_accountant, prompt_size_guard
+from ...core.genuine_matcher import genuine_alert_matcher
+from ...core.feature_store import user_feature_store
+from ...core.json_extract import stage_output_parser
+from .tams import tams_agent
 import redis
 import os
 
@@ -25,4 +36,27 @@ async def redis_health():
         r.ping()
         return {"status": "healthy", "component": "redis"}
     except Exception as e:
-        return {"status": "unhealthy", "component": "redis", "error": str(e)}
\ No newline at end of file
+        return {"status": "unhealthy", "component": "redis", "error": str(e)}
+
+@router.get("/llm")
+async def llm_health():
+    return {
+        "status": "healthy",
+        "component": "llm",
+        "connection_pool": llm_session_pool.get_stats(),
+        "response_cache": llm_response_cache.get_stats(),
+        "single_flight": llm_single_flight.get_stats(),
+        "rate_limits": llm_rate_limiter.get_stats(),
+        "providers": llm_router.get_stats(),
+        "hedging": llm_provider.client.hedge_stats,
+        "tokens": token_accountant.get_stats(),
+        "prompt_guard": prompt_size_guard.stats,
+        "stage1_prematch": genuine_alert_matcher.get_stats(),
+        "feature_store": user_feature_store.get_stats(),
+        "reference_data": tams_agent.reference_data.get_stats(),
+        "stage_output": stage_output_parser.get_stats(),
+        "short_circuit": tams_agent.short_circuit.get_stats() if tams_agent.short_circuit else None,
+        "alert_cache": tams_agent.alert_cache.get_stats() if tams_agent.alert_cache else None,
+        "packing": tams_agent.packer.get_stats() if tams_agent.packer else None,
+        "sop_rules": tams_agent.sop_rules.get_stats()
+    }
\ No newline at end of file
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File
 from typing import Dict, Any, List, Optional
 from ...core.rag import rag_manager
+from ...core.tokens import token_counter
 from langchain.schema import Document
 
 router = APIRouter()
@@ -78,7 +79,7 @@ async def get_context(
         return {
             "query": query,
             "context": context,
-            "token_estimate": len(context) // 4
+            "token_estimate": token_counter.count(context)
         }
     
     except Exception as e:
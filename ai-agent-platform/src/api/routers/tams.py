@@ -1,6 +1,10 @@
-from fastapi import APIRouter, HTTPException
-from typing import Dict, Any
+from fastapi import APIRouter, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, Optional
+import json
+import os
 from ...agents.tams_agent import create_tams_agent
+from ...core.feature_store import user_feature_store
 from pydantic import BaseModel
 from datetime import datetime
 
@@ -13,13 +17,28 @@ class TAMSAnalysisRequest(BaseModel):
     transaction_type: str
     user_id: str
     alert_id: str = None
+    mcc: Optional[str] = None
+    merchant_country: Optional[str] = None
+    currency: Optional[str] = None
 
 class TAMSAnalysisResponse(BaseModel):
     status: str
     analysis: Dict[str, Any]
     final_recommendation: Dict[str, Any]
     version: str
+    prompt_version: str = None
     execution_time_ms: float = None
+    stage_timings_ms: Dict[str, float] = None
+    skipped_stages: Dict[str, str] = None
+    idempotency: Dict[str, Any] = None
+
+class TAMSTransaction(BaseModel):
+    user_id: str
+    timestamp: str
+    merchant: str
+    amount: float
+    transaction_type: str
+    mcc: Optional[str] = None
 
 # Global TAMS agent instance
 tams_agent = create_tams_agent()
@@ -45,6 +64,106 @@ async def analyze_transaction_alert(request: TAMSAnalysisRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"TAMS analysis failed: {str(e)}")
 
+@router.post("/analyze/stream")
+async def analyze_transaction_alert_stream(request: TAMSAnalysisRequest):
+    """Analyze a transaction alert, streaming stage results as server-sent events"""
+    input_data = request.dict()
+    
+    async def event_stream():
+        start_time = datetime.now()
+        async for event in tams_agent.execute_stream(input_data):
+            if event["event"] == "completed":
+                event["result"]["execution_time_ms"] = (datetime.now() - start_time).total_seconds() * 1000
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _read_alerts(request: Request):
+    """Yield alerts from a JSON array body or, incrementally, from an NDJSON upload
+    
+    Lines that are not valid JSON are passed on as None so they get an error
+    result at their position instead of failing the batch.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" not in content_type and "jsonlines" not in content_type:
+        try:
+            alerts = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of alerts or NDJSON")
+        if not isinstance(alerts, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of alerts or NDJSON")
+        for alert in alerts:
+            yield alert
+        return
+    
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_ndjson_line(line)
+    if buffer.strip():
+        yield _parse_ndjson_line(buffer)
+
+def _parse_ndjson_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+@router.post("/analyze/batch")
+async def analyze_transaction_alert_batch(
+    request: Request,
+    concurrency: int = Query(None, ge=1, le=256),
+    cursor: int = Query(0, ge=0)
+):
+    """Analyze many alerts, streaming one NDJSON result line per alert as each completes
+    
+    Accepts a JSON array or an NDJSON upload (Content-Type: application/x-ndjson).
+    Result lines carry index, alert_id, status and result or error, plus the
+    resumable cursor; a final summary line closes the stream.
+    """
+    concurrency = concurrency or int(os.getenv("TAMS_BATCH_CONCURRENCY", "8"))
+    alerts = _read_alerts(request)
+    
+    # Fail fast on an unreadable body before the 200 response starts
+    try:
+        first = [await alerts.__anext__()]
+    except StopAsyncIteration:
+        first = []
+    
+    async def replay():
+        for alert in first:
+            yield alert
+        async for alert in alerts:
+            yield alert
+    
+    async def result_stream():
+        start_time = datetime.now()
+        counts = {"completed": 0, "error": 0}
+        last_cursor = cursor
+        async for line in tams_agent.execute_batch(replay(), concurrency=concurrency, start=cursor):
+            counts[line["status"]] += 1
+            last_cursor = line["cursor"]
+            yield json.dumps({"type": "result", **line}) + "\n"
+        yield json.dumps({
+            "type": "summary",
+            **counts,
+            "cursor": last_cursor,
+            "execution_time_ms": (datetime.now() - start_time).total_seconds() * 1000
+        }) + "\n"
+    
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/agent/status")
 async def get_tams_agent_status():
     """Get TAMS agent status and information"""
@@ -54,7 +173,7 @@ async def get_tams_agent_status():
         "status": tams_agent.status.value,
         "version": tams_agent.version,
         "created_at": tams_agent.created_at.isoformat(),
-        "execution_count": len(tams_agent.execution_history)
+        "execution_count": tams_agent.execution_history.total
     }
 
 @router.get("/agent/history")
@@ -62,8 +181,8 @@ async def get_tams_execution_history():
     """Get TAMS agent execution history"""
     return {
         "agent_name": tams_agent.name,
-        "execution_history": tams_agent.execution_history[-10:],  # Last 10 executions
-        "total_executions": len(tams_agent.execution_history)
+        "execution_history": tams_agent.execution_history.recent(10),  # Last 10 executions
+        "total_executions": tams_agent.execution_history.total
     }
 
 @router.post("/test")
@@ -88,6 +207,20 @@ async def test_tams_analysis():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"TAMS test failed: {str(e)}")
 
+@router.post("/features/transactions")
+async def ingest_transaction(transaction: TAMSTransaction):
+    """Fold a new transaction into the user's rolling features"""
+    await user_feature_store.ingest_transaction(transaction.user_id, transaction.dict(exclude={"user_id"}))
+    return {"status": "ingested", "user_id": transaction.user_id}
+
+@router.post("/features/genuine-alerts")
+async def ingest_genuine_alert(alert: TAMSTransaction):
+    """Record an alert confirmed as genuine for Stage 1 correlation"""
+    await user_feature_store.ingest_genuine_alert(alert.user_id, {**alert.dict(exclude={"user_id"}), "status": "genuine"})
+    # Stored analyses for this user were made without the new confirmation
+    invalidated = tams_agent.invalidate_cached_results(alert.user_id)
+    return {"status": "ingested", "user_id": alert.user_id, "invalidated_results": invalidated}
+
 @router.get("/health")
 async def tams_health():
     """Check TAMS system health"""
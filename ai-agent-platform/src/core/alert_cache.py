@@ -0,0 +1,232 @@
+"""
+Alert Result Cache - Idempotent TAMS analysis keyed by alert_id and feature fingerprint
+"""
+
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable, Awaitable, Tuple
+
+from .genuine_matcher import parse_timestamp, normalize_merchant
+
+def alert_fingerprint(input_data: Dict[str, Any], prompt_version: str = "") -> str:
+    """Hash of the normalized alert features that determine the analysis
+
+    The alert_id is left out so a re-submission under a new id still
+    matches; merchant case/whitespace, amount formatting and timestamp
+    offsets are normalized.
+    """
+    try:
+        timestamp = parse_timestamp(input_data.get("timestamp"))
+    except (TypeError, ValueError):
+        timestamp = str(input_data.get("timestamp"))
+    try:
+        amount = round(float(input_data.get("amount")), 2)
+    except (TypeError, ValueError):
+        amount = str(input_data.get("amount"))
+    features = [
+        prompt_version,
+        str(input_data.get("user_id")),
+        timestamp,
+        normalize_merchant(input_data.get("merchant")),
+        amount,
+        str(input_data.get("transaction_type") or "").strip().lower(),
+        str(input_data.get("mcc") or "").strip(),
+        str(input_data.get("merchant_country") or "").strip().upper(),
+        str(input_data.get("currency") or "").strip().upper()
+    ]
+    return hashlib.sha256(json.dumps(features).encode()).hexdigest()
+
+# Stage result flags marking an answer that did not come from a healthy LLM call
+DEGRADED_STAGE_FLAGS = ("fallback", "rulesOnly", "error")
+
+def is_degraded(result: Dict[str, Any]) -> bool:
+    """Whether any stage of an analysis is a canned fallback, rules-only or failed answer"""
+    return any(isinstance(stage, dict) and any(stage.get(flag) for flag in DEGRADED_STAGE_FLAGS)
+               for stage in (result.get("analysis") or {}).values())
+
+class _Entry:
+    """A stored result and the keys and user it is filed under"""
+
+    def __init__(self, user_id: str, fingerprint: str, result: Dict[str, Any], expires_at: float):
+        self.user_id = user_id
+        self.fingerprint = fingerprint
+        self.result = result
+        self.stored_at = time.time()
+        self.expires_at = expires_at
+
+class AlertResultCache:
+    """Returns the stored or in-progress analysis for a re-submitted alert
+
+    An alert matches by alert_id (kept for ttl_seconds, as long as its
+    features are unchanged) or by feature fingerprint (kept for
+    fingerprint_window_seconds). Concurrent submissions of the same alert
+    share one analysis. Only completed analyses whose every stage came
+    from the LLM are stored, so an outage is not replayed after recovery.
+    invalidate_user() drops a user's entries, e.g. when a new genuine
+    confirmation changes what Stage 1 would conclude; analyses already
+    running for that user finish but are not stored.
+    """
+
+    def __init__(self, ttl_seconds: float = None, fingerprint_window_seconds: float = None, max_entries: int = None):
+        self.ttl_seconds = ttl_seconds or float(os.getenv("TAMS_ALERT_CACHE_TTL_SECONDS", "3600"))
+        self.fingerprint_window_seconds = (fingerprint_window_seconds
+                                           or float(os.getenv("TAMS_ALERT_FINGERPRINT_WINDOW_SECONDS", "900")))
+        self.max_entries = max_entries or int(os.getenv("TAMS_ALERT_CACHE_MAX_ENTRIES", "10000"))
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._in_flight: Dict[str, Tuple[asyncio.Task, str, str]] = {}
+        self._user_keys: Dict[str, set] = {}
+        self._generations: Dict[str, int] = {}
+        self.stats = {"alert_id_hits": 0, "fingerprint_hits": 0, "joined": 0, "misses": 0, "stored": 0,
+                      "expirations": 0, "evictions": 0, "invalidated": 0, "degraded_not_stored": 0}
+
+    def _keys(self, input_data: Dict[str, Any], prompt_version: str) -> Tuple[Optional[str], str]:
+        alert_id = input_data.get("alert_id")
+        return (f"id:{alert_id}" if alert_id else None,
+                f"fp:{alert_fingerprint(input_data, prompt_version)}")
+
+    def lookup(self, input_data: Dict[str, Any], prompt_version: str = "") -> Optional[Dict[str, Any]]:
+        """Copy of the stored result for this alert marked with how it matched, or None"""
+        id_key, fp_key = self._keys(input_data, prompt_version)
+        for key, matched_by in ((id_key, "alert_id"), (fp_key, "fingerprint")):
+            entry = self._get(key) if key else None
+            if entry is None:
+                continue
+            if matched_by == "alert_id" and entry.fingerprint != fp_key:
+                # Same alert_id re-sent with different features: analyze it again
+                continue
+            self.stats[f"{matched_by}_hits"] += 1
+            return self._marked(entry.result, matched_by, time.time() - entry.stored_at)
+        return None
+
+    async def get_or_run(self, input_data: Dict[str, Any], run: Callable[[], Awaitable[Dict[str, Any]]],
+                         prompt_version: str = "") -> Dict[str, Any]:
+        """Stored result, the running analysis of the same alert, or a new analysis via run()"""
+        cached = self.lookup(input_data, prompt_version)
+        if cached is not None:
+            return cached
+
+        id_key, fp_key = self._keys(input_data, prompt_version)
+        for key in (id_key, fp_key):
+            flight = self._in_flight.get(key) if key else None
+            if flight is None or flight[0].done():
+                continue
+            # Like lookup(), an alert_id re-sent with different features is analyzed again
+            if flight[2] == fp_key:
+                self.stats["joined"] += 1
+                return self._marked(await asyncio.shield(flight[0]), "in_progress", 0.0)
+
+        self.stats["misses"] += 1
+        user_id = str(input_data.get("user_id"))
+        generation = self.generation(user_id)
+
+        async def analyze() -> Dict[str, Any]:
+            result = await run()
+            self.store(input_data, result, prompt_version, generation)
+            return result
+
+        # The analysis runs as its own task so callers that join it survive the first caller going away
+        task = asyncio.ensure_future(analyze())
+        keys = [key for key in (id_key, fp_key) if key]
+        for key in keys:
+            self._in_flight[key] = (task, user_id, fp_key)
+        task.add_done_callback(lambda done: self._land(keys, done))
+        return await asyncio.shield(task)
+
+    def _land(self, keys, task: asyncio.Task):
+        """Stop routing callers to a finished analysis and mark its error as retrieved"""
+        for key in keys:
+            if self._in_flight.get(key, (None,))[0] is task:
+                del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()
+
+    def generation(self, user_id: str) -> int:
+        """Invalidation counter for a user; pass it to store() for an analysis started now"""
+        return self._generations.get(str(user_id), 0)
+
+    def store(self, input_data: Dict[str, Any], result: Dict[str, Any], prompt_version: str = "",
+              generation: int = None):
+        """File a completed result under the alert's id and fingerprint
+
+        Nothing is stored for failed or degraded analyses, or when the user
+        was invalidated after `generation` was taken.
+        """
+        user_id = str(input_data.get("user_id"))
+        if result.get("status") != "completed" or (generation is not None and generation != self.generation(user_id)):
+            return
+        if is_degraded(result):
+            self.stats["degraded_not_stored"] += 1
+            return
+        id_key, fp_key = self._keys(input_data, prompt_version)
+        snapshot = copy.deepcopy(result)
+        now = time.time()
+        for key, ttl in ((id_key, self.ttl_seconds), (fp_key, self.fingerprint_window_seconds)):
+            if key is None:
+                continue
+            self._entries[key] = _Entry(user_id, fp_key, snapshot, now + ttl)
+            self._entries.move_to_end(key)
+            self._user_keys.setdefault(user_id, set()).add(key)
+        self.stats["stored"] += 1
+        while len(self._entries) > self.max_entries:
+            key, entry = self._entries.popitem(last=False)
+            self._forget_user_key(entry.user_id, key)
+            self.stats["evictions"] += 1
+
+    def invalidate_user(self, user_id: str) -> int:
+        """Drop every stored result for a user and keep running analyses from being stored"""
+        user_id = str(user_id)
+        self._generations[user_id] = self.generation(user_id) + 1
+        keys = self._user_keys.pop(user_id, set())
+        for key in keys:
+            self._entries.pop(key, None)
+        # New submissions start a fresh analysis instead of joining a stale one
+        for key in [key for key, (_, owner, _) in self._in_flight.items() if owner == user_id]:
+            del self._in_flight[key]
+        self.stats["invalidated"] += len(keys)
+        return len(keys)
+
+    def clear(self):
+        self._entries.clear()
+        self._user_keys.clear()
+
+    def _get(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.time():
+            del self._entries[key]
+            self._forget_user_key(entry.user_id, key)
+            self.stats["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _forget_user_key(self, user_id: str, key: str):
+        keys = self._user_keys.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[user_id]
+
+    @staticmethod
+    def _marked(result: Dict[str, Any], matched_by: str, age_seconds: float) -> Dict[str, Any]:
+        """Private copy of a shared result carrying how it was reused"""
+        result = copy.deepcopy(result)
+        result["idempotency"] = {"reused": True, "matched_by": matched_by, "age_seconds": round(age_seconds, 3)}
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        hits = self.stats["alert_id_hits"] + self.stats["fingerprint_hits"] + self.stats["joined"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "in_flight": len({id(task) for task, _ in self._in_flight.values()}),
+            "hit_ratio": hits / lookups if lookups else 0.0
+        }
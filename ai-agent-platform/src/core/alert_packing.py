@@ -0,0 +1,144 @@
+"""
+Alert Packing - One LLM call per stage for a burst of alerts from the same user
+"""
+
+import asyncio
+import os
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+
+from .json_extract import extract_json_object, validate_stage_output
+
+def packed_output(single_output: str) -> str:
+    """Response instructions for a packed prompt, wrapping a stage's per-alert JSON format"""
+    return (
+        'Respond with ONE JSON object of the form {"alerts": [...]} holding one entry per alert, in alert order.\n'
+        'Each entry is the per-alert result described below plus "alert": the alert number.\n'
+        "Per-alert result:\n"
+        + single_output
+    )
+
+def parse_packed_response(stage: str, text: str, count: int) -> List[Optional[Dict[str, Any]]]:
+    """Per-alert results from a packed response; None for alerts missing or invalid in it
+
+    Entries are matched by their "alert" number (1-based). An entry without
+    a usable number is matched by position only when the reply has exactly
+    one entry per alert; otherwise its alert stays None and is re-run alone
+    rather than risk taking another alert's verdict.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * count
+    data, _ = extract_json_object(text or "")
+    entries = data.get("alerts") if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        return results
+
+    positional = len(entries) == count
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            continue
+        entry = dict(entry)
+        try:
+            index = int(entry.pop("alert")) - 1
+        except (KeyError, TypeError, ValueError):
+            if not positional:
+                continue
+            index = position
+        if 0 <= index < count and results[index] is None and not validate_stage_output(stage, entry):
+            results[index] = entry
+    return results
+
+def split_shared_features(features: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[str]]:
+    """Features with the same value for every alert, and the names of those that differ"""
+    shared, varying = {}, []
+    for name in features[0]:
+        values = [f.get(name) for f in features]
+        if all(value == values[0] for value in values) and all(name in f for f in features):
+            shared[name] = values[0]
+        else:
+            varying.append(name)
+    for f in features[1:]:
+        varying.extend(name for name in f if name not in features[0] and name not in varying)
+    return shared, varying
+
+def format_feature_matrix(features: List[Dict[str, Any]], names: List[str]) -> str:
+    """feature | 1 | 2 | ... table with one column per alert; floats rounded to 2 places"""
+    def cell(value) -> str:
+        if value is None:
+            return "n/a"
+        return f"{value:.2f}" if isinstance(value, float) else str(value)
+
+    lines = ["feature | " + " | ".join(str(i) for i in range(1, len(features) + 1))]
+    for name in names:
+        lines.append(f"{name} | " + " | ".join(cell(f.get(name)) for f in features))
+    return "\n".join(lines)
+
+class _Pack:
+    """Alerts waiting to be sent together"""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.futures: List[asyncio.Future] = []
+        self.flushing = False
+
+class AlertPacker:
+    """Groups concurrent stage requests for the same user into one packed call
+
+    The first request for a (stage, user) opens a pack that stays open for
+    window_ms or until max_alerts requests joined it; run_pack(stage, items)
+    then returns one result per item, in order, and each caller gets its
+    own. A pack of one is expected to run the ordinary unpacked prompt.
+    """
+
+    def __init__(self, window_ms: float = None, max_alerts: int = None):
+        self.window_ms = window_ms if window_ms is not None else float(os.getenv("TAMS_PACKING_WINDOW_MS", "50"))
+        self.max_alerts = max_alerts or int(os.getenv("TAMS_PACKING_MAX_ALERTS", "20"))
+        self._packs: Dict[Tuple[str, str], _Pack] = {}
+        self.stats = {"packs": 0, "packed_alerts": 0, "single_alerts": 0, "fallbacks": 0, "llm_calls_saved": 0}
+
+    async def submit(self, stage: str, user_id: str, item: Any,
+                     run_pack: Callable[[str, List[Any]], Awaitable[List[Dict[str, Any]]]]) -> Dict[str, Any]:
+        key = (stage, str(user_id))
+        pack = self._packs.get(key)
+        if pack is None:
+            pack = self._packs[key] = _Pack()
+            asyncio.get_event_loop().call_later(self.window_ms / 1000, self._flush_soon, key, pack, run_pack)
+
+        future = asyncio.get_event_loop().create_future()
+        pack.items.append(item)
+        pack.futures.append(future)
+        if len(pack.items) >= self.max_alerts:
+            self._flush_soon(key, pack, run_pack)
+        return await future
+
+    def _flush_soon(self, key: Tuple[str, str], pack: _Pack, run_pack):
+        if pack.flushing:
+            return
+        pack.flushing = True
+        if self._packs.get(key) is pack:
+            del self._packs[key]
+        asyncio.ensure_future(self._flush(key[0], pack, run_pack))
+
+    async def _flush(self, stage: str, pack: _Pack, run_pack):
+        if len(pack.items) > 1:
+            self.stats["packs"] += 1
+            self.stats["packed_alerts"] += len(pack.items)
+            self.stats["llm_calls_saved"] += len(pack.items) - 1
+        else:
+            self.stats["single_alerts"] += 1
+        try:
+            results = await run_pack(stage, pack.items)
+        except Exception as e:
+            for future in pack.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result in zip(pack.futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    def record_fallback(self):
+        """An alert the packed response did not answer usably was re-run on its own"""
+        self.stats["fallbacks"] += 1
+        self.stats["llm_calls_saved"] -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "open_packs": len(self._packs)}
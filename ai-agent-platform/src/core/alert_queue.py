@@ -0,0 +1,281 @@
+"""
+Alert Queue - Pluggable work queues (Redis Streams, SQLite) for TAMS workers
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List
+
+class QueueMessage:
+    """One delivered alert and how many times it has been attempted before"""
+
+    def __init__(self, id: str, payload: Dict[str, Any], attempts: int = 0):
+        self.id = id
+        self.payload = payload
+        self.attempts = attempts
+
+class AlertQueue(ABC):
+    """Base class for alert queues with consumer-group semantics
+
+    read() leases messages to one consumer; every message must then be
+    ack()ed, retry()ed or dead_letter()ed. Messages leased to a consumer
+    that died are redelivered once they have been idle for the visibility
+    timeout.
+    """
+
+    @abstractmethod
+    async def publish(self, payload: Dict[str, Any]) -> str:
+        """Enqueue an alert and return its message id"""
+        pass
+
+    @abstractmethod
+    async def read(self, consumer: str, count: int = 1, block_ms: int = 1000) -> List[QueueMessage]:
+        """Lease up to count messages to a consumer, waiting up to block_ms"""
+        pass
+
+    @abstractmethod
+    async def ack(self, message: QueueMessage):
+        """Remove a processed message"""
+        pass
+
+    @abstractmethod
+    async def retry(self, message: QueueMessage, error: str, delay: float = 0.0):
+        """Redeliver a message after delay seconds with its attempt count incremented"""
+        pass
+
+    @abstractmethod
+    async def dead_letter(self, message: QueueMessage, error: str):
+        """Move a message that will not be retried to the dead-letter store"""
+        pass
+
+    @abstractmethod
+    async def publish_result(self, result: Dict[str, Any]):
+        """Store an analysis result for consumers of the queue"""
+        pass
+
+    async def close(self):
+        pass
+
+class RedisStreamQueue(AlertQueue):
+    """Redis Streams queue: XREADGROUP consumer group, XAUTOCLAIM for stalled messages
+
+    Retries are re-added to the stream with an incremented attempt count;
+    a retry with a backoff waits in a sorted set scored by its due time and
+    is moved onto the stream by the next read() after it falls due. Dead
+    letters and results go to their own streams.
+    """
+
+    def __init__(self, url: str = None, stream: str = None, group: str = None,
+                 visibility_timeout: float = None, max_results: int = 100000):
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url or os.getenv("REDIS_URL", "redis://localhost:6379"))
+        self.stream = stream or os.getenv("TAMS_QUEUE_STREAM", "tams:alerts")
+        self.group = group or os.getenv("TAMS_QUEUE_GROUP", "tams-workers")
+        self.results_stream = f"{self.stream}:results"
+        self.dead_letter_stream = f"{self.stream}:dead"
+        self.delayed_key = f"{self.stream}:delayed"
+        self.visibility_timeout = visibility_timeout or float(os.getenv("TAMS_QUEUE_VISIBILITY_TIMEOUT_SECONDS", "300"))
+        self.max_results = max_results
+        self._group_ready = False
+
+    async def _ensure_group(self):
+        if self._group_ready:
+            return
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    async def publish(self, payload: Dict[str, Any], attempts: int = 0) -> str:
+        message_id = await self.redis.xadd(self.stream, {"payload": json.dumps(payload), "attempts": attempts})
+        return message_id.decode() if isinstance(message_id, bytes) else message_id
+
+    def _decode(self, message_id, fields) -> QueueMessage:
+        fields = {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+                  for k, v in fields.items()}
+        return QueueMessage(
+            message_id.decode() if isinstance(message_id, bytes) else message_id,
+            json.loads(fields["payload"]),
+            int(fields.get("attempts", 0))
+        )
+
+    async def _promote_delayed(self):
+        """Move retries whose backoff has elapsed back onto the stream"""
+        due = await self.redis.zrangebyscore(self.delayed_key, "-inf", time.time(), start=0, num=100)
+        for member in due:
+            # Only the consumer that removes the entry re-adds it
+            if await self.redis.zrem(self.delayed_key, member):
+                entry = json.loads(member)
+                await self.publish(entry["payload"], attempts=entry["attempts"])
+
+    async def read(self, consumer: str, count: int = 1, block_ms: int = 1000) -> List[QueueMessage]:
+        await self._ensure_group()
+        await self._promote_delayed()
+
+        # Take over messages from consumers that stopped without acking
+        claimed = await self.redis.xautoclaim(
+            self.stream, self.group, consumer, int(self.visibility_timeout * 1000), "0-0", count=count
+        )
+        messages = [self._decode(mid, fields) for mid, fields in claimed[1] if fields]
+        if messages:
+            return messages
+
+        response = await self.redis.xreadgroup(self.group, consumer, {self.stream: ">"}, count=count, block=block_ms)
+        return [self._decode(mid, fields) for _, entries in response or [] for mid, fields in entries]
+
+    async def ack(self, message: QueueMessage):
+        await self.redis.xack(self.stream, self.group, message.id)
+        await self.redis.xdel(self.stream, message.id)
+
+    async def retry(self, message: QueueMessage, error: str, delay: float = 0.0):
+        if delay:
+            # The message id keeps retries of identical payloads distinct
+            member = json.dumps({"id": message.id, "payload": message.payload, "attempts": message.attempts + 1})
+            await self.redis.zadd(self.delayed_key, {member: time.time() + delay})
+        else:
+            await self.publish(message.payload, attempts=message.attempts + 1)
+        await self.ack(message)
+
+    async def dead_letter(self, message: QueueMessage, error: str):
+        await self.redis.xadd(self.dead_letter_stream, {
+            "payload": json.dumps(message.payload), "attempts": message.attempts + 1,
+            "error": error, "original_id": message.id
+        })
+        await self.ack(message)
+
+    async def publish_result(self, result: Dict[str, Any]):
+        await self.redis.xadd(self.results_stream, {"result": json.dumps(result)},
+                              maxlen=self.max_results, approximate=True)
+
+    async def close(self):
+        await self.redis.close()
+
+class SQLiteQueue(AlertQueue):
+    """Single-file queue for local runs; several worker processes can share the file
+
+    Messages are leased by updating their row inside an IMMEDIATE
+    transaction, so each message goes to exactly one consumer at a time.
+    """
+
+    def __init__(self, path: str = None, visibility_timeout: float = None, poll_interval: float = 0.2):
+        self.path = path or os.getenv("TAMS_QUEUE_SQLITE_PATH", "./tams_queue.db")
+        self.visibility_timeout = visibility_timeout or float(os.getenv("TAMS_QUEUE_VISIBILITY_TIMEOUT_SECONDS", "300"))
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS alert_queue ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "state TEXT NOT NULL DEFAULT 'ready', available_at REAL NOT NULL, consumer TEXT, error TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_alert_queue_ready ON alert_queue(state, available_at)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS alert_results ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, result TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+
+    def _execute(self, sql: str, params: tuple = ()) -> int:
+        """Run one statement under the connection lock; returns the last inserted row id"""
+        with self._lock:
+            return self._db.execute(sql, params).lastrowid
+
+    async def _run(self, sql: str, params: tuple = ()) -> int:
+        # Writes can wait on other processes' locks (busy timeout); keep them off the event loop
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    async def publish(self, payload: Dict[str, Any]) -> str:
+        row_id = await self._run(
+            "INSERT INTO alert_queue (payload, available_at) VALUES (?, ?)", (json.dumps(payload), time.time())
+        )
+        return str(row_id)
+
+    def _lease(self, consumer: str, count: int) -> List[QueueMessage]:
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                # Ready messages, plus leases that expired because their consumer died
+                rows = self._db.execute(
+                    "SELECT id, payload, attempts FROM alert_queue "
+                    "WHERE state IN ('ready', 'leased') AND available_at <= ? ORDER BY id LIMIT ?",
+                    (now, count)
+                ).fetchall()
+                for row in rows:
+                    self._db.execute(
+                        "UPDATE alert_queue SET state = 'leased', consumer = ?, available_at = ? WHERE id = ?",
+                        (consumer, now + self.visibility_timeout, row[0])
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return [QueueMessage(str(row[0]), json.loads(row[1]), row[2]) for row in rows]
+
+    async def read(self, consumer: str, count: int = 1, block_ms: int = 1000) -> List[QueueMessage]:
+        deadline = time.monotonic() + block_ms / 1000.0
+        while True:
+            # The IMMEDIATE transaction can wait on other processes' locks; keep it off the event loop
+            messages = await asyncio.to_thread(self._lease, consumer, count)
+            if messages or time.monotonic() >= deadline:
+                return messages
+            await asyncio.sleep(self.poll_interval)
+
+    async def ack(self, message: QueueMessage):
+        await self._run("DELETE FROM alert_queue WHERE id = ?", (int(message.id),))
+
+    async def retry(self, message: QueueMessage, error: str, delay: float = 0.0):
+        await self._run(
+            "UPDATE alert_queue SET state = 'ready', attempts = attempts + 1, available_at = ?, "
+            "consumer = NULL, error = ? WHERE id = ?",
+            (time.time() + delay, error, int(message.id))
+        )
+
+    async def dead_letter(self, message: QueueMessage, error: str):
+        await self._run(
+            "UPDATE alert_queue SET state = 'dead', attempts = attempts + 1, consumer = NULL, error = ? WHERE id = ?",
+            (error, int(message.id))
+        )
+
+    async def publish_result(self, result: Dict[str, Any]):
+        await self._run("INSERT INTO alert_results (result, created_at) VALUES (?, ?)",
+                        (json.dumps(result), time.time()))
+
+    def dead_letters(self) -> List[Dict[str, Any]]:
+        """Dead-lettered alerts with their last error"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, payload, attempts, error FROM alert_queue WHERE state = 'dead' ORDER BY id"
+            ).fetchall()
+        return [{"id": str(r[0]), "payload": json.loads(r[1]), "attempts": r[2], "error": r[3]} for r in rows]
+
+    def results(self, after_id: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+        """Results written after a given results row id"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, result FROM alert_results WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+            ).fetchall()
+        return [{"id": r[0], **json.loads(r[1])} for r in rows]
+
+    async def close(self):
+        await asyncio.to_thread(self._close)
+
+    def _close(self):
+        with self._lock:
+            self._db.close()
+
+def create_alert_queue(backend: str = None) -> AlertQueue:
+    """Create the configured queue backend ("redis" or "sqlite")"""
+    backend = backend or os.getenv("TAMS_QUEUE_BACKEND", "redis")
+    if backend == "redis":
+        return RedisStreamQueue()
+    if backend == "sqlite":
+        return SQLiteQueue()
+    raise ValueError(f"Unknown TAMS queue backend: {backend}")
@@ -0,0 +1,122 @@
+"""
+Behavior Features - Vectorized Stage 2 behavioral statistics over a user's transaction history
+"""
+
+import math
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from .genuine_matcher import parse_timestamp, normalize_merchant
+
+SECONDS_PER_DAY = 86400.0
+
+def circular_stats(values: np.ndarray, current: float, period: float) -> Tuple[float, float, float]:
+    """Circular mean, distance of current from it (same units as values) and concentration R in [0, 1]"""
+    angles = 2 * np.pi * values / period
+    c, s = float(np.cos(angles).mean()), float(np.sin(angles).mean())
+    mean = (math.atan2(s, c) % (2 * math.pi)) * period / (2 * math.pi)
+    gap = abs(current - mean) % period
+    return mean, min(gap, period - gap), math.hypot(c, s)
+
+def _z_score(value: float, values: np.ndarray) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+    """(mean, std, z) of value against values; z is None without spread"""
+    if values.size == 0:
+        return None, None, None
+    mean, std = float(values.mean()), float(values.std())
+    return mean, std, ((value - mean) / std if std > 0 else None)
+
+class BehavioralFeatureExtractor:
+    """Computes the Stage 2 behavioral checks exactly instead of asking the LLM to
+
+    Covers user and MCC amount statistics, merchant/MCC novelty, hour-of-day
+    and day-of-week deviation (circular, UTC), daily velocity and the
+    Card-Present/Card-Not-Present mix.
+    """
+
+    def extract(self, input_data: Dict[str, Any], history: List[Dict[str, Any]]) -> Dict[str, Any]:
+        current_ts = parse_timestamp(input_data.get("timestamp"))
+        amount = float(input_data.get("amount") or 0)
+        merchant = normalize_merchant(input_data.get("merchant"))
+        txn_type = str(input_data.get("transaction_type", ""))
+
+        features: Dict[str, Any] = {"history_count": len(history)}
+        if not history:
+            features.update({"merchant_seen_before": False, "mcc_seen_before": False})
+            return features
+
+        timestamps = np.array([parse_timestamp(t.get("timestamp")) for t in history], dtype=float)
+        amounts = np.array([float(t.get("amount") or 0) for t in history], dtype=float)
+        merchants = np.array([normalize_merchant(t.get("merchant")) for t in history], dtype=object)
+        mccs = np.array([str(t.get("mcc", "")) for t in history], dtype=object)
+        types = np.array([str(t.get("transaction_type", "")) for t in history], dtype=object)
+
+        # Amount vs the user's overall history
+        mean, std, z = _z_score(amount, amounts)
+        features.update({"user_amount_mean": mean, "user_amount_std": std, "user_amount_z": z,
+                         "amount_to_user_max": amount / float(amounts.max()) if amounts.max() > 0 else None})
+
+        # Merchant novelty and the user's pattern with this merchant
+        same_merchant = merchants == merchant
+        features["merchant_seen_before"] = bool(same_merchant.any())
+        features["merchant_txn_count"] = int(same_merchant.sum())
+        if same_merchant.any():
+            features["merchant_days_since_last"] = (current_ts - float(timestamps[same_merchant].max())) / SECONDS_PER_DAY
+            features["merchant_amount_mean"] = float(amounts[same_merchant].mean())
+
+        # MCC novelty and amount vs this MCC (alert MCC, else the merchant's most recent MCC)
+        mcc = str(input_data.get("mcc") or "")
+        if not mcc and same_merchant.any():
+            mcc = str(mccs[same_merchant][np.argmax(timestamps[same_merchant])])
+        same_mcc = (mccs == mcc) if mcc else np.zeros(len(history), dtype=bool)
+        features["mcc"] = mcc or None
+        features["mcc_seen_before"] = bool(same_mcc.any())
+        features["mcc_txn_count"] = int(same_mcc.sum())
+        mean, std, z = _z_score(amount, amounts[same_mcc])
+        features.update({"mcc_amount_mean": mean, "mcc_amount_std": std, "mcc_amount_z": z})
+
+        # Time of day and day of week, as circular quantities
+        hours = (timestamps % SECONDS_PER_DAY) / 3600.0
+        current_hour = (current_ts % SECONDS_PER_DAY) / 3600.0
+        hour_mean, hour_gap, hour_r = circular_stats(hours, current_hour, 24.0)
+        # Epoch day 0 was a Thursday; shift so Monday is 0
+        weekdays = (np.floor(timestamps / SECONDS_PER_DAY) + 3) % 7
+        current_weekday = (math.floor(current_ts / SECONDS_PER_DAY) + 3) % 7
+        day_mean, day_gap, day_r = circular_stats(weekdays, current_weekday, 7.0)
+        hour_gaps = np.abs(hours - current_hour)
+        hour_gaps = np.minimum(hour_gaps, 24 - hour_gaps)
+        features.update({
+            "hour_of_day": current_hour, "usual_hour": hour_mean, "hour_deviation": hour_gap,
+            "hour_concentration": hour_r, "day_of_week": current_weekday, "usual_day_of_week": day_mean,
+            "day_of_week_deviation": day_gap, "day_of_week_concentration": day_r,
+            "hour_share_within_2h": float(np.mean(hour_gaps <= 2))
+        })
+
+        # Daily velocity: today's count (including this alert) vs the average per day
+        days = np.floor(timestamps / SECONDS_PER_DAY)
+        current_day = math.floor(current_ts / SECONDS_PER_DAY)
+        span_days = max(1.0, (current_ts - float(timestamps.min())) / SECONDS_PER_DAY)
+        avg_per_day = len(history) / span_days
+        today = int(((days == current_day) & (timestamps <= current_ts)).sum()) + 1
+        features.update({"avg_txns_per_day": avg_per_day, "txns_today": today,
+                         "velocity_ratio": today / avg_per_day})
+
+        # Card-Present / Card-Not-Present mix
+        features["cnp_share"] = float(np.mean(types == "Card-Not-Present"))
+        features["same_type_share"] = float(np.mean(types == txn_type))
+        return features
+
+    @staticmethod
+    def format_table(features: Dict[str, Any]) -> str:
+        """Compact two-column table for the prompt; floats rounded to 2 places"""
+        lines = ["feature | value"]
+        for name, value in features.items():
+            if value is None:
+                value = "n/a"
+            elif isinstance(value, float):
+                value = f"{value:.2f}"
+            lines.append(f"{name} | {value}")
+        return "\n".join(lines)
+
+# Global feature extractor
+behavioral_feature_extractor = BehavioralFeatureExtractor()
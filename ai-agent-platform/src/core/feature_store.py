@@ -0,0 +1,571 @@
+"""
+Feature Store - Incremental per-user rolling aggregates for TAMS
+"""
+
+import json
+import math
+import os
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional, Tuple
+
+from .genuine_matcher import parse_timestamp, normalize_merchant
+
+SECONDS_PER_DAY = 86400.0
+
+# Additive float sums of an aggregate; everything else in a bucket is a whole-number count
+_SUM_FIELDS = ("sum", "sumsq", "hour_cos", "hour_sin", "day_cos", "day_sin")
+
+def _empty_aggregate() -> Dict[str, Any]:
+    """Additive aggregate over a set of transactions (JSON-serializable)"""
+    return {
+        "count": 0, "sum": 0.0, "sumsq": 0.0, "first_ts": None, "max": 0.0,
+        "hour_cos": 0.0, "hour_sin": 0.0, "day_cos": 0.0, "day_sin": 0.0,
+        "hours": [0] * 24, "types": {}, "merchants": {}, "mccs": {}
+    }
+
+def _apply(aggregate: Dict[str, Any], txn: Dict[str, Any], sign: int):
+    """Add (sign=1) or remove (sign=-1) one parsed transaction"""
+    amount = txn["amount"]
+    aggregate["count"] += sign
+    aggregate["sum"] += sign * amount
+    aggregate["sumsq"] += sign * amount * amount
+    aggregate["hour_cos"] += sign * math.cos(2 * math.pi * txn["hour"] / 24)
+    aggregate["hour_sin"] += sign * math.sin(2 * math.pi * txn["hour"] / 24)
+    aggregate["day_cos"] += sign * math.cos(2 * math.pi * txn["weekday"] / 7)
+    aggregate["day_sin"] += sign * math.sin(2 * math.pi * txn["weekday"] / 7)
+    aggregate["hours"][int(txn["hour"])] += sign
+    aggregate["max"] = max(aggregate["max"], amount)
+
+    types = aggregate["types"]
+    types[txn["type"]] = types.get(txn["type"], 0) + sign
+    merchant = aggregate["merchants"].setdefault(txn["merchant"], [0, 0.0])
+    merchant[0] += sign
+    merchant[1] += sign * amount
+    mcc = aggregate["mccs"].setdefault(txn["mcc"], [0, 0.0, 0.0])
+    mcc[0] += sign
+    mcc[1] += sign * amount
+    mcc[2] += sign * amount * amount
+
+    # Drop keys whose counts reached zero so novelty checks stay exact
+    if types[txn["type"]] <= 0:
+        del types[txn["type"]]
+    if merchant[0] <= 0:
+        del aggregate["merchants"][txn["merchant"]]
+    if mcc[0] <= 0:
+        del aggregate["mccs"][txn["mcc"]]
+
+def _merge(total: Dict[str, Any], bucket: Dict[str, Any], sign: int):
+    """Add or remove a whole daily bucket from the running totals"""
+    for key in ("count", "sum", "sumsq", "hour_cos", "hour_sin", "day_cos", "day_sin"):
+        total[key] += sign * bucket[key]
+    total["hours"] = [a + sign * b for a, b in zip(total["hours"], bucket["hours"])]
+    for name, count in bucket["types"].items():
+        total["types"][name] = total["types"].get(name, 0) + sign * count
+    for key in ("merchants", "mccs"):
+        for name, values in bucket[key].items():
+            current = total[key].setdefault(name, [0] * len(values))
+            total[key][name] = [a + sign * b for a, b in zip(current, values)]
+        total[key] = {k: v for k, v in total[key].items() if v[0] > 0}
+    total["types"] = {k: v for k, v in total["types"].items() if v > 0}
+
+def _bucket_fields(aggregate: Dict[str, Any]) -> Tuple[Dict[str, int], Dict[str, float]]:
+    """Flat Redis hash fields of a daily bucket as (counts, float sums)"""
+    counts = {"count": aggregate["count"]}
+    counts.update({f"h{hour}": n for hour, n in enumerate(aggregate["hours"]) if n})
+    counts.update({f"t|{name}": n for name, n in aggregate["types"].items()})
+    sums = {key: aggregate[key] for key in _SUM_FIELDS}
+    for name, (n, total) in aggregate["merchants"].items():
+        counts[f"m|{name}"] = n
+        sums[f"ms|{name}"] = total
+    for name, (n, total, squares) in aggregate["mccs"].items():
+        counts[f"c|{name}"] = n
+        sums[f"cs|{name}"] = total
+        sums[f"cq|{name}"] = squares
+    return counts, sums
+
+def _bucket_from_fields(fields: Dict[str, str], max_amount: float, first_ts: float) -> Dict[str, Any]:
+    """Rebuild a daily bucket from its Redis hash fields"""
+    aggregate = _empty_aggregate()
+    aggregate["max"], aggregate["first_ts"] = max_amount, first_ts
+    for field, raw in fields.items():
+        value = float(raw)
+        kind, _, name = field.partition("|")
+        if field == "count":
+            aggregate["count"] = int(value)
+        elif field in _SUM_FIELDS:
+            aggregate[field] = value
+        elif not name:
+            aggregate["hours"][int(field[1:])] = int(value)
+        elif kind == "t":
+            aggregate["types"][name] = int(value)
+        elif kind == "m":
+            aggregate["merchants"].setdefault(name, [0, 0.0])[0] = int(value)
+        elif kind == "ms":
+            aggregate["merchants"].setdefault(name, [0, 0.0])[1] = value
+        elif kind == "c":
+            aggregate["mccs"].setdefault(name, [0, 0.0, 0.0])[0] = int(value)
+        elif kind == "cs":
+            aggregate["mccs"].setdefault(name, [0, 0.0, 0.0])[1] = value
+        elif kind == "cq":
+            aggregate["mccs"].setdefault(name, [0, 0.0, 0.0])[2] = value
+    return aggregate
+
+def _transaction_key(txn: Dict[str, Any]) -> tuple:
+    """Identity of a transaction for de-duplicating pre-load ingests against the loaded history"""
+    return (str(txn.get("timestamp")), normalize_merchant(txn.get("merchant")), float(txn.get("amount") or 0))
+
+def _circular(cos_sum: float, sin_sum: float, count: int, current: float, period: float):
+    """Circular mean, distance of current from it and concentration from summed unit vectors"""
+    c, s = cos_sum / count, sin_sum / count
+    mean = (math.atan2(s, c) % (2 * math.pi)) * period / (2 * math.pi)
+    gap = abs(current - mean) % period
+    return mean, min(gap, period - gap), math.hypot(c, s)
+
+class UserFeatureStore:
+    """Rolling per-user aggregates updated as transactions and genuine alerts arrive
+
+    Transactions are folded into daily buckets plus running totals (count,
+    sum, sum of squares, merchant/MCC counts, hour histogram, circular
+    hour/day sums); buckets older than window_days are subtracted again, so
+    reads are independent of the number of transactions. The last genuine_limit
+    confirmed genuine alerts and the user profile are kept alongside.
+    Ingesting for a user that was never load()ed starts a partial state:
+    has_user() stays False so the caller still runs the initial load, which
+    then folds the partial state's updates on top of the full history.
+    At most max_users users are held in-process, least recently used first
+    out. When redis_url is set, each transaction is written to Redis as
+    increments of its daily bucket hash, so other workers and restarts share
+    the state and an evicted user is reloaded from Redis instead of the data
+    sources. The sync reads (features_for, genuine_alerts, profile) use the
+    in-process state that has_user() or load() brought in.
+    """
+
+    def __init__(self, window_days: int = None, genuine_limit: int = None, redis_url: str = None,
+                 max_users: int = None):
+        self.window_days = window_days or int(os.getenv("TAMS_FEATURE_WINDOW_DAYS", "90"))
+        self.genuine_limit = genuine_limit or int(os.getenv("TAMS_FEATURE_GENUINE_LIMIT", "50"))
+        self.max_users = max_users or int(os.getenv("TAMS_FEATURE_MAX_USERS", "10000"))
+        self.users: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "transactions": 0, "genuine_alerts": 0, "expired_days": 0,
+                      "evictions": 0, "redis_loads": 0}
+
+        self.redis_client = None
+        redis_url = redis_url if redis_url is not None else os.getenv("TAMS_FEATURE_STORE_REDIS_URL", "")
+        if redis_url:
+            try:
+                import redis.asyncio as redis
+                self.redis_client = redis.from_url(redis_url, decode_responses=True)
+            except Exception as e:
+                print(f"⚠️  Feature store Redis not available, using in-process storage only: {e}")
+                self.redis_client = None
+
+    # Ingestion
+
+    async def load(self, user_id: str, transactions: List[Dict[str, Any]], genuine_alerts: List[Dict[str, Any]] = None,
+                   profile: Dict[str, Any] = None):
+        """Replace a user's state from a full history (initial load or rebuild)
+
+        Updates ingested before the first load are kept unless the history
+        already contains them.
+        """
+        previous = await self._state(user_id)
+        pending = previous["pending"] if previous is not None and previous.get("pending") is not None else None
+        genuine_alerts = list(genuine_alerts or [])
+        profile = dict(profile or {})
+        if pending is not None:
+            known = {_transaction_key(txn) for txn in transactions}
+            transactions = list(transactions) + [txn for txn in pending["transactions"] if _transaction_key(txn) not in known]
+            genuine_alerts += [alert for alert in pending["genuine"] if alert not in genuine_alerts]
+            profile.update(pending["profile"])
+
+        state = self._new_state()
+        state["profile"] = profile
+        self._remember(user_id, state)
+        for txn in transactions:
+            self._add_transaction(state, txn)
+        state["genuine"].extend(genuine_alerts)
+        await self._write_state(user_id, state)
+
+    async def ingest_transaction(self, user_id: str, txn: Dict[str, Any]):
+        """Fold one new transaction into the user's aggregates"""
+        state = await self._state(user_id, create=True)
+        day, parsed, ts = self._add_transaction(state, txn)
+        expired = self._expire(state, parse_timestamp(txn.get("timestamp")))
+        if state.get("pending") is not None:
+            state["pending"]["transactions"].append(txn)
+            await self._redis_write(lambda pipe: pipe.rpush(self._key(user_id, "pending", "transactions"), json.dumps(txn)))
+        else:
+            await self._write_transaction(user_id, state, day, parsed, ts, expired)
+
+    async def ingest_genuine_alert(self, user_id: str, alert: Dict[str, Any]):
+        """Record an alert confirmed as genuine (most recent genuine_limit are kept)"""
+        state = await self._state(user_id, create=True)
+        state["genuine"].append(alert)
+        self.stats["genuine_alerts"] += 1
+        if state.get("pending") is not None:
+            state["pending"]["genuine"].append(alert)
+            await self._redis_write(lambda pipe: pipe.rpush(self._key(user_id, "pending", "genuine"), json.dumps(alert)))
+            return
+
+        def write(pipe):
+            key = self._key(user_id, "genuine")
+            pipe.rpush(key, json.dumps(alert))
+            pipe.ltrim(key, -self.genuine_limit, -1)
+            pipe.expire(key, self._ttl())
+        await self._redis_write(write)
+
+    async def set_profile(self, user_id: str, profile: Dict[str, Any]):
+        state = await self._state(user_id, create=True)
+        state["profile"] = dict(profile)
+        if state.get("pending") is not None:
+            state["pending"]["profile"] = dict(profile)
+            key = self._key(user_id, "pending", "profile")
+        else:
+            key = self._key(user_id, "profile")
+        await self._redis_write(lambda pipe: pipe.set(key, json.dumps(profile), ex=self._ttl()))
+
+    # Reads
+
+    async def has_user(self, user_id: str) -> bool:
+        """Whether the user's full history has been loaded (reloading an evicted user from Redis)"""
+        state = await self._state(user_id)
+        found = state is not None and state.get("pending") is None
+        self.stats["hits" if found else "misses"] += 1
+        return found
+
+    def genuine_alerts(self, user_id: str) -> List[Dict[str, Any]]:
+        state = self._cached(user_id)
+        return list(state["genuine"]) if state else []
+
+    def profile(self, user_id: str) -> Dict[str, Any]:
+        state = self._cached(user_id)
+        return dict(state["profile"]) if state else {}
+
+    def features_for(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Stage 2 behavioral features for an alert (same keys as BehavioralFeatureExtractor)
+
+        Hour-of-day shares use the hourly histogram, so they are binned to
+        whole hours; everything else is exact over the window.
+        """
+        state = self._cached(input_data.get("user_id"))
+        current_ts = parse_timestamp(input_data.get("timestamp"))
+        if state is not None:
+            self._expire(state, current_ts)
+        total = state["total"] if state is not None else _empty_aggregate()
+        count = total["count"]
+
+        features: Dict[str, Any] = {"history_count": count}
+        if count == 0:
+            features.update({"merchant_seen_before": False, "mcc_seen_before": False})
+            return features
+
+        amount = float(input_data.get("amount") or 0)
+        merchant = normalize_merchant(input_data.get("merchant"))
+
+        def stats(n: int, total_sum: float, total_sumsq: float):
+            if n == 0:
+                return None, None, None
+            mean = total_sum / n
+            std = math.sqrt(max(0.0, total_sumsq / n - mean * mean))
+            return mean, std, ((amount - mean) / std if std > 1e-9 else None)
+
+        mean, std, z = stats(count, total["sum"], total["sumsq"])
+        max_amount = max(bucket["max"] for bucket in state["days"].values())
+        features.update({"user_amount_mean": mean, "user_amount_std": std, "user_amount_z": z,
+                         "amount_to_user_max": amount / max_amount if max_amount > 0 else None})
+
+        seen = total["merchants"].get(merchant)
+        features["merchant_seen_before"] = seen is not None
+        features["merchant_txn_count"] = seen[0] if seen else 0
+        if seen:
+            features["merchant_days_since_last"] = (current_ts - state["merchant_last"][merchant][0]) / SECONDS_PER_DAY
+            features["merchant_amount_mean"] = seen[1] / seen[0]
+
+        mcc = str(input_data.get("mcc") or "")
+        if not mcc and seen:
+            mcc = state["merchant_last"][merchant][1]
+        mcc_values = total["mccs"].get(mcc) if mcc else None
+        features["mcc"] = mcc or None
+        features["mcc_seen_before"] = mcc_values is not None
+        features["mcc_txn_count"] = mcc_values[0] if mcc_values else 0
+        mean, std, z = stats(*(mcc_values or (0, 0.0, 0.0)))
+        features.update({"mcc_amount_mean": mean, "mcc_amount_std": std, "mcc_amount_z": z})
+
+        current_hour = (current_ts % SECONDS_PER_DAY) / 3600.0
+        current_weekday = (math.floor(current_ts / SECONDS_PER_DAY) + 3) % 7
+        hour_mean, hour_gap, hour_r = _circular(total["hour_cos"], total["hour_sin"], count, current_hour, 24.0)
+        day_mean, day_gap, day_r = _circular(total["day_cos"], total["day_sin"], count, current_weekday, 7.0)
+        near = sum(total["hours"][(int(current_hour) + offset) % 24] for offset in range(-2, 3))
+        features.update({
+            "hour_of_day": current_hour, "usual_hour": hour_mean, "hour_deviation": hour_gap,
+            "hour_concentration": hour_r, "day_of_week": current_weekday, "usual_day_of_week": day_mean,
+            "day_of_week_deviation": day_gap, "day_of_week_concentration": day_r,
+            "hour_share_within_2h": near / count
+        })
+
+        first_ts = min(bucket["first_ts"] for bucket in state["days"].values())
+        avg_per_day = count / max(1.0, (current_ts - first_ts) / SECONDS_PER_DAY)
+        today = state["days"].get(str(math.floor(current_ts / SECONDS_PER_DAY)))
+        txns_today = (today["count"] if today else 0) + 1
+        features.update({"avg_txns_per_day": avg_per_day, "txns_today": txns_today,
+                         "velocity_ratio": txns_today / avg_per_day})
+
+        features["cnp_share"] = total["types"].get("Card-Not-Present", 0) / count
+        features["same_type_share"] = total["types"].get(str(input_data.get("transaction_type", "")), 0) / count
+        return features
+
+    # Snapshot / restore
+
+    def snapshot(self, path: str = None) -> Dict[str, Any]:
+        """Serializable copy of the in-process users' state, optionally written to a JSON file"""
+        data = {"window_days": self.window_days,
+                "users": {user_id: self._serialize(state) for user_id, state in self.users.items()}}
+        if path:
+            with open(path, "w") as f:
+                json.dump(data, f)
+        return data
+
+    async def restore(self, data: Dict[str, Any] = None, path: str = None):
+        """Replace all in-process state from a snapshot dict or file, writing it through to Redis"""
+        if path:
+            with open(path) as f:
+                data = json.load(f)
+        self.users = OrderedDict()
+        for user_id, state in data["users"].items():
+            self._remember(user_id, self._deserialize(state))
+            await self._write_state(user_id, self.users[user_id])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "users": len(self.users), "max_users": self.max_users,
+                "redis": self.redis_client is not None}
+
+    # Internals
+
+    def _new_state(self) -> Dict[str, Any]:
+        return {"days": {}, "total": _empty_aggregate(), "merchant_last": {},
+                "genuine": deque(maxlen=self.genuine_limit), "profile": {}}
+
+    def _pending_state(self) -> Dict[str, Any]:
+        # Not loaded yet: remember what arrives until load() merges it
+        state = self._new_state()
+        state["pending"] = {"transactions": [], "genuine": [], "profile": {}}
+        return state
+
+    def _cached(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """In-process state of a user, marked as recently used"""
+        state = self.users.get(user_id)
+        if state is not None:
+            self.users.move_to_end(user_id)
+        return state
+
+    def _remember(self, user_id: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        self.users[user_id] = state
+        self.users.move_to_end(user_id)
+        while len(self.users) > self.max_users:
+            self.users.popitem(last=False)
+            self.stats["evictions"] += 1
+        return state
+
+    async def _state(self, user_id: str, create: bool = False) -> Optional[Dict[str, Any]]:
+        state = self._cached(user_id)
+        if state is None and self.redis_client is not None:
+            fetched = await self._fetch(user_id)
+            # Another task may have brought the user in while this one waited on Redis
+            state = self._cached(user_id)
+            if state is None and fetched is not None:
+                state = self._remember(user_id, fetched)
+        if state is None and create:
+            state = self._remember(user_id, self._pending_state())
+        return state
+
+    def _add_transaction(self, state: Dict[str, Any], txn: Dict[str, Any]) -> Tuple[str, Dict[str, Any], float]:
+        """Fold a transaction into its daily bucket and the totals; returns (day, parsed fields, timestamp)"""
+        ts = parse_timestamp(txn.get("timestamp"))
+        parsed = {
+            "amount": float(txn.get("amount") or 0),
+            "hour": (ts % SECONDS_PER_DAY) / 3600.0,
+            "weekday": (math.floor(ts / SECONDS_PER_DAY) + 3) % 7,
+            "type": str(txn.get("transaction_type", "")),
+            "merchant": normalize_merchant(txn.get("merchant")),
+            "mcc": str(txn.get("mcc", ""))
+        }
+        day = str(math.floor(ts / SECONDS_PER_DAY))
+        bucket = state["days"].setdefault(day, _empty_aggregate())
+        _apply(bucket, parsed, 1)
+        _apply(state["total"], parsed, 1)
+        bucket["first_ts"] = ts if bucket["first_ts"] is None else min(bucket["first_ts"], ts)
+
+        last = state["merchant_last"].get(parsed["merchant"])
+        if last is None or ts >= last[0]:
+            state["merchant_last"][parsed["merchant"]] = [ts, parsed["mcc"]]
+        self.stats["transactions"] += 1
+        return day, parsed, ts
+
+    def _expire(self, state: Dict[str, Any], now_ts: float) -> List[str]:
+        """Subtract daily buckets that fell out of the window; returns the expired days"""
+        oldest = math.floor(now_ts / SECONDS_PER_DAY) - self.window_days
+        expired = [d for d in state["days"] if int(d) < oldest]
+        for day in expired:
+            _merge(state["total"], state["days"].pop(day), -1)
+            self.stats["expired_days"] += 1
+        live = state["total"]["merchants"]
+        state["merchant_last"] = {m: v for m, v in state["merchant_last"].items() if m in live}
+        return expired
+
+    # Redis layout per user (prefix tams:features:<user_id>): day:<n> hashes of bucket counts and sums,
+    # sorted sets days (first timestamp), day_max (largest amount) and merchant_last (last timestamp),
+    # hash merchant_mcc, list genuine, strings profile and loaded, and pending:* before the first load
+
+    def _key(self, user_id: str, *parts: str) -> str:
+        return ":".join(("tams:features", str(user_id)) + parts)
+
+    def _ttl(self) -> int:
+        return self.window_days * 86400
+
+    async def _redis_write(self, build):
+        """Run the commands queued by build(pipe) as one Redis transaction"""
+        if self.redis_client is None:
+            return
+        try:
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                build(pipe)
+                await pipe.execute()
+        except Exception as e:
+            print(f"⚠️  Feature store Redis write failed: {e}")
+
+    async def _write_transaction(self, user_id: str, state: Dict[str, Any], day: str, parsed: Dict[str, Any],
+                                 ts: float, expired: List[str]):
+        """Write one transaction as increments of its daily bucket instead of rewriting the user"""
+        delta = _empty_aggregate()
+        _apply(delta, parsed, 1)
+        counts, sums = _bucket_fields(delta)
+        day_key, ttl = self._key(user_id, "day", day), self._ttl()
+        merchant = parsed["merchant"]
+
+        def write(pipe):
+            for field, value in counts.items():
+                pipe.hincrby(day_key, field, value)
+            for field, value in sums.items():
+                pipe.hincrbyfloat(day_key, field, value)
+            pipe.zadd(self._key(user_id, "days"), {day: ts}, lt=True)
+            pipe.zadd(self._key(user_id, "day_max"), {day: parsed["amount"]}, gt=True)
+            pipe.zadd(self._key(user_id, "merchant_last"), {merchant: ts}, gt=True)
+            if state["merchant_last"].get(merchant, [None])[0] == ts:
+                pipe.hset(self._key(user_id, "merchant_mcc"), merchant, parsed["mcc"])
+            if expired:
+                pipe.zrem(self._key(user_id, "days"), *expired)
+                pipe.zrem(self._key(user_id, "day_max"), *expired)
+                pipe.delete(*[self._key(user_id, "day", old) for old in expired])
+            for key in (day_key, self._key(user_id, "days"), self._key(user_id, "day_max"),
+                        self._key(user_id, "merchant_last"), self._key(user_id, "merchant_mcc"),
+                        self._key(user_id, "genuine"), self._key(user_id, "profile"), self._key(user_id, "loaded")):
+                pipe.expire(key, ttl)
+        await self._redis_write(write)
+
+    async def _write_state(self, user_id: str, state: Dict[str, Any]):
+        """Replace everything stored in Redis for a user (load and restore only)"""
+        if self.redis_client is None:
+            return
+        try:
+            old_days = await self.redis_client.zrange(self._key(user_id, "days"), 0, -1)
+        except Exception as e:
+            print(f"⚠️  Feature store Redis write failed: {e}")
+            return
+        ttl = self._ttl()
+
+        def write(pipe):
+            pipe.delete(*[self._key(user_id, "day", day) for day in old_days],
+                        *[self._key(user_id, name) for name in ("days", "day_max", "merchant_last", "merchant_mcc",
+                                                                 "genuine", "profile", "loaded")],
+                        *[self._key(user_id, "pending", name) for name in ("transactions", "genuine", "profile")])
+            pending = state.get("pending")
+            if pending is not None:
+                if pending["transactions"]:
+                    pipe.rpush(self._key(user_id, "pending", "transactions"), *map(json.dumps, pending["transactions"]))
+                if pending["genuine"]:
+                    pipe.rpush(self._key(user_id, "pending", "genuine"), *map(json.dumps, pending["genuine"]))
+                pipe.set(self._key(user_id, "pending", "profile"), json.dumps(pending["profile"]), ex=ttl)
+                return
+
+            for day, bucket in state["days"].items():
+                counts, sums = _bucket_fields(bucket)
+                pipe.hset(self._key(user_id, "day", day), mapping={**counts, **sums})
+                pipe.expire(self._key(user_id, "day", day), ttl)
+            if state["days"]:
+                pipe.zadd(self._key(user_id, "days"), {day: b["first_ts"] for day, b in state["days"].items()})
+                pipe.zadd(self._key(user_id, "day_max"), {day: b["max"] for day, b in state["days"].items()})
+            if state["merchant_last"]:
+                pipe.zadd(self._key(user_id, "merchant_last"), {m: v[0] for m, v in state["merchant_last"].items()})
+                pipe.hset(self._key(user_id, "merchant_mcc"), mapping={m: v[1] for m, v in state["merchant_last"].items()})
+            if state["genuine"]:
+                pipe.rpush(self._key(user_id, "genuine"), *map(json.dumps, state["genuine"]))
+            pipe.set(self._key(user_id, "profile"), json.dumps(state["profile"]), ex=ttl)
+            pipe.set(self._key(user_id, "loaded"), "1", ex=ttl)
+            for name in ("days", "day_max", "merchant_last", "merchant_mcc", "genuine"):
+                pipe.expire(self._key(user_id, name), ttl)
+        await self._redis_write(write)
+
+    async def _fetch(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Rebuild a user's state from Redis, or None when Redis has nothing for them"""
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.get(self._key(user_id, "loaded"))
+                pipe.zrange(self._key(user_id, "days"), 0, -1, withscores=True)
+                pipe.zrange(self._key(user_id, "day_max"), 0, -1, withscores=True)
+                pipe.zrange(self._key(user_id, "merchant_last"), 0, -1, withscores=True)
+                pipe.hgetall(self._key(user_id, "merchant_mcc"))
+                pipe.lrange(self._key(user_id, "genuine"), -self.genuine_limit, -1)
+                pipe.get(self._key(user_id, "profile"))
+                pipe.lrange(self._key(user_id, "pending", "transactions"), 0, -1)
+                pipe.lrange(self._key(user_id, "pending", "genuine"), 0, -1)
+                pipe.get(self._key(user_id, "pending", "profile"))
+                (loaded, days, day_max, merchant_last, merchant_mcc, genuine, profile,
+                 pending_transactions, pending_genuine, pending_profile) = await pipe.execute()
+            buckets = []
+            if loaded and days:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    for day, _ in days:
+                        pipe.hgetall(self._key(user_id, "day", day))
+                    buckets = await pipe.execute()
+        except Exception as e:
+            print(f"⚠️  Feature store Redis read failed: {e}")
+            return None
+
+        if loaded:
+            state = self._new_state()
+            maxima = dict(day_max)
+            for (day, first_ts), fields in zip(days, buckets):
+                if fields:
+                    state["days"][day] = _bucket_from_fields(fields, maxima.get(day, 0.0), first_ts)
+                    _merge(state["total"], state["days"][day], 1)
+            live = state["total"]["merchants"]
+            state["merchant_last"] = {m: [ts, merchant_mcc.get(m, "")] for m, ts in merchant_last if m in live}
+            state["genuine"].extend(json.loads(alert) for alert in genuine)
+            state["profile"] = json.loads(profile) if profile else {}
+        elif pending_transactions or pending_genuine or pending_profile:
+            state = self._pending_state()
+            for raw in pending_transactions:
+                txn = json.loads(raw)
+                self._add_transaction(state, txn)
+                state["pending"]["transactions"].append(txn)
+            for raw in pending_genuine:
+                state["genuine"].append(json.loads(raw))
+                state["pending"]["genuine"].append(json.loads(raw))
+            if pending_profile:
+                state["profile"] = json.loads(pending_profile)
+                state["pending"]["profile"] = json.loads(pending_profile)
+        else:
+            return None
+        self.stats["redis_loads"] += 1
+        return state
+
+    def _serialize(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        return {**state, "genuine": list(state["genuine"])}
+
+    def _deserialize(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        state = dict(data)
+        state["genuine"] = deque(data.get("genuine", []), maxlen=self.genuine_limit)
+        return state
+
+# Global TAMS feature store
+user_feature_store = UserFeatureStore()
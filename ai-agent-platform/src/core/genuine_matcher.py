@@ -0,0 +1,132 @@
+"""
+Genuine Alert Matcher - Deterministic Stage 1 correlation against confirmed genuine alerts
+"""
+
+import os
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from .html_render import render_stage1_html
+
+def parse_timestamp(value: str) -> float:
+    """ISO-8601 timestamp (with or without Z/offset) to epoch seconds, naive taken as UTC"""
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def normalize_merchant(name: str) -> str:
+    """Case- and whitespace-insensitive merchant key"""
+    return " ".join(str(name or "").lower().split())
+
+class GenuineAlertMatcher:
+    """Vectorized version of the Stage 1 v1.1 rule
+
+    Genuine alerts less than 24 hours older than the current alert are
+    ignored. Each remaining alert is compared on merchant, transaction type,
+    amount (within +/- amount_tolerance) and timestamp (time of day within
+    +/- time_window_hours). At least three matches on one alert is a clear
+    'Likely Genuine'; one match or fewer on every alert (or nothing to
+    compare against) is a clear 'Requires Further Analysis'. A best match of
+    exactly two attributes is ambiguous and left to the LLM (match returns None).
+    """
+
+    ATTRIBUTES = ("Merchant", "Transaction Type", "Amount", "Timestamp")
+
+    def __init__(self, amount_tolerance: float = 0.10, time_window_hours: float = None,
+                 min_age_hours: float = 24.0):
+        self.amount_tolerance = amount_tolerance
+        self.time_window_hours = time_window_hours if time_window_hours is not None else float(
+            os.getenv("TAMS_STAGE1_TIME_WINDOW_HOURS", "2"))
+        self.min_age_hours = min_age_hours
+        self.stats = {"checked": 0, "likely_genuine": 0, "no_match": 0, "ambiguous": 0}
+
+    def compare(self, input_data: Dict[str, Any], genuine_alerts: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        """Per-alert eligibility and attribute matches as boolean arrays"""
+        current_ts = parse_timestamp(input_data.get("timestamp"))
+        timestamps = np.array([parse_timestamp(a.get("timestamp")) for a in genuine_alerts], dtype=float)
+        amounts = np.array([float(a.get("amount") or 0) for a in genuine_alerts], dtype=float)
+        merchants = np.array([normalize_merchant(a.get("merchant")) for a in genuine_alerts], dtype=object)
+        types = np.array([str(a.get("transaction_type", "")).lower() for a in genuine_alerts], dtype=object)
+
+        amount = float(input_data.get("amount") or 0)
+        seconds_of_day = 86400.0
+        time_gap = np.abs((timestamps - current_ts) % seconds_of_day)
+        time_gap = np.minimum(time_gap, seconds_of_day - time_gap)
+
+        return {
+            "eligible": (current_ts - timestamps) >= self.min_age_hours * 3600,
+            "Merchant": merchants == normalize_merchant(input_data.get("merchant")),
+            "Transaction Type": types == str(input_data.get("transaction_type", "")).lower(),
+            "Amount": np.abs(amounts - amount) <= self.amount_tolerance * np.abs(amounts),
+            "Timestamp": time_gap <= self.time_window_hours * 3600,
+            "age_days": (current_ts - timestamps) / seconds_of_day
+        }
+
+    def match(self, input_data: Dict[str, Any], genuine_alerts: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Stage 1 result for clear cases, or None when the LLM should decide"""
+        self.stats["checked"] += 1
+        if genuine_alerts:
+            matches = self.compare(input_data, genuine_alerts)
+            eligible = matches["eligible"]
+        else:
+            eligible = np.zeros(0, dtype=bool)
+
+        if not eligible.any():
+            self.stats["no_match"] += 1
+            return self._result(input_data, None, None,
+                                "No confirmed genuine alerts older than 24 hours to compare against")
+
+        grid = np.stack([matches[name] for name in self.ATTRIBUTES], axis=1) & eligible[:, None]
+        counts = grid.sum(axis=1)
+        best = int(np.argmax(counts))
+        best_count = int(counts[best])
+
+        if best_count == 2:
+            self.stats["ambiguous"] += 1
+            return None
+
+        if best_count >= 3:
+            self.stats["likely_genuine"] += 1
+            days = int(matches["age_days"][best])
+            rationale = f"Matches {best_count} out of 4 key attributes with genuine transaction from {days} days ago"
+            return self._result(input_data, genuine_alerts[best], grid[best], rationale)
+
+        self.stats["no_match"] += 1
+        return self._result(input_data, genuine_alerts[best], grid[best],
+                            f"Best genuine transaction matches only {best_count} out of 4 key attributes")
+
+    def _result(self, input_data: Dict[str, Any], genuine: Optional[Dict[str, Any]],
+                matched: Optional[np.ndarray], rationale: str) -> Dict[str, Any]:
+        """Stage 1 JSON in the same shape the LLM returns"""
+        likely_genuine = matched is not None and int(matched.sum()) >= 3
+        classification = "Likely Genuine" if likely_genuine else "Requires Further Analysis"
+        return {
+            "classification": classification,
+            "confidenceScore": "High" if likely_genuine else None,
+            "rationale": rationale,
+            "htmlContent": render_stage1_html(input_data, classification, genuine, matched)
+        }
+
+    def best_match(self, input_data: Dict[str, Any], genuine_alerts: List[Dict[str, Any]]):
+        """(genuine alert, per-attribute matches) for the closest eligible alert, or (None, None)"""
+        if not genuine_alerts:
+            return None, None
+        matches = self.compare(input_data, genuine_alerts)
+        if not matches["eligible"].any():
+            return None, None
+        grid = np.stack([matches[name] for name in self.ATTRIBUTES], axis=1) & matches["eligible"][:, None]
+        best = int(np.argmax(grid.sum(axis=1)))
+        return genuine_alerts[best], grid[best]
+
+    def get_stats(self) -> Dict[str, Any]:
+        checked = self.stats["checked"]
+        return {
+            **self.stats,
+            "llm_skip_ratio": (checked - self.stats["ambiguous"]) / checked if checked else 0.0
+        }
+
+# Global Stage 1 matcher
+genuine_alert_matcher = GenuineAlertMatcher()
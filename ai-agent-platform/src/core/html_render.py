@@ -0,0 +1,80 @@
+"""
+HTML Render - Server-side templates for the htmlContent of each TAMS stage
+"""
+
+from html import escape
+from typing import Dict, Any, List, Optional, Sequence
+
+ANOMALY_COLORS = {"Low": "green", "Medium": "goldenrod", "High": "red"}
+
+def _text(value: Any) -> str:
+    return escape(str(value)) if value is not None else "N/A"
+
+def _bullets(heading: str, items: Optional[List[Any]]) -> str:
+    points = "".join(f"<li>{_text(item)}</li>" for item in items or [])
+    return (f"<h4 style='color: black; font-weight: bold;'>{heading}</h4>"
+            f"<ul style='font-size: small;'>{points}</ul>")
+
+def rating_color(rating: Any) -> str:
+    """Background for the Stage 3 risk circle: green 1-3, orange 4-6, red 7-10"""
+    try:
+        rating = float(rating)
+    except (TypeError, ValueError):
+        return "gray"
+    return "green" if rating <= 3 else ("orange" if rating <= 6 else "red")
+
+def render_stage1_html(input_data: Dict[str, Any], classification: str, genuine: Optional[Dict[str, Any]],
+                       matched: Optional[Sequence[bool]]) -> str:
+    """Classification heading plus the attribute comparison table against the closest genuine alert"""
+    likely_genuine = classification == "Likely Genuine"
+    color = "green" if likely_genuine else "red"
+    icon = "✅" if likely_genuine else "⚠️"
+
+    rows = ""
+    attributes = (("Merchant", "merchant"), ("Transaction Type", "transaction_type"),
+                  ("Amount", "amount"), ("Timestamp", "timestamp"))
+    for i, (attribute, field) in enumerate(attributes):
+        ok = matched is not None and bool(matched[i])
+        other = genuine.get(field, "N/A") if genuine else "N/A"
+        status = "<td style='color: green;'>✅ Match</td>" if ok else "<td style='color: red;'>❌ No Match</td>"
+        rows += f"<tr><td>{attribute}</td><td>{_text(input_data.get(field))}</td><td>{_text(other)}</td>{status}</tr>"
+
+    return (
+        f"<h4 style='color: {color}; text-align: left;'>{icon} {_text(classification)}</h4>"
+        "<table style='width: 100%; background: white; border: 1px solid black; font-size: medium;'>"
+        "<tr><th>Attribute</th><th>Current Transaction</th><th>Recent Genuine Transaction</th><th>Comparison Status</th></tr>"
+        f"{rows}</table>"
+    )
+
+def render_stage2_html(result: Dict[str, Any]) -> str:
+    """Anomaly rating heading, observations and the italic behavioral summary"""
+    rating = result.get("anomalyRating")
+    color = ANOMALY_COLORS.get(rating, "black")
+    observations = "".join(f"<li>{_text(o)}</li>" for o in result.get("keyAnomalousObservations") or [])
+    return (
+        f"<h4 style='color: black; font-weight: bold;'>Anomaly Rating: <span style='color: {color};'>{_text(rating)}</span></h4>"
+        f"<ul style='font-size: small;'>{observations}</ul>"
+        f"<p style='font-style: italic; font-size: small;'>{_text(result.get('behavioralSummary'))}</p>"
+    )
+
+def render_stage3_html(result: Dict[str, Any]) -> str:
+    """Centered risk-rating circle followed by findings, recommendations and risk factors"""
+    rating = result.get("riskRating")
+    circle = (
+        "<div style='display: flex; justify-content: center;'>"
+        f"<div style='width: 60px; height: 60px; border-radius: 50%; background: {rating_color(rating)}; color: white; "
+        "display: flex; align-items: center; justify-content: center; font-size: 24px; font-weight: bold;'>"
+        f"{_text(rating)}</div></div>"
+    )
+    return (circle
+            + _bullets("Key Findings", result.get("keyFindings"))
+            + _bullets("Recommendations", result.get("recommendations"))
+            + _bullets("Risk Factors", result.get("riskFactors")))
+
+def render_skipped_html(result: Dict[str, Any]) -> str:
+    """Notice shown in place of a stage the short-circuit policy skipped"""
+    assumed = ", ".join(f"{field} = {_text(result.get(field))}" for field in result.get("assumedFields", []))
+    return ("<h3 style='color: gray;'>⏭️ Stage skipped</h3>"
+            f"<p style='font-size: small;'>Skipped by short-circuit rule <b>{_text(result.get('skippedBy'))}</b>; "
+            "no LLM analysis was run for this stage."
+            + (f" Assumed: {assumed}." if assumed else "") + "</p>")
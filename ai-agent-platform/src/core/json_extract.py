@@ -0,0 +1,251 @@
+"""
+JSON Extract - Tolerant extraction, repair and per-stage validation of LLM JSON output
+"""
+
+import json
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+# Characters that change nesting or string state; everything else is skipped by the scan
+_STRUCTURAL = re.compile(r'[{}\[\]"\\]')
+
+# Tokens for the repair pass; an unterminated string runs to the end of the text
+_TOKENS = re.compile(
+    r'(?P<string>"(?:[^"\\]|\\.)*)(?P<close>"?)'
+    r'|(?P<punct>[{}\[\],:])'
+    r'|(?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)'
+    r'|(?P<word>[A-Za-z_]+)'
+    r'|(?P<space>\s+)'
+    r'|(?P<other>.)',
+    re.S
+)
+
+_NUMBER = re.compile(r'-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?')
+
+_LITERALS = {"true": "true", "false": "false", "null": "null", "True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+_DECODER = json.JSONDecoder()
+
+def _scan(text: str, start: int) -> Tuple[int, List[str]]:
+    """End of the balanced value opening at text[start] (-1 if truncated) and the still-open brackets"""
+    stack: List[str] = []
+    in_string = False
+    skip = -1
+    for match in _STRUCTURAL.finditer(text, start):
+        i = match.start()
+        if i == skip:
+            continue
+        char = text[i]
+        if in_string:
+            if char == "\\":
+                skip = i + 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return i + 1, stack
+    return -1, stack
+
+def _is_value_end(token: str) -> bool:
+    return token[-1] in '"}]' or token[-1].isdigit() or token in ("true", "false", "null")
+
+def _is_value_start(token: str) -> bool:
+    return token[0] in '"{[-' or token[0].isdigit() or token in ("true", "false", "null")
+
+def repair_json(candidate: str) -> str:
+    """Fix common LLM defects in one tokenizing pass
+
+    Drops trailing and doubled commas, inserts missing commas between
+    values, maps Python literals (True/False/None) to JSON, and closes a
+    truncated document: the open string is terminated, a dangling key or
+    comma is dropped, a trailing number (which may have lost digits) is
+    dropped with its key and open brackets are closed. Unknown bare words are
+    left alone so genuinely invalid output still fails to parse.
+    """
+    tokens: List[str] = []
+    stack: List[str] = []
+    for match in _TOKENS.finditer(candidate):
+        kind = match.lastgroup if match.lastgroup != "close" else "string"
+        if kind == "space":
+            continue
+        if kind == "string":
+            token = match.group("string")
+            if match.group("close"):
+                token += '"'
+            else:
+                token = token.rstrip("\\") + '"'
+        elif kind == "word":
+            token = _LITERALS.get(match.group(), match.group())
+        elif match.group() == "\\":
+            # Left over from a string cut off mid-escape
+            continue
+        else:
+            token = match.group()
+
+        if token in "}]" and len(token) == 1:
+            while tokens and tokens[-1] == ",":
+                tokens.pop()
+            if stack and _CLOSERS[stack[-1]] == token:
+                stack.pop()
+        elif token == "," and (not tokens or tokens[-1] in (",", "{", "[")):
+            continue
+        elif tokens and _is_value_start(token) and _is_value_end(tokens[-1]):
+            tokens.append(",")
+
+        tokens.append(token)
+        if token in _CLOSERS:
+            stack.append(token)
+
+    # Truncated output: drop whatever cannot stand on its own, then close the brackets
+    if stack and tokens and _NUMBER.fullmatch(tokens[-1]):
+        # "riskRating": 1 may have been 10; leave it missing so validation asks again
+        tokens.pop()
+    while stack and tokens:
+        last = tokens[-1]
+        if last in (",", ":"):
+            tokens.pop()
+            if last == ":" and tokens:
+                tokens.pop()
+        elif stack[-1] == "{" and last.startswith('"') and len(tokens) > 1 and tokens[-2] in ("{", ","):
+            tokens.pop()
+        else:
+            break
+    tokens.extend(_CLOSERS[opener] for opener in reversed(stack))
+    return "".join(tokens)
+
+def extract_json_object(text: str, max_candidates: int = 5) -> Tuple[Optional[Dict[str, Any]], str]:
+    """First JSON object in free-form LLM output and how it was obtained
+
+    Returns (object, "clean" | "repaired") or (None, "missing" | "invalid").
+    Prose, code fences and trailing text around the object are ignored; if
+    the first '{' does not start a usable object the next few are tried.
+    """
+    start = text.find("{")
+    if start < 0:
+        return None, "missing"
+
+    for _ in range(max_candidates):
+        # Fast path: well-formed JSON decodes in C straight from the original text
+        try:
+            value, _ = _DECODER.raw_decode(text, start)
+            if isinstance(value, dict):
+                return value, "clean"
+        except ValueError:
+            end, _ = _scan(text, start)
+            try:
+                value = json.loads(repair_json(text[start:end] if end > 0 else text[start:]))
+                if isinstance(value, dict):
+                    return value, "repaired"
+            except ValueError:
+                pass
+        start = text.find("{", start + 1)
+        if start < 0:
+            break
+    return None, "invalid"
+
+# Expected fields of each TAMS stage response; required fields are the ones the final recommendation reads
+STAGE_SCHEMAS = {
+    "stage1": {
+        "classification": {"type": str, "required": True, "enum": ["Likely Genuine", "Requires Further Analysis"]},
+        "confidenceScore": {"type": str, "enum": ["High", "Medium", "Low"]},
+        "rationale": {"type": str},
+        "htmlContent": {"type": str}
+    },
+    "stage2": {
+        "classification": {"type": str, "required": True, "enum": ["Likely Genuine", "Requires Further Analysis"]},
+        "anomalyRating": {"type": str, "enum": ["Low", "Medium", "High"]},
+        "keyAnomalousObservations": {"type": list},
+        "behavioralSummary": {"type": str},
+        "htmlContent": {"type": str}
+    },
+    "stage3": {
+        "keyFindings": {"type": list},
+        "riskFactors": {"type": list},
+        "recommendations": {"type": list},
+        "riskRating": {"type": float, "required": True, "min": 1, "max": 10},
+        "htmlContent": {"type": str}
+    }
+}
+
+def validate_stage_output(stage: str, data: Dict[str, Any]) -> List[str]:
+    """Check (and normalize in place) a stage response; returns the problems found
+
+    Enum values are matched case-insensitively and rewritten to their
+    canonical spelling; numeric strings are converted for number fields.
+    Optional fields may be null.
+    """
+    problems = []
+    for field, rule in STAGE_SCHEMAS.get(stage, {}).items():
+        value = data.get(field)
+        if value is None:
+            if rule.get("required"):
+                problems.append(f"missing required field '{field}'")
+            continue
+
+        if rule["type"] is float:
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                problems.append(f"'{field}' must be a number")
+                continue
+            data[field] = int(number) if number.is_integer() else number
+            if not rule.get("min", number) <= number <= rule.get("max", number):
+                problems.append(f"'{field}' must be between {rule['min']} and {rule['max']}")
+        elif rule["type"] is list:
+            if isinstance(value, str):
+                data[field] = [value]
+            elif not isinstance(value, list):
+                problems.append(f"'{field}' must be an array of strings")
+        elif not isinstance(value, str):
+            problems.append(f"'{field}' must be a string")
+        elif "enum" in rule:
+            canonical = {option.lower(): option for option in rule["enum"]}.get(value.strip().lower())
+            if canonical is None:
+                problems.append(f"'{field}' must be one of {rule['enum']}")
+            else:
+                data[field] = canonical
+    return problems
+
+def build_regeneration_prompt(stage: str, previous: str, problems: List[str], max_previous_chars: int = 1500) -> str:
+    """Short follow-up prompt asking only for a corrected JSON object"""
+    fields = []
+    for field, rule in STAGE_SCHEMAS.get(stage, {}).items():
+        if field == "htmlContent":
+            continue
+        kind = {str: "string", list: "array of strings", float: "number"}[rule["type"]]
+        if "enum" in rule:
+            kind = " | ".join(f'"{option}"' for option in rule["enum"])
+        elif "min" in rule:
+            kind += f" {rule['min']}-{rule['max']}"
+        fields.append(f'  "{field}": {kind}')
+    return (
+        "Your previous answer could not be used: " + "; ".join(problems) + ".\n"
+        f"Previous answer (may be truncated):\n{previous[:max_previous_chars]}\n\n"
+        "Reply with ONLY the corrected JSON object, no prose and no code fences, with these fields:\n"
+        "{\n" + ",\n".join(fields) + "\n}"
+    )
+
+class StageOutputParser:
+    """Extracts stage JSON and counts how often output needed repair or re-generation"""
+
+    def __init__(self):
+        self.stats = {"clean": 0, "repaired": 0, "unparseable": 0, "schema_invalid": 0,
+                      "regenerated": 0, "regeneration_failed": 0}
+
+    def extract(self, text: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        data, status = extract_json_object(text or "")
+        self.stats[status if data is not None else "unparseable"] += 1
+        return data, status
+
+    def get_stats(self) -> Dict[str, Any]:
+        parsed = self.stats["clean"] + self.stats["repaired"] + self.stats["unparseable"]
+        return {**self.stats, "repair_ratio": self.stats["repaired"] / parsed if parsed else 0.0}
+
+# Global stage output parser
+stage_output_parser = StageOutputParser()
@@ -0,0 +1,89 @@
+"""
+LLM Batch - Bounded-concurrency batch execution of LLM prompts
+"""
+
+import asyncio
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, AsyncIterator
+
+class LLMBatchBackend(ABC):
+    """Base class for batch execution strategies
+
+    Backends yield one result dict per prompt as it completes:
+    {"index": int, "response": str | None, "error": str | None, "attempts": int}
+    A provider-native batch API can be plugged in by subclassing this and
+    registering it with CustomLLMClient.register_batch_backend.
+    """
+
+    @abstractmethod
+    async def run(self, client, prompts: List[str], provider: str = None, concurrency: int = 8,
+                  deadline: float = None, retries: int = 2, use_cache: bool = True) -> AsyncIterator[Dict[str, Any]]:
+        """Yield one result per prompt as it completes"""
+        pass
+
+class ConcurrentBatchBackend(LLMBatchBackend):
+    """Runs prompts through client.call_llm with a fixed worker pool at batch priority"""
+
+    def __init__(self, retry_backoff: float = None):
+        self.retry_backoff = retry_backoff if retry_backoff is not None else float(os.getenv("LLM_BATCH_RETRY_BACKOFF_SECONDS", "1.0"))
+
+    async def run(self, client, prompts: List[str], provider: str = None, concurrency: int = 8,
+                  deadline: float = None, retries: int = 2, use_cache: bool = True) -> AsyncIterator[Dict[str, Any]]:
+        total = len(prompts)
+        if total == 0:
+            return
+
+        deadline_at = time.monotonic() + deadline if deadline is not None else None
+        work = asyncio.Queue()
+        for index, prompt in enumerate(prompts):
+            work.put_nowait((index, prompt))
+        results = asyncio.Queue()
+
+        async def worker():
+            while True:
+                try:
+                    index, prompt = work.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await results.put(await self._run_item(client, index, prompt, provider, retries, use_cache))
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(max(1, min(concurrency, total)))]
+        finished = set()
+
+        try:
+            while len(finished) < total:
+                timeout = None
+                if deadline_at is not None:
+                    timeout = deadline_at - time.monotonic()
+                    if timeout <= 0:
+                        break
+                try:
+                    result = await asyncio.wait_for(results.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                finished.add(result["index"])
+                yield result
+        finally:
+            for task in workers:
+                task.cancel()
+
+        # Anything left when the deadline passed is reported, not dropped
+        for index in range(total):
+            if index not in finished:
+                yield {"index": index, "response": None, "error": "Batch deadline exceeded", "attempts": 0}
+
+    async def _run_item(self, client, index: int, prompt: str, provider: str,
+                        retries: int, use_cache: bool) -> Dict[str, Any]:
+        """Call the LLM for one prompt, retrying failures with exponential backoff"""
+        last_error = None
+        for attempt in range(retries + 1):
+            try:
+                response = await client.call_llm(prompt, provider=provider, use_cache=use_cache, priority="batch")
+                return {"index": index, "response": response, "error": None, "attempts": attempt + 1}
+            except Exception as e:
+                last_error = e
+                if attempt < retries:
+                    await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+        return {"index": index, "response": None, "error": str(last_error), "attempts": retries + 1}
@@ -0,0 +1,231 @@
+"""
+LLM Response Cache - In-memory LRU with optional SQLite persistence
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+class LLMResponseCache:
+    """Two-tier (memory LRU + SQLite) cache for LLM responses with per-entry TTL
+
+    Async callers use aget()/aset(), which run the SQLite tier in a worker
+    thread; get()/set() do the same work inline. The disk tier is trimmed
+    to max_disk_entries every disk_trim_interval writes rather than on each
+    one, so it can briefly hold up to that many extra rows.
+    """
+
+    def __init__(self, max_entries: int = None, default_ttl: float = None,
+                 db_path: str = None, max_disk_entries: int = None, enabled: bool = None,
+                 disk_trim_interval: int = None):
+        self.max_entries = max_entries or int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+        self.default_ttl = default_ttl or float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+        self.max_disk_entries = max_disk_entries or int(os.getenv("LLM_CACHE_MAX_DISK_ENTRIES", "50000"))
+        self.db_path = db_path if db_path is not None else os.getenv("LLM_CACHE_DB_PATH")
+        self.enabled = enabled if enabled is not None else os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+        self.disk_trim_interval = disk_trim_interval or int(os.getenv("LLM_CACHE_DISK_TRIM_INTERVAL", "100"))
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        # Memory tier and stats; the SQLite connection has its own lock so disk I/O never holds up memory hits
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._writes_since_trim = 0
+        self.stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0,
+                      "sets": 0, "evictions": 0, "expirations": 0}
+
+        if self.enabled and self.db_path:
+            self._init_disk()
+
+    def _init_disk(self):
+        """Open the SQLite tier in WAL mode"""
+        try:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache(accessed_at)")
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️  LLM disk cache unavailable, using memory only: {e}")
+            self._db = None
+
+    @staticmethod
+    def make_key(provider: str, model: str, payload: Dict[str, Any]) -> str:
+        """Build a cache key from provider, model and the normalized request payload"""
+        normalized = json.dumps(
+            {"provider": provider, "model": model, "payload": payload},
+            sort_keys=True,
+            separators=(",", ":")
+        )
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Get a cached response, or None on miss/expiry"""
+        if not self.enabled:
+            return None
+        hit, value = self._get_memory(key)
+        return value if hit else self._get_disk(key)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """get() for the event loop: a memory miss is looked up on disk in a worker thread"""
+        if not self.enabled:
+            return None
+        hit, value = self._get_memory(key)
+        if hit:
+            return value
+        if self._db is None:
+            return self._get_disk(key)
+        return await asyncio.to_thread(self._get_disk, key)
+
+    def set(self, key: str, value: str, ttl: float = None):
+        """Store a response with a TTL (defaults to the cache TTL)"""
+        if not self.enabled:
+            return
+        expires_at = self._set_memory(key, value, ttl)
+        if self._db is not None:
+            self._set_disk(key, value, expires_at)
+
+    async def aset(self, key: str, value: str, ttl: float = None):
+        """set() for the event loop: the disk write runs in a worker thread"""
+        if not self.enabled:
+            return
+        expires_at = self._set_memory(key, value, ttl)
+        if self._db is not None:
+            await asyncio.to_thread(self._set_disk, key, value, expires_at)
+
+    def _get_memory(self, key: str) -> Tuple[bool, Optional[str]]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.stats["hits"] += 1
+                self.stats["memory_hits"] += 1
+                return True, value
+            del self._memory[key]
+            self.stats["expirations"] += 1
+            return False, None
+
+    def _get_disk(self, key: str) -> Optional[str]:
+        """Look a memory miss up in the SQLite tier, promoting a hit to memory"""
+        row, expired = None, False
+        if self._db is not None:
+            now = time.time()
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    self._db.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                elif row is not None:
+                    self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    row, expired = None, True
+
+        with self._lock:
+            if row is not None:
+                value, expires_at = row
+                self._store_memory(key, value, expires_at)
+                self.stats["hits"] += 1
+                self.stats["disk_hits"] += 1
+                return value
+            if expired:
+                self.stats["expirations"] += 1
+            self.stats["misses"] += 1
+            return None
+
+    def _set_memory(self, key: str, value: str, ttl: float = None) -> float:
+        expires_at = time.time() + (ttl if ttl is not None else self.default_ttl)
+        with self._lock:
+            self._store_memory(key, value, expires_at)
+            self.stats["sets"] += 1
+        return expires_at
+
+    def _set_disk(self, key: str, value: str, expires_at: float):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, time.time())
+            )
+            self._writes_since_trim += 1
+            if self._writes_since_trim >= self.disk_trim_interval:
+                self._trim_disk()
+            self._db.commit()
+
+    def _store_memory(self, key: str, value: str, expires_at: float):
+        """Insert into the memory tier, evicting least recently used entries"""
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _trim_disk(self):
+        """Drop expired and least recently used rows beyond the disk cap (caller holds the db lock)"""
+        self._writes_since_trim = 0
+        self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+        count = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        overflow = count - self.max_disk_entries
+        if overflow > 0:
+            self._db.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,)
+            )
+            with self._lock:
+                self.stats["evictions"] += overflow
+
+    def invalidate(self, key: str):
+        """Remove a single entry from both tiers"""
+        with self._lock:
+            self._memory.pop(key, None)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._db.commit()
+
+    def clear(self):
+        """Remove all entries from both tiers"""
+        with self._lock:
+            self._memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM llm_cache")
+                self._db.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss/eviction counters and tier sizes"""
+        disk_entries = None
+        if self._db is not None:
+            with self._db_lock:
+                disk_entries = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                "enabled": self.enabled,
+                **self.stats,
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "disk_enabled": self._db is not None,
+                "disk_entries": disk_entries,
+                "default_ttl": self.default_ttl
+            }
+
+# Global LLM response cache instance
+llm_response_cache = LLMResponseCache()
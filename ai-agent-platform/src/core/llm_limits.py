@@ -0,0 +1,191 @@
+"""
+LLM Limits - Per-provider token-bucket rate limiting and adaptive concurrency
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import deque
+from typing import Dict, Any
+
+class RateLimitTimeout(Exception):
+    """Raised when a queued LLM call cannot start before its deadline"""
+    pass
+
+class TokenBucket:
+    """Token bucket refilled continuously up to its capacity"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount: float):
+        """Take tokens from the bucket (may go negative to record overshoot)"""
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        """Return unused tokens to the bucket"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+class ProviderLimiter:
+    """RPM/TPM buckets plus an AIMD concurrency limit for one provider and API key"""
+
+    def __init__(self, name: str, rpm: int, tpm: int, initial_concurrency: int,
+                 min_concurrency: int, max_concurrency: int, queue_timeout: float,
+                 batch_share: float = 0.5):
+        self.name = name
+        self.requests = TokenBucket(rpm, rpm / 60.0)
+        self.tokens = TokenBucket(tpm, tpm / 60.0)
+        self.limit = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.batch_share = batch_share
+        self.in_flight = 0
+        self.queued = 0
+        self.interactive_queued = 0
+        self._waiters: deque = deque()
+        self.stats = {
+            "acquired": 0, "timeouts": 0, "successes": 0, "throttled": 0,
+            "max_queue_depth": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0
+        }
+
+    async def acquire(self, tokens: int = 0, timeout: float = None, priority: str = "interactive") -> float:
+        """Wait for a concurrency slot and rate budget; returns seconds spent queued
+
+        "batch" callers may only use batch_share of the concurrency limit and
+        always yield to queued interactive callers.
+        """
+        start = time.monotonic()
+        deadline = start + (timeout if timeout is not None else self.queue_timeout)
+        is_batch = priority == "batch"
+        self.queued += 1
+        if not is_batch:
+            self.interactive_queued += 1
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.queued)
+
+        try:
+            while True:
+                sleep_for = None
+                slots = max(1, int(self.limit * self.batch_share)) if is_batch else max(1, int(self.limit))
+                if self.in_flight < slots and not (is_batch and self.interactive_queued):
+                    sleep_for = max(self.requests.time_until(1), self.tokens.time_until(tokens))
+                    if sleep_for == 0:
+                        self.requests.consume(1)
+                        self.tokens.consume(tokens)
+                        self.in_flight += 1
+                        waited = time.monotonic() - start
+                        self.stats["acquired"] += 1
+                        self.stats["total_wait_seconds"] += waited
+                        self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], waited)
+                        return waited
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats["timeouts"] += 1
+                    raise RateLimitTimeout(f"LLM rate limit queue deadline exceeded for {self.name}")
+
+                # Sleep until budget refills or a slot is released, whichever is first
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+                try:
+                    await asyncio.wait_for(waiter, min(sleep_for or remaining, remaining))
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+        finally:
+            self.queued -= 1
+            if not is_batch:
+                self.interactive_queued -= 1
+
+    def release(self, outcome: str = "success", tokens_refund: int = 0):
+        """Release a slot and adapt the concurrency limit to the call outcome
+
+        outcome is "success" (additive increase), "throttled" (429/5xx/timeout,
+        multiplicative decrease) or anything else (limit unchanged).
+        """
+        self.in_flight = max(0, self.in_flight - 1)
+
+        if outcome == "success":
+            self.stats["successes"] += 1
+            self.limit = min(self.max_concurrency, self.limit + 1.0 / max(self.limit, 1.0))
+        elif outcome == "throttled":
+            self.stats["throttled"] += 1
+            self.limit = max(self.min_concurrency, self.limit / 2.0)
+
+        if tokens_refund > 0:
+            self.tokens.refund(tokens_refund)
+
+        # Wake every waiter: a batch waiter may not be allowed to take the slot
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue depth, wait time and current limits"""
+        acquired = self.stats["acquired"]
+        return {
+            **self.stats,
+            "concurrency_limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queue_depth": self.queued,
+            "avg_wait_ms": (self.stats["total_wait_seconds"] / acquired * 1000) if acquired else 0.0,
+            "requests_available": round(self.requests.tokens, 2),
+            "tokens_available": round(self.tokens.tokens, 2)
+        }
+
+class LLMRateLimiter:
+    """Registry of per-provider, per-API-key limiters configured from the environment"""
+
+    def __init__(self):
+        self.limiters: Dict[str, ProviderLimiter] = {}
+
+    def _setting(self, provider: str, name: str, default: str) -> str:
+        """Read LLM_<PROVIDER>_<NAME>, falling back to LLM_<NAME>"""
+        return os.getenv(f"LLM_{provider.upper()}_{name}", os.getenv(f"LLM_{name}", default))
+
+    def get_limiter(self, provider: str, api_key: str = "") -> ProviderLimiter:
+        """Get (or create) the limiter for a provider and API key"""
+        key_id = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8] if api_key else "nokey"
+        name = f"{provider}:{key_id}"
+
+        if name not in self.limiters:
+            self.limiters[name] = ProviderLimiter(
+                name=name,
+                rpm=int(self._setting(provider, "RPM_LIMIT", "500")),
+                tpm=int(self._setting(provider, "TPM_LIMIT", "150000")),
+                initial_concurrency=int(self._setting(provider, "INITIAL_CONCURRENCY", "8")),
+                min_concurrency=int(self._setting(provider, "MIN_CONCURRENCY", "1")),
+                max_concurrency=int(self._setting(provider, "MAX_CONCURRENCY", "32")),
+                queue_timeout=float(self._setting(provider, "QUEUE_TIMEOUT_SECONDS", "60")),
+                batch_share=float(self._setting(provider, "BATCH_CONCURRENCY_SHARE", "0.5"))
+            )
+        return self.limiters[name]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get stats for every limiter"""
+        return {name: limiter.get_stats() for name, limiter in self.limiters.items()}
+
+# Global LLM rate limiter registry
+llm_rate_limiter = LLMRateLimiter()
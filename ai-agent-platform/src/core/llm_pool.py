@@ -0,0 +1,109 @@
+"""
+LLM Session Pool - Long-lived, per-provider HTTP connection pools
+"""
+
+import asyncio
+import aiohttp
+import os
+from typing import Dict, Any
+from urllib.parse import urlsplit
+
+class LLMSessionPool:
+    """Process-wide pool of aiohttp sessions, one per LLM provider"""
+
+    def __init__(self, limit: int = None, limit_per_host: int = None,
+                 keepalive_timeout: float = None, dns_cache_ttl: int = None):
+        self.limit = limit or int(os.getenv("LLM_POOL_LIMIT", "100"))
+        self.limit_per_host = limit_per_host or int(os.getenv("LLM_POOL_LIMIT_PER_HOST", "20"))
+        self.keepalive_timeout = keepalive_timeout or float(os.getenv("LLM_POOL_KEEPALIVE_SECONDS", "30"))
+        self.dns_cache_ttl = dns_cache_ttl or int(os.getenv("LLM_POOL_DNS_CACHE_TTL", "300"))
+        self.sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._session_loops: Dict[str, asyncio.AbstractEventLoop] = {}
+        self.requests_total: Dict[str, int] = {}
+
+    async def get_session(self, provider: str) -> aiohttp.ClientSession:
+        """Get the pooled session for a provider, creating it on first use"""
+        loop = asyncio.get_running_loop()
+        session = self.sessions.get(provider)
+
+        # Sessions are bound to the loop that created them; rebuild if stale
+        if session is None or session.closed or self._session_loops.get(provider) is not loop:
+            session = self._create_session()
+            self.sessions[provider] = session
+            self._session_loops[provider] = loop
+
+        self.requests_total[provider] = self.requests_total.get(provider, 0) + 1
+        return session
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        """Create a session with a keep-alive connector and DNS cache"""
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+            use_dns_cache=True
+        )
+        return aiohttp.ClientSession(connector=connector)
+
+    async def warm_up(self, endpoints: Dict[str, str], timeout: float = 5.0) -> Dict[str, bool]:
+        """Open sessions and pre-establish a connection to each provider endpoint"""
+        results = {}
+
+        async def _warm(provider: str, url: str):
+            session = await self.get_session(provider)
+            parts = urlsplit(url)
+            origin = f"{parts.scheme}://{parts.netloc}/"
+            try:
+                async with session.head(origin, timeout=aiohttp.ClientTimeout(total=timeout)):
+                    pass
+                results[provider] = True
+            except Exception as e:
+                print(f"⚠️  LLM pool warm-up failed for {provider}: {e}")
+                results[provider] = False
+
+        await asyncio.gather(*(_warm(provider, url) for provider, url in endpoints.items()))
+        return results
+
+    async def close(self):
+        """Close all pooled sessions"""
+        for provider, session in list(self.sessions.items()):
+            if not session.closed:
+                try:
+                    await session.close()
+                except RuntimeError:
+                    # Owning event loop already closed; connections are gone with it
+                    pass
+        self.sessions.clear()
+        self._session_loops.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get open, idle and in-use connection counts per provider"""
+        providers = {}
+
+        for provider, session in self.sessions.items():
+            connector = session.connector
+            idle = 0
+            in_use = 0
+            if connector is not None and not session.closed:
+                idle = sum(len(conns) for conns in getattr(connector, "_conns", {}).values())
+                in_use = len(getattr(connector, "_acquired", ()))
+
+            providers[provider] = {
+                "open_connections": idle + in_use,
+                "idle_connections": idle,
+                "in_use_connections": in_use,
+                "requests_total": self.requests_total.get(provider, 0),
+                "closed": session.closed
+            }
+
+        return {
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host,
+            "keepalive_timeout": self.keepalive_timeout,
+            "dns_cache_ttl": self.dns_cache_ttl,
+            "providers": providers
+        }
+
+# Global LLM session pool instance
+llm_session_pool = LLMSessionPool()
@@ -0,0 +1,182 @@
+"""
+LLM Routing - Circuit breakers and latency-aware provider selection
+"""
+
+import os
+import time
+from collections import deque
+from typing import Dict, Any, List
+
+class CircuitOpenError(Exception):
+    """Raised when a provider's circuit breaker rejects a call"""
+    pass
+
+class CircuitBreaker:
+    """Closed/open/half-open circuit breaker for one provider"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = None, recovery_timeout: float = None,
+                 half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold or int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+        self.recovery_timeout = recovery_timeout or float(os.getenv("LLM_BREAKER_RECOVERY_SECONDS", "30"))
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.stats = {"rejected": 0, "opened": 0}
+
+    def allow_request(self) -> bool:
+        """Whether a call may be attempted now (claims a half-open trial slot)"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                self.stats["rejected"] += 1
+                return False
+            self.state = self.HALF_OPEN
+            self.half_open_calls = 0
+
+        if self.state == self.HALF_OPEN:
+            if self.half_open_calls >= self.half_open_max_calls:
+                self.stats["rejected"] += 1
+                return False
+            self.half_open_calls += 1
+
+        return True
+
+    def is_available(self) -> bool:
+        """Whether a call would currently be allowed, without claiming a slot"""
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.recovery_timeout
+        if self.state == self.HALF_OPEN:
+            return self.half_open_calls < self.half_open_max_calls
+        return True
+
+    def release_trial(self):
+        """Return a half-open trial slot claimed by a call that ended without an outcome
+
+        Rate-limit timeouts, cancellations (e.g. a losing hedge) and client-side
+        errors neither close nor re-open the circuit; without this the slot
+        stays claimed and the provider is never tried again.
+        """
+        if self.state == self.HALF_OPEN and self.half_open_calls > 0:
+            self.half_open_calls -= 1
+
+    def record_success(self):
+        """Close the circuit after a successful call"""
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.half_open_calls = 0
+
+    def record_failure(self):
+        """Count a failure, opening the circuit at the threshold or on a failed trial"""
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.stats["opened"] += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.consecutive_failures, **self.stats}
+
+class ProviderHealth:
+    """EWMA latency and error rate plus a window of recent latencies"""
+
+    def __init__(self, alpha: float = 0.3, window: int = 200):
+        self.alpha = alpha
+        self.ewma_latency = None
+        self.ewma_error_rate = 0.0
+        self.recent_latencies = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+
+    def record(self, latency: float, success: bool):
+        """Fold one call outcome into the moving averages"""
+        self.calls += 1
+        if success:
+            self.recent_latencies.append(latency)
+            self.ewma_latency = latency if self.ewma_latency is None else (
+                self.alpha * latency + (1 - self.alpha) * self.ewma_latency
+            )
+        else:
+            self.errors += 1
+        self.ewma_error_rate = self.alpha * (0.0 if success else 1.0) + (1 - self.alpha) * self.ewma_error_rate
+
+    def latency_percentile(self, percentile: float) -> float:
+        """Latency at the given percentile (0-100) of the recent window, or None"""
+        if not self.recent_latencies:
+            return None
+        ordered = sorted(self.recent_latencies)
+        index = min(len(ordered) - 1, int(round(percentile / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "ewma_latency_ms": self.ewma_latency * 1000 if self.ewma_latency is not None else None,
+            "ewma_error_rate": round(self.ewma_error_rate, 4),
+            "p50_latency_ms": (self.latency_percentile(50) or 0.0) * 1000,
+            "p95_latency_ms": (self.latency_percentile(95) or 0.0) * 1000
+        }
+
+class LLMRouter:
+    """Orders candidate providers by health and keeps one circuit breaker per provider"""
+
+    def __init__(self, error_penalty: float = None):
+        self.error_penalty = error_penalty or float(os.getenv("LLM_ROUTING_ERROR_PENALTY", "10"))
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.health: Dict[str, ProviderHealth] = {}
+
+    def get_breaker(self, provider: str) -> CircuitBreaker:
+        if provider not in self.breakers:
+            self.breakers[provider] = CircuitBreaker()
+        return self.breakers[provider]
+
+    def get_health(self, provider: str) -> ProviderHealth:
+        if provider not in self.health:
+            self.health[provider] = ProviderHealth()
+        return self.health[provider]
+
+    def record(self, provider: str, latency: float, success: bool):
+        """Record a provider call outcome for routing and its breaker"""
+        self.get_health(provider).record(latency, success)
+        breaker = self.get_breaker(provider)
+        if success:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+
+    def rank(self, candidates: List[str]) -> List[str]:
+        """Order candidates best-first, skipping providers whose circuit is open
+
+        Score is EWMA latency scaled up by EWMA error rate; providers without
+        latency samples keep their configured priority ahead of measured ones
+        so each gets probed.
+        """
+        available = [p for p in candidates if self.get_breaker(p).is_available()]
+
+        def score(item):
+            priority, provider = item
+            health = self.get_health(provider)
+            if health.ewma_latency is None:
+                return (0, priority)
+            return (1, health.ewma_latency * (1 + self.error_penalty * health.ewma_error_rate))
+
+        return [provider for _, provider in sorted(enumerate(available), key=score)]
+
+    def get_stats(self) -> Dict[str, Any]:
+        providers = set(self.breakers) | set(self.health)
+        return {
+            provider: {
+                "circuit": self.get_breaker(provider).get_stats(),
+                **self.get_health(provider).get_stats()
+            }
+            for provider in sorted(providers)
+        }
+
+# Global LLM router instance
+llm_router = LLMRouter()
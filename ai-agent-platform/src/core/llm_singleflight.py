@@ -0,0 +1,64 @@
+"""
+LLM Single-Flight - Coalesce identical in-flight LLM requests
+"""
+
+import asyncio
+from typing import Dict, Any, Callable, Awaitable
+
+class _Flight:
+    """A shared in-flight call and the number of callers waiting on it"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """Lets concurrent callers with the same key share one in-flight call"""
+
+    def __init__(self):
+        self._in_flight: Dict[str, _Flight] = {}
+        self.stats = {"leaders": 0, "coalesced": 0, "failures": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn once per key; concurrent callers with the same key await its result
+
+        The shared call runs as its own task and is only cancelled once every
+        caller waiting on it has been cancelled.
+        """
+        flight = self._in_flight.get(key)
+        if flight is not None and not flight.task.done():
+            self.stats["coalesced"] += 1
+        else:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            flight.task.add_done_callback(lambda task: self._finish(key, flight))
+            self._in_flight[key] = flight
+            self.stats["leaders"] += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _finish(self, key: str, flight: _Flight):
+        """Drop a completed flight and mark its error as retrieved"""
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+        if not flight.task.cancelled() and flight.task.exception() is not None:
+            self.stats["failures"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get coalescing counters"""
+        calls = self.stats["leaders"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "in_flight": len(self._in_flight),
+            "coalesced_ratio": self.stats["coalesced"] / calls if calls else 0.0
+        }
+
+# Global single-flight group for LLM requests
+llm_single_flight = SingleFlight()
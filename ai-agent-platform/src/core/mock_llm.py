@@ -0,0 +1,276 @@
+"""
+Mock LLM Server - Local stand-in for OpenAI, Anthropic and Ollama endpoints for load testing
+"""
+
+import asyncio
+import json
+import math
+import os
+import random
+from typing import Dict, Any, List, Optional, Tuple
+
+from aiohttp import web
+
+from .tokens import token_counter
+
+# Canned TAMS stage responses, shaped like the v1.1 prompt outputs
+MOCK_STAGE_RESPONSES = {
+    "stage1": {
+        "classification": "Requires Further Analysis",
+        "confidenceScore": "Medium",
+        "rationale": "Mock LLM: no genuine alert matched 3 of 4 attributes",
+        "htmlContent": "<h4 style='color: red; text-align: left;'>⚠️ Requires Further Analysis</h4>"
+    },
+    "stage2": {
+        "classification": "Requires Further Analysis",
+        "anomalyRating": "Medium",
+        "keyAnomalousObservations": ["Mock LLM: amount above user average", "Mock LLM: merchant not seen before"],
+        "behavioralSummary": "Mock LLM behavioral summary",
+        "htmlContent": "<h4 style='color: black; font-weight: bold;'>Anomaly Rating: <span style='color: orange;'>Medium</span></h4>"
+    },
+    "stage3": {
+        "keyFindings": ["Mock LLM finding"],
+        "riskFactors": ["Mock LLM risk factor"],
+        "recommendations": ["Mock LLM recommendation"],
+        "riskRating": 5,
+        "htmlContent": "<div style='text-align: center;'>5</div>"
+    }
+}
+
+# Phrases that identify each TAMS stage prompt
+STAGE_MARKERS = [
+    ("stage3", "structured risk assessment"),
+    ("stage2", "behavioral anomalies"),
+    ("stage1", "genuine transaction patterns")
+]
+
+class FixedLatency:
+    """Always the same latency"""
+
+    def __init__(self, ms: float):
+        self.ms = ms
+
+    def sample(self, rng: random.Random) -> float:
+        return self.ms / 1000.0
+
+class LognormalLatency:
+    """Lognormal latency around a median, the usual shape of LLM response times"""
+
+    def __init__(self, median_ms: float, sigma: float = 0.5):
+        self.median_ms = median_ms
+        self.sigma = sigma
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.lognormvariate(math.log(self.median_ms), self.sigma) / 1000.0
+
+class HistogramLatency:
+    """Replays a latency histogram of (latency_ms, count) buckets, e.g. from production metrics"""
+
+    def __init__(self, buckets: List[Tuple[float, float]]):
+        if not buckets:
+            raise ValueError("Latency histogram needs at least one bucket")
+        self.latencies = [float(latency) for latency, _ in buckets]
+        self.weights = [float(count) for _, count in buckets]
+
+    @classmethod
+    def from_file(cls, path: str) -> "HistogramLatency":
+        """Load buckets from a JSON file: [[latency_ms, count], ...] or {"latency_ms": count}"""
+        with open(path) as f:
+            data = json.load(f)
+        buckets = list(data.items()) if isinstance(data, dict) else data
+        return cls(buckets)
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.choices(self.latencies, weights=self.weights)[0] / 1000.0
+
+def parse_latency(spec: str):
+    """Build a latency distribution from "fixed:MS", "lognormal:MEDIAN_MS[,SIGMA]" or "histogram:PATH" """
+    kind, _, args = spec.partition(":")
+    if kind == "fixed":
+        return FixedLatency(float(args or 0))
+    if kind == "lognormal":
+        median, _, sigma = args.partition(",")
+        return LognormalLatency(float(median), float(sigma or 0.5))
+    if kind == "histogram":
+        return HistogramLatency.from_file(args)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+class MockLLMServer:
+    """aiohttp server answering chat/messages/generate calls with canned TAMS JSON
+
+    Every request waits for a latency sampled from the configured
+    distribution; a configurable share fails with 429, 5xx or hangs past the
+    client's timeout. Streaming requests spread the latency over the chunks,
+    with time_to_first_token_share of it spent before the first one.
+    """
+
+    def __init__(self, latency=None, error_429_rate: float = None, error_5xx_rate: float = None,
+                 timeout_rate: float = None, timeout_seconds: float = None, stream_chunk_chars: int = 16,
+                 time_to_first_token_share: float = 0.3, seed: int = None):
+        self.latency = latency or parse_latency(os.getenv("MOCK_LLM_LATENCY", "lognormal:800,0.5"))
+        self.error_429_rate = error_429_rate if error_429_rate is not None else float(os.getenv("MOCK_LLM_429_RATE", "0"))
+        self.error_5xx_rate = error_5xx_rate if error_5xx_rate is not None else float(os.getenv("MOCK_LLM_5XX_RATE", "0"))
+        self.timeout_rate = timeout_rate if timeout_rate is not None else float(os.getenv("MOCK_LLM_TIMEOUT_RATE", "0"))
+        self.timeout_seconds = timeout_seconds if timeout_seconds is not None else float(os.getenv("MOCK_LLM_TIMEOUT_SECONDS", "120"))
+        self.stream_chunk_chars = stream_chunk_chars
+        self.time_to_first_token_share = time_to_first_token_share
+        self.rng = random.Random(seed)
+        self.runner: Optional[web.AppRunner] = None
+        self.stats = {"requests": 0, "streamed": 0, "ok": 0, "429": 0, "5xx": 0, "timeouts": 0}
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/", self.handle_health)
+        app.router.add_get("/stats", self.handle_stats)
+        app.router.add_post("/v1/chat/completions", self.handle_openai)
+        app.router.add_post("/api/chat/completions", self.handle_openai)
+        app.router.add_post("/v1/messages", self.handle_anthropic)
+        app.router.add_post("/api/generate", self.handle_ollama)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8089) -> str:
+        """Start serving in the current event loop; returns the base URL (port 0 picks a free port)"""
+        self.runner = web.AppRunner(self.create_app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        bound_host, bound_port = self.runner.addresses[0][:2]
+        return f"http://{bound_host}:{bound_port}"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+    async def handle_openai(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+        model = body.get("model", "mock")
+
+        def complete(text: str, prompt_tokens: int, completion_tokens: int) -> Dict[str, Any]:
+            return {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens}
+            }
+
+        def chunk(delta: str) -> str:
+            event = {"object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]}
+            return f"data: {json.dumps(event)}\n\n"
+
+        def end() -> str:
+            event = {"object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            return f"data: {json.dumps(event)}\n\ndata: [DONE]\n\n"
+
+        return await self._respond(request, body, prompt, complete, chunk, end, "text/event-stream")
+
+    async def handle_anthropic(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+        model = body.get("model", "mock")
+
+        def complete(text: str, prompt_tokens: int, completion_tokens: int) -> Dict[str, Any]:
+            return {
+                "id": "msg_mock",
+                "type": "message",
+                "role": "assistant",
+                "model": model,
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn",
+                "usage": {"input_tokens": prompt_tokens, "output_tokens": completion_tokens}
+            }
+
+        def chunk(delta: str) -> str:
+            event = {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": delta}}
+            return f"event: content_block_delta\ndata: {json.dumps(event)}\n\n"
+
+        def end() -> str:
+            return f"event: message_stop\ndata: {json.dumps({'type': 'message_stop'})}\n\n"
+
+        return await self._respond(request, body, prompt, complete, chunk, end, "text/event-stream")
+
+    async def handle_ollama(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        prompt = body.get("prompt", "")
+        model = body.get("model", "mock")
+
+        def complete(text: str, prompt_tokens: int, completion_tokens: int) -> Dict[str, Any]:
+            return {"model": model, "response": text, "done": True,
+                    "prompt_eval_count": prompt_tokens, "eval_count": completion_tokens}
+
+        def chunk(delta: str) -> str:
+            return json.dumps({"model": model, "response": delta, "done": False}) + "\n"
+
+        def end() -> str:
+            return json.dumps({"model": model, "response": "", "done": True}) + "\n"
+
+        # Ollama streams by default
+        body.setdefault("stream", True)
+        return await self._respond(request, body, prompt, complete, chunk, end, "application/x-ndjson")
+
+    async def _respond(self, request: web.Request, body: Dict[str, Any], prompt: str,
+                       complete, chunk, end, stream_content_type: str) -> web.StreamResponse:
+        """Inject faults, wait out the sampled latency and answer whole or streamed"""
+        self.stats["requests"] += 1
+        latency = self.latency.sample(self.rng)
+
+        roll = self.rng.random()
+        if roll < self.error_429_rate:
+            self.stats["429"] += 1
+            await asyncio.sleep(min(latency, 0.05))
+            return web.json_response({"error": {"type": "rate_limit_error", "message": "Mock rate limit"}},
+                                     status=429, headers={"Retry-After": "1"})
+        roll -= self.error_429_rate
+        if roll < self.error_5xx_rate:
+            self.stats["5xx"] += 1
+            await asyncio.sleep(latency)
+            return web.json_response({"error": {"type": "server_error", "message": "Mock upstream failure"}},
+                                     status=self.rng.choice([500, 502, 503]))
+        roll -= self.error_5xx_rate
+        if roll < self.timeout_rate:
+            self.stats["timeouts"] += 1
+            await asyncio.sleep(self.timeout_seconds)
+            return web.json_response({"error": {"type": "timeout", "message": "Mock timeout"}}, status=504)
+
+        text = json.dumps(self.response_for(prompt))
+        prompt_tokens = token_counter.count(prompt)
+        completion_tokens = token_counter.count(text)
+        self.stats["ok"] += 1
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+            return web.json_response(complete(text, prompt_tokens, completion_tokens))
+
+        self.stats["streamed"] += 1
+        pieces = [text[i:i + self.stream_chunk_chars] for i in range(0, len(text), self.stream_chunk_chars)]
+        response = web.StreamResponse(headers={"Content-Type": stream_content_type})
+        await response.prepare(request)
+
+        await asyncio.sleep(latency * self.time_to_first_token_share)
+        gap = latency * (1 - self.time_to_first_token_share) / max(len(pieces), 1)
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(gap)
+            await response.write(chunk(piece).encode("utf-8"))
+        await response.write(end().encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    def response_for(self, prompt: str) -> Dict[str, Any]:
+        """Canned JSON for the TAMS stage the prompt belongs to"""
+        lowered = prompt.lower()
+        for stage, marker in STAGE_MARKERS:
+            if marker in lowered:
+                return MOCK_STAGE_RESPONSES[stage]
+        return MOCK_STAGE_RESPONSES["stage3"]
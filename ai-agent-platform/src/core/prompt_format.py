@@ -0,0 +1,114 @@
+"""
+Prompt Format - Token-compact serialization of the data embedded in TAMS prompts
+"""
+
+import csv
+import io
+import json
+from typing import Dict, Any, List, Sequence
+
+class JSONPromptSerializer:
+    """Original v1.1 serialization: pretty-printed JSON"""
+
+    name = "json"
+
+    def records(self, rows: List[Dict[str, Any]], dictionary: Sequence[str] = ()) -> str:
+        return json.dumps(rows, indent=2)
+
+    def items(self, values: List[str]) -> str:
+        return json.dumps(values, indent=2)
+
+class CompactPromptSerializer:
+    """Renders homogeneous records as a header plus delimited rows
+
+    Keys are written once in the header instead of on every record, floats
+    are rounded to `decimals` places, and values of the `dictionary`
+    columns that repeat are replaced by short codes (m1, m2, ...) defined
+    in a legend table above the rows. Lists of strings become numbered
+    lines. Records with nested values fall back to single-line JSON.
+    """
+
+    name = "compact"
+
+    def __init__(self, delimiter: str = ",", decimals: int = 2):
+        self.delimiter = delimiter
+        self.decimals = decimals
+
+    def _cell(self, value: Any) -> str:
+        if value is None:
+            return ""
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        if isinstance(value, float):
+            return f"{round(value, self.decimals):g}" if abs(value) < 1e15 else repr(value)
+        return str(value)
+
+    def _table(self, header: List[str], rows: List[List[str]]) -> str:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=self.delimiter, lineterminator="\n")
+        writer.writerow(header)
+        writer.writerows(rows)
+        return buffer.getvalue().rstrip("\n")
+
+    def records(self, rows: List[Dict[str, Any]], dictionary: Sequence[str] = ()) -> str:
+        if not rows:
+            return "(none)"
+        if any(not isinstance(row, dict) or any(isinstance(v, (dict, list)) for v in row.values()) for row in rows):
+            return json.dumps(rows, separators=(",", ":"))
+
+        # Union of keys in first-seen order; missing values are left empty
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        cells = [[self._cell(row.get(column)) for column in columns] for row in rows]
+
+        legends = []
+        for column in dictionary:
+            if column not in columns:
+                continue
+            index = columns.index(column)
+            counts: Dict[str, int] = {}
+            for line in cells:
+                counts[line[index]] = counts.get(line[index], 0) + 1
+            # Only values that repeat and are longer than their code are worth encoding
+            codes: Dict[str, str] = {}
+            for value, count in counts.items():
+                if count > 1 and len(value) > 3:
+                    codes[value] = f"{column[0]}{len(codes) + 1}"
+            if not codes:
+                continue
+            for line in cells:
+                line[index] = codes.get(line[index], line[index])
+            legends.append(f"{column} codes:\n" + self._table(["code", column], [[c, v] for v, c in codes.items()]))
+
+        table = self._table(columns, cells)
+        return "\n".join(legends + [table])
+
+    def items(self, values: List[str]) -> str:
+        # Indented values are sub-points of the previous item and keep their own marker
+        lines, number = [], 0
+        for value in values:
+            if value[:1].isspace():
+                lines.append(value)
+            else:
+                number += 1
+                lines.append(f"{number}. {value}")
+        return "\n".join(lines)
+
+# TAMS prompt versions, oldest first; each keeps the changes of the versions before it
+#   v1.1 original prompts, v1.2 computed Stage 2 features, v1.3 compact tables,
+#   v1.4 structured fields only (htmlContent rendered server-side), v1.5 SOP rule checks as facts
+PROMPT_VERSIONS = ["v1.1", "v1.2", "v1.3", "v1.4", "v1.5"]
+
+def prompt_version_at_least(prompt_version: str, minimum: str) -> bool:
+    """Whether a prompt version includes the changes made in `minimum`; unknown versions behave as v1.1"""
+    if prompt_version not in PROMPT_VERSIONS:
+        return minimum == "v1.1"
+    return PROMPT_VERSIONS.index(prompt_version) >= PROMPT_VERSIONS.index(minimum)
+
+PROMPT_SERIALIZERS = {
+    "json": JSONPromptSerializer(),
+    "compact": CompactPromptSerializer()
+}
+
+def serializer_for(prompt_version: str):
+    """Serializer used to embed data in prompts of the given version"""
+    return PROMPT_SERIALIZERS["compact" if prompt_version_at_least(prompt_version, "v1.3") else "json"]
@@ -6,6 +6,7 @@ from langchain.schema import Document
 from typing import List, Dict, Any, Optional
 import os
 import chromadb
+from .tokens import token_counter
 
 class RAGManager:
     """Retrieval-Augmented Generation manager"""
@@ -154,8 +155,7 @@ class RAGManager:
         
         for result in results:
             content = result["content"]
-            # Rough token estimation (1 token ≈ 4 characters)
-            content_tokens = len(content) // 4
+            content_tokens = token_counter.count(content)
             
             if current_tokens + content_tokens > max_tokens:
                 break
@@ -0,0 +1,184 @@
+"""
+Reference Data - Cached risk-intelligence, SOP and MCC lookup tables for TAMS Stage 3
+"""
+
+import asyncio
+import os
+import re
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+
+import numpy as np
+
+# Dense MCC risk levels; index is the 4-digit MCC
+MCC_RISK_LEVELS = ["Unknown", "Low Risk", "Medium Risk", "High Risk"]
+MCC_TABLE_SIZE = 10000
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+def normalize_reference_name(name: str) -> str:
+    """Lowercase and strip everything but letters and digits ("Fraud-Store 2" -> "fraudstore2")"""
+    return _NON_ALNUM.sub("", str(name or "").lower())
+
+def _normalize_code(code: str) -> str:
+    return str(code or "").strip().upper()
+
+class MerchantMatcher:
+    """Aho-Corasick automaton over normalized high-risk merchant names
+
+    A merchant is a hit when any listed name occurs inside its normalized
+    form, so descriptor variants such as "FRAUDULENT STORE 2 LONDON" or
+    "fraudulentstore2*1234" match "FraudulentStore2". Names shorter than
+    min_length are ignored to keep substring hits meaningful.
+    """
+
+    def __init__(self, names: List[str], min_length: int = 4):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+
+        for name in names:
+            pattern = normalize_reference_name(name)
+            if len(pattern) < min_length:
+                continue
+            node = 0
+            for char in pattern:
+                if char not in self._goto[node]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[node][char] = len(self._goto) - 1
+                node = self._goto[node][char]
+            self._output[node].append(name)
+
+        # Breadth-first failure links
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find(self, merchant: str) -> List[str]:
+        """Listed names occurring in the merchant, in the order they end"""
+        hits, node = [], 0
+        for char in normalize_reference_name(merchant):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            hits.extend(self._output[node])
+        return list(dict.fromkeys(hits))
+
+class ReferenceData:
+    """Immutable snapshot of the Stage 3 reference tables, compiled for lookups"""
+
+    def __init__(self, risk_intelligence: Dict[str, Any], sop_checklist: List[str]):
+        self.risk_intelligence = risk_intelligence
+        self.sop_checklist = sop_checklist
+        self.loaded_at = time.monotonic()
+
+        self.merchant_matcher = MerchantMatcher(risk_intelligence.get("high_risk_merchants", []))
+        self.high_risk_countries = frozenset(_normalize_code(c) for c in risk_intelligence.get("high_risk_countries", []))
+        self.risky_currencies = frozenset(_normalize_code(c) for c in risk_intelligence.get("risky_currencies", []))
+
+        self.mcc_risk = np.zeros(MCC_TABLE_SIZE, dtype=np.int8)
+        for mcc, level in risk_intelligence.get("mcc_risk_data", {}).items():
+            if str(mcc).isdigit() and int(mcc) < MCC_TABLE_SIZE and level in MCC_RISK_LEVELS:
+                self.mcc_risk[int(mcc)] = MCC_RISK_LEVELS.index(level)
+
+    def mcc_risk_level(self, mcc: Optional[str]) -> str:
+        mcc = str(mcc or "").strip()
+        if not mcc.isdigit() or int(mcc) >= MCC_TABLE_SIZE:
+            return "Unknown"
+        return MCC_RISK_LEVELS[self.mcc_risk[int(mcc)]]
+
+    def flags_for(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Exact Stage 3 risk checks for one alert; None means the alert lacks that field"""
+        merchant_hits = self.merchant_matcher.find(input_data.get("merchant"))
+        country = _normalize_code(input_data.get("merchant_country"))
+        currency = _normalize_code(input_data.get("currency"))
+        return {
+            "high_risk_merchant": bool(merchant_hits),
+            "matched_merchants": merchant_hits,
+            "high_risk_country": (country in self.high_risk_countries) if country else None,
+            "risky_currency": (currency in self.risky_currencies) if currency else None,
+            "mcc_risk": self.mcc_risk_level(input_data.get("mcc"))
+        }
+
+class ReferenceDataCache:
+    """TTL cache of the compiled reference tables with optional background refresh
+
+    get() reloads inline once the snapshot is older than ttl_seconds;
+    concurrent callers share one reload. After start(), a background task
+    refreshes every ttl_seconds so alerts never wait on the sources. A
+    failed refresh keeps serving the previous snapshot.
+    """
+
+    def __init__(self, loader: Callable[[], Awaitable[ReferenceData]], ttl_seconds: float = None):
+        self.loader = loader
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("TAMS_REFERENCE_TTL_SECONDS", "300"))
+        self._snapshot: Optional[ReferenceData] = None
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.stats = {"hits": 0, "loads": 0, "refresh_errors": 0}
+
+    def _fresh(self) -> bool:
+        return self._snapshot is not None and time.monotonic() - self._snapshot.loaded_at < self.ttl_seconds
+
+    async def get(self) -> ReferenceData:
+        background = self._refresh_task is not None and not self._refresh_task.done()
+        if self._fresh() or (background and self._snapshot is not None):
+            self.stats["hits"] += 1
+            return self._snapshot
+        async with self._lock:
+            if not self._fresh():
+                await self.refresh()
+            return self._snapshot
+
+    async def refresh(self) -> ReferenceData:
+        """Reload the tables now; keeps the old snapshot if the sources fail"""
+        try:
+            self._snapshot = await self.loader()
+            self.stats["loads"] += 1
+        except Exception as e:
+            self.stats["refresh_errors"] += 1
+            if self._snapshot is None:
+                raise
+            print(f"⚠️  TAMS reference data refresh failed, serving previous snapshot: {e}")
+        return self._snapshot
+
+    async def start(self):
+        """Load the tables and keep them fresh in the background"""
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        await self.refresh()
+        self._refresh_task = asyncio.ensure_future(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.ttl_seconds)
+            await self.refresh()
+
+    def get_stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            **self.stats,
+            "ttl_seconds": self.ttl_seconds,
+            "background_refresh": self._refresh_task is not None and not self._refresh_task.done(),
+            "age_seconds": time.monotonic() - snapshot.loaded_at if snapshot else None,
+            "high_risk_merchants": len(snapshot.risk_intelligence.get("high_risk_merchants", [])) if snapshot else 0
+        }
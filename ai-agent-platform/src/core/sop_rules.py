@@ -0,0 +1,130 @@
+"""
+SOP Rules - Deterministic evaluation of the arithmetic and lookup checks in the TAMS Stage 3 SOP
+"""
+
+import os
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from .reference_data import ReferenceData
+from .html_render import render_stage3_html
+
+# Points each fired rule adds to the rules-only risk score (base 1, capped at 10)
+SOP_RULE_WEIGHTS = {
+    "high_transaction_credit_utilization": 3,
+    "high_risk_merchant": 3,
+    "high_risk_country": 2,
+    "risky_currency": 1,
+    "high_risk_mcc": 2,
+    "medium_risk_mcc": 1
+}
+
+# Rules that keep an alert from being short-circuited; a medium-risk MCC alone is too common to block skips
+SHORT_CIRCUIT_BLOCKING_RULES = frozenset(SOP_RULE_WEIGHTS) - {"medium_risk_mcc"}
+
+# Stage 2 context also counts when the rules stand in for the LLM
+ANOMALY_WEIGHTS = {"High": 2, "Medium": 1}
+
+RULE_FINDINGS = {
+    "high_transaction_credit_utilization": "High Transaction Credit Utilization",
+    "high_risk_merchant": "Merchant is on the High-Risk Merchant List",
+    "high_risk_country": "Merchant country is high-risk",
+    "risky_currency": "Transaction currency is risky for the user",
+    "high_risk_mcc": "MCC is high-risk",
+    "medium_risk_mcc": "MCC is medium-risk"
+}
+
+def _number(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+class SOPRuleEngine:
+    """Evaluates the SOP checks that are plain arithmetic or list membership
+
+    evaluate_batch() computes transaction credit utilization against the
+    user's credit limit for many alerts at once (amounts and limits as
+    arrays) and adds the reference-list checks (high-risk merchant, country,
+    currency and MCC risk) from ReferenceData.flags_for().
+    The facts are injected into Stage 3 prompts, and rules_only_assessment()
+    turns them into a Stage 3 result when the LLM is unavailable.
+    """
+
+    def __init__(self, utilization_threshold: float = None):
+        self.utilization_threshold = (utilization_threshold if utilization_threshold is not None
+                                      else float(os.getenv("TAMS_SOP_UTILIZATION_THRESHOLD", "70.0")))
+        self.stats = {"alerts_evaluated": 0, "batches": 0, "rules_only_assessments": 0}
+
+    def evaluate_batch(self, reference: ReferenceData, alerts: List[Dict[str, Any]],
+                       profiles: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """SOP facts for each alert, given the profile of the user who made it
+
+        Fields an alert or profile lacks come back as None rather than False.
+        """
+        if not alerts:
+            return []
+        amounts = np.array([_number(alert.get("amount")) for alert in alerts])
+        limits = np.array([_number((profile or {}).get("credit_limit")) for profile in profiles])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            utilization = np.where(limits > 0, amounts / limits * 100, np.nan)
+        high_utilization = utilization > self.utilization_threshold
+
+        facts = []
+        for i, alert in enumerate(alerts):
+            known_utilization = not np.isnan(utilization[i])
+            facts.append({
+                "transaction_credit_utilization_pct": round(float(utilization[i]), 2) if known_utilization else None,
+                "utilization_threshold_pct": self.utilization_threshold,
+                "credit_limit": None if np.isnan(limits[i]) else float(limits[i]),
+                "high_transaction_credit_utilization": bool(high_utilization[i]) if known_utilization else None,
+                **reference.flags_for(alert)
+            })
+        self.stats["alerts_evaluated"] += len(alerts)
+        self.stats["batches"] += 1
+        return facts
+
+    @staticmethod
+    def fired_rules(facts: Dict[str, Any]) -> List[str]:
+        """Names of the SOP_RULE_WEIGHTS rules that hold for the facts"""
+        fired = [rule for rule in ("high_transaction_credit_utilization", "high_risk_merchant",
+                                   "high_risk_country", "risky_currency") if facts.get(rule)]
+        if facts.get("mcc_risk") == "High Risk":
+            fired.append("high_risk_mcc")
+        elif facts.get("mcc_risk") == "Medium Risk":
+            fired.append("medium_risk_mcc")
+        return fired
+
+    def blocking_rules(self, facts: Dict[str, Any]) -> List[str]:
+        """Fired rules that rule out skipping a stage for the alert"""
+        return [rule for rule in self.fired_rules(facts) if rule in SHORT_CIRCUIT_BLOCKING_RULES]
+
+    def risk_score(self, facts: Dict[str, Any], anomaly_rating: Optional[str] = None) -> int:
+        """Rules-only risk rating from 1 to 10"""
+        score = 1 + sum(SOP_RULE_WEIGHTS[rule] for rule in self.fired_rules(facts))
+        score += ANOMALY_WEIGHTS.get(anomaly_rating, 0)
+        return max(1, min(10, score))
+
+    def rules_only_assessment(self, facts: Dict[str, Any], anomaly_rating: Optional[str] = None) -> Dict[str, Any]:
+        """Stage 3 result built from the SOP facts alone, for when the LLM is unavailable"""
+        fired = self.fired_rules(facts)
+        findings = [RULE_FINDINGS[rule] for rule in fired]
+        if facts.get("transaction_credit_utilization_pct") is not None:
+            findings.append(f"Transaction credit utilization {facts['transaction_credit_utilization_pct']}%")
+        if anomaly_rating:
+            findings.append(f"Behavioral anomaly rating: {anomaly_rating}")
+        result = {
+            "keyFindings": findings or ["No deterministic SOP check fired"],
+            "riskFactors": [RULE_FINDINGS[rule] for rule in fired],
+            "recommendations": ["Manual review: LLM risk assessment unavailable, rating computed from SOP rules only"],
+            "riskRating": self.risk_score(facts, anomaly_rating),
+            "rulesOnly": True,
+            "sopFacts": facts
+        }
+        result["htmlContent"] = render_stage3_html(result)
+        self.stats["rules_only_assessments"] += 1
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "utilization_threshold_pct": self.utilization_threshold}
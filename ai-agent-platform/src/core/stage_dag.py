@@ -0,0 +1,65 @@
+"""
+Stage DAG - Run dependent async stages with maximum parallelism
+"""
+
+import asyncio
+import time
+from typing import Dict, Any, List, Callable, Awaitable, Iterable, Tuple
+
+class StageDAG:
+    """Async stages with declared dependencies
+
+    Each stage function receives the results of the stages it depends on as a
+    dict keyed by stage name. A stage starts as soon as all of its
+    dependencies have finished, so independent stages run concurrently.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Tuple[Callable[[Dict[str, Any]], Awaitable[Any]], List[str]]] = {}
+
+    def add_stage(self, name: str, fn: Callable[[Dict[str, Any]], Awaitable[Any]],
+                  depends_on: Iterable[str] = ()) -> "StageDAG":
+        if name in self.stages:
+            raise ValueError(f"Stage {name} already defined")
+        depends_on = list(depends_on)
+        for dependency in depends_on:
+            if dependency not in self.stages:
+                # Stages must be added after their dependencies, which also rules out cycles
+                raise ValueError(f"Stage {name} depends on undefined stage {dependency}")
+        self.stages[name] = (fn, depends_on)
+        return self
+
+    async def run(self) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        """Run every stage; returns (results, timings in ms) keyed by stage name
+
+        If a stage raises, the stages still running are cancelled and the
+        error propagates.
+        """
+        results: Dict[str, Any] = {}
+        timings: Dict[str, float] = {}
+        running: Dict[asyncio.Future, str] = {}
+        pending = dict(self.stages)
+
+        async def timed(name: str, fn, inputs: Dict[str, Any]):
+            started = time.perf_counter()
+            try:
+                return await fn(inputs)
+            finally:
+                timings[name] = (time.perf_counter() - started) * 1000
+
+        try:
+            while pending or running:
+                for name, (fn, depends_on) in list(pending.items()):
+                    if all(dependency in results for dependency in depends_on):
+                        inputs = {dependency: results[dependency] for dependency in depends_on}
+                        running[asyncio.ensure_future(timed(name, fn, inputs))] = name
+                        del pending[name]
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    results[running.pop(task)] = task.result()
+        finally:
+            for task in running:
+                task.cancel()
+
+        return results, timings
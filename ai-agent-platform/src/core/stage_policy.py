@@ -0,0 +1,161 @@
+"""
+Stage Policy - Declarative short-circuit rules that skip later TAMS stages
+"""
+
+import json
+import os
+from typing import Dict, Any, List, Optional, Set
+
+from .tokens import token_counter
+
+STAGE_ORDER = ("stage1", "stage2", "stage3")
+
+# Stage 3 adds nothing when Stage 1 found a confident genuine match and Stage 2 saw nothing unusual
+DEFAULT_SHORT_CIRCUIT_RULES = [
+    {
+        "name": "genuine_match_low_anomaly",
+        "skip": ["stage3"],
+        "when": {
+            "stage1.classification": "Likely Genuine",
+            "stage1.confidenceScore": "High",
+            "stage2.anomalyRating": "Low"
+        },
+        "assume": {"stage3": {"riskRating": 2}}
+    }
+]
+
+class ShortCircuitRule:
+    """Skip stages when every condition on earlier stage results holds
+
+    Conditions map "stageN.field" to an exact value, a list of allowed
+    values, or {"min": x, "max": y} for numbers. `assume` gives the fields
+    a skipped stage reports instead of an LLM answer (e.g. a riskRating so
+    the final recommendation can still be computed).
+    """
+
+    def __init__(self, name: str, skip: List[str], when: Dict[str, Any], assume: Dict[str, Dict[str, Any]] = None):
+        self.name = name
+        self.skip = list(skip)
+        self.when = dict(when)
+        self.assume = assume or {}
+        if not self.skip or not self.when:
+            raise ValueError(f"Short-circuit rule {name} needs at least one stage to skip and one condition")
+        # Conditions may only look at stages that finish before the first skipped one
+        first_skipped = min(STAGE_ORDER.index(stage) for stage in self.skip)
+        for stage in self.referenced_stages:
+            if stage not in STAGE_ORDER or STAGE_ORDER.index(stage) >= first_skipped:
+                raise ValueError(f"Short-circuit rule {name} cannot condition {self.skip} on {stage}")
+
+    @property
+    def referenced_stages(self) -> Set[str]:
+        return {key.split(".", 1)[0] for key in self.when}
+
+    def matches(self, results: Dict[str, Dict[str, Any]]) -> bool:
+        for key, expected in self.when.items():
+            stage, field = key.split(".", 1)
+            result = results.get(stage)
+            if result is None or result.get("skipped"):
+                return False
+            value = result.get(field)
+            if isinstance(expected, dict):
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    return False
+                if not expected.get("min", value) <= value <= expected.get("max", value):
+                    return False
+            elif isinstance(expected, list):
+                if value not in expected:
+                    return False
+            elif value != expected:
+                return False
+        return True
+
+class ShortCircuitPolicy:
+    """Ordered short-circuit rules plus counters of the LLM spend each rule saves
+
+    Savings are estimated from running averages of the prompt and
+    completion tokens of stages that did run (see observe()).
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]] = None):
+        self.rules = [ShortCircuitRule(**rule) for rule in (rules if rules is not None else DEFAULT_SHORT_CIRCUIT_RULES)]
+        self._usage = {}
+        self.stats = {rule.name: {"fired": 0, "blocked": 0, "llm_calls_saved": 0, "prompt_tokens_saved": 0,
+                                  "completion_tokens_saved": 0}
+                      for rule in self.rules}
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["ShortCircuitPolicy"]:
+        """Policy from agent config "short_circuit" (rule list, True or False), else TAMS_SHORT_CIRCUIT(_RULES)
+
+        Off unless enabled: skipping a stage trades the LLM's judgement for
+        an assumed result, which deployments should opt into.
+        """
+        rules = config.get("short_circuit")
+        if rules is None:
+            if os.getenv("TAMS_SHORT_CIRCUIT", "false").lower() != "true":
+                return None
+            rules = True
+        elif rules is False:
+            return None
+        if rules is True:
+            rules_json = os.getenv("TAMS_SHORT_CIRCUIT_RULES")
+            rules = json.loads(rules_json) if rules_json else None
+        return cls(rules)
+
+    def dependencies(self, stage: str) -> Set[str]:
+        """Stages whose results must be known before deciding whether to skip `stage`"""
+        return {s for rule in self.rules if stage in rule.skip for s in rule.referenced_stages if s != stage}
+
+    def match(self, stage: str, results: Dict[str, Dict[str, Any]]) -> Optional[ShortCircuitRule]:
+        """First rule that would skip `stage` given the earlier results, without recording anything"""
+        for rule in self.rules:
+            if stage in rule.skip and rule.matches(results):
+                return rule
+        return None
+
+    def check(self, stage: str, results: Dict[str, Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Result to use in place of `stage` if a rule skips it, else None"""
+        rule = self.match(stage, results)
+        return self.skip(rule, stage) if rule is not None else None
+
+    def skip(self, rule: ShortCircuitRule, stage: str) -> Dict[str, Any]:
+        """Record that `rule` skipped `stage` and return the result that stands in for it"""
+        self._record_skip(rule, stage)
+        return {
+            **rule.assume.get(stage, {}),
+            "skipped": True,
+            "skippedBy": rule.name,
+            "assumedFields": sorted(rule.assume.get(stage, {}))
+        }
+
+    def block(self, rule: ShortCircuitRule):
+        """Count a matching rule that was overruled (e.g. by a fired SOP rule) and did not skip"""
+        self.stats[rule.name]["blocked"] += 1
+
+    def observe(self, stage: str, prompt: str, response: str, alerts: int = 1):
+        """Record the token cost of a stage that ran for the given number of alerts (more than one when packed)"""
+        usage = self._usage.setdefault(stage, {"count": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        usage["count"] += alerts
+        usage["prompt_tokens"] += token_counter.count(prompt)
+        usage["completion_tokens"] += token_counter.count(response or "")
+
+    def _record_skip(self, rule: ShortCircuitRule, stage: str):
+        stats = self.stats[rule.name]
+        stats["llm_calls_saved"] += 1
+        if stage == rule.skip[0]:
+            stats["fired"] += 1
+        usage = self._usage.get(stage)
+        if usage and usage["count"]:
+            stats["prompt_tokens_saved"] += usage["prompt_tokens"] // usage["count"]
+            stats["completion_tokens_saved"] += usage["completion_tokens"] // usage["count"]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "rules": self.stats,
+            "average_stage_tokens": {
+                stage: {"prompt": u["prompt_tokens"] / u["count"], "completion": u["completion_tokens"] / u["count"]}
+                for stage, u in self._usage.items() if u["count"]
+            }
+        }
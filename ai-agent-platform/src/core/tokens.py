@@ -0,0 +1,182 @@
+"""
+Token Accounting - Pluggable tokenizers, per-call token usage and prompt-size guard
+"""
+
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from typing import Dict, Any, List, Callable, Tuple
+
+# Context windows (tokens) for the models CustomLLMClient is configured with
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4": 8192,
+    "gpt-4o": 128000,
+    "gpt-3.5-turbo": 16385,
+    "claude-3-sonnet-20240229": 200000,
+    "llama2": 4096
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
+class HeuristicTokenizer:
+    """Offline tokenizer approximating BPE: words, numbers and punctuation, long words split"""
+
+    name = "heuristic"
+    _pattern = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+    def count(self, text: str) -> int:
+        tokens = 0
+        for piece in self._pattern.findall(text):
+            if piece.isdigit():
+                # Digits are grouped in threes
+                tokens += (len(piece) + 2) // 3
+            else:
+                # Common words are single tokens; long words split into ~5 character pieces
+                tokens += 1 if len(piece) <= 6 else (len(piece) + 4) // 5
+        return tokens
+
+class TiktokenTokenizer:
+    """Exact OpenAI BPE tokenizer (requires tiktoken and its cached encoding files)"""
+
+    name = "tiktoken"
+
+    def __init__(self, encoding: str = "cl100k_base"):
+        import tiktoken
+        self.encoding = tiktoken.get_encoding(encoding)
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+def create_tokenizer(kind: str = None):
+    """Create the configured tokenizer, falling back to the offline heuristic"""
+    kind = kind or os.getenv("LLM_TOKENIZER", "auto")
+    if kind in ("auto", "tiktoken"):
+        try:
+            return TiktokenTokenizer(os.getenv("LLM_TOKENIZER_ENCODING", "cl100k_base"))
+        except Exception as e:
+            if kind == "tiktoken":
+                print(f"⚠️  tiktoken unavailable, using heuristic tokenizer: {e}")
+    return HeuristicTokenizer()
+
+class TokenCounter:
+    """Counts tokens with a pluggable tokenizer, caching counts for repeated text
+
+    The tokenizer is created on first use, so importing this module never
+    loads (or downloads) tiktoken encodings. Cached counts are keyed by a
+    digest of the text rather than the text itself, so the cache does not
+    hold whole prompts in memory.
+    """
+
+    def __init__(self, tokenizer=None, cache_size: int = 1024):
+        self._tokenizer = tokenizer
+        self.cache_size = cache_size
+        self._counts: "OrderedDict[bytes, int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            self._tokenizer = create_tokenizer()
+        return self._tokenizer
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        cached = self._counts.get(key)
+        if cached is not None:
+            self._counts.move_to_end(key)
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        tokens = self.tokenizer.count(text)
+        self._counts[key] = tokens
+        if len(self._counts) > self.cache_size:
+            self._counts.popitem(last=False)
+        return tokens
+
+    def cache_info(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._counts)}
+
+class TokenAccountant:
+    """Records prompt and completion token usage per provider and model"""
+
+    def __init__(self):
+        self.usage: Dict[str, Dict[str, int]] = {}
+
+    def record(self, provider: str, model: str, prompt_tokens: int, completion_tokens: int):
+        key = f"{provider}:{model}"
+        entry = self.usage.setdefault(key, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        entry["calls"] += 1
+        entry["prompt_tokens"] += prompt_tokens
+        entry["completion_tokens"] += completion_tokens
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "tokenizer": token_counter.tokenizer.name,
+            "count_cache": token_counter.cache_info(),
+            "usage": self.usage
+        }
+
+class PromptSizeGuard:
+    """Trims low-priority prompt sections (oldest rows first) to fit a token budget"""
+
+    def __init__(self, counter: TokenCounter = None):
+        self.counter = counter or token_counter
+        self.stats = {"prompts_checked": 0, "prompts_trimmed": 0, "rows_trimmed": 0}
+
+    @staticmethod
+    def budget_for(model: str, max_completion_tokens: int = 0) -> int:
+        """Prompt token budget for a model after reserving the completion"""
+        return MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW) - max_completion_tokens
+
+    def fit(self, render: Callable[..., str], sections: Dict[str, List[Dict[str, Any]]],
+            budget: int, timestamp_key: str = "timestamp") -> Tuple[str, Dict[str, int]]:
+        """Render a prompt whose sections fit the budget
+
+        render is called with each section as a keyword argument. Sections are
+        trimmed in the order given (lowest priority first), dropping their oldest
+        rows by timestamp_key; kept rows stay in their original order. Returns the
+        prompt and the number of rows dropped per section.
+        """
+        self.stats["prompts_checked"] += 1
+        current = {name: list(rows) for name, rows in sections.items()}
+        prompt = render(**current)
+        if self.counter.count(prompt) <= budget:
+            return prompt, {}
+
+        trimmed = {}
+        for name, rows in sections.items():
+            # Newest rows are kept longest
+            by_age = sorted(range(len(rows)), key=lambda i: str(rows[i].get(timestamp_key, "")), reverse=True)
+
+            def keep(n: int) -> List[Dict[str, Any]]:
+                kept = set(by_age[:n])
+                return [row for i, row in enumerate(rows) if i in kept]
+
+            # Largest number of newest rows that still fits
+            low, high = 0, len(rows)
+            while low < high:
+                mid = (low + high + 1) // 2
+                current[name] = keep(mid)
+                if self.counter.count(render(**current)) <= budget:
+                    low = mid
+                else:
+                    high = mid - 1
+
+            current[name] = keep(low)
+            trimmed[name] = len(rows) - low
+            prompt = render(**current)
+            if self.counter.count(prompt) <= budget:
+                break
+
+        self.stats["prompts_trimmed"] += 1
+        self.stats["rows_trimmed"] += sum(trimmed.values())
+        return prompt, trimmed
+
+# Global token accounting instances
+token_counter = TokenCounter()
+token_accountant = TokenAccountant()
+prompt_size_guard = PromptSizeGuard(token_counter)
@@ -1,4 +1,5 @@
 import pytest
+import json
 from fastapi.testclient import TestClient
 
 class TestTAMSAPI:
@@ -47,6 +48,47 @@ class TestTAMSAPI:
         response = client.post("/api/v1/tams/analyze", json=invalid_request)
         assert response.status_code == 422  # Validation error
     
+    def test_tams_analysis_stream(self, client):
+        """Test TAMS streaming analysis endpoint"""
+        request = {
+            "timestamp": "2024-12-16T14:30:00Z",
+            "merchant": "Test Merchant",
+            "amount": 100.00,
+            "transaction_type": "Card-Present",
+            "user_id": "user123"
+        }
+        
+        response = client.post("/api/v1/tams/analyze/stream", json=request)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert "event: stage_completed" in response.text
+        assert "event: completed" in response.text or "event: failed" in response.text
+    
+    def test_tams_analysis_batch(self, client):
+        """Test TAMS batch endpoint streams one NDJSON line per alert"""
+        alert = {
+            "timestamp": "2024-12-16T14:30:00Z",
+            "merchant": "Test Merchant",
+            "amount": 100.00,
+            "transaction_type": "Card-Present",
+            "user_id": "user123"
+        }
+        body = "\n".join([json.dumps(alert), json.dumps({"merchant": "incomplete"})])
+        
+        response = client.post(
+            "/api/v1/tams/analyze/batch?concurrency=2",
+            content=body,
+            headers={"content-type": "application/x-ndjson"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        results = {line["index"]: line for line in lines if line["type"] == "result"}
+        assert set(results) == {0, 1}
+        assert results[1]["status"] == "error"
+        assert lines[-1]["type"] == "summary"
+        assert lines[-1]["cursor"] == 2
+    
     def test_tams_test_endpoint(self, client):
         """Test TAMS test analysis endpoint"""
         response = client.post("/api/v1/tams/test")
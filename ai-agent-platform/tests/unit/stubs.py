@@ -0,0 +1,15 @@
+"""Test doubles shared by the agent unit tests"""
+
+class StubProvider:
+    """Stand-in for the LLM provider that answers with the given coroutine functions
+
+    Attributes can be replaced after creation, e.g. to add a streaming call.
+    """
+
+    def __init__(self, call_with_fallback=None, stream_with_fallback=None, prompt_budget: int = 8000):
+        self.call_with_fallback = call_with_fallback
+        self.stream_with_fallback = stream_with_fallback
+        self.prompt_budget = prompt_budget
+
+    def get_prompt_budget(self) -> int:
+        return self.prompt_budget
@@ -0,0 +1,143 @@
+import pytest
+import asyncio
+import json
+from src.agents.tams_agent import TAMSAgent
+from src.core.alert_cache import AlertResultCache, alert_fingerprint
+from tests.unit.stubs import StubProvider
+
+ALERT = {
+    "timestamp": "2024-12-16T14:30:00Z",
+    "merchant": "Test Merchant",
+    "amount": 100.00,
+    "transaction_type": "Card-Present",
+    "user_id": "user123",
+    "alert_id": "alert_1"
+}
+
+def counting_run(calls, status="completed", delay=0.0):
+    async def run():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return {"status": status, "final_recommendation": {"overall_risk_score": len(calls)}}
+    return run
+
+class TestAlertResultCache:
+    """Test idempotent reuse of TAMS analyses"""
+
+    def test_fingerprint_normalizes_features(self):
+        """Test formatting differences and alert_id do not change the fingerprint"""
+        resent = {**ALERT, "alert_id": "alert_2", "merchant": "  test   MERCHANT", "amount": "100.001",
+                  "timestamp": "2024-12-16T16:30:00+02:00"}
+        assert alert_fingerprint(resent) == alert_fingerprint(ALERT)
+        assert alert_fingerprint({**ALERT, "amount": 100.5}) != alert_fingerprint(ALERT)
+        assert alert_fingerprint(ALERT, "v1.1") != alert_fingerprint(ALERT, "v1.2")
+
+    @pytest.mark.asyncio
+    async def test_reuse_by_alert_id_and_fingerprint(self):
+        """Test stored results are returned by alert_id or fingerprint until they expire"""
+        cache = AlertResultCache(ttl_seconds=0.2, fingerprint_window_seconds=0.05)
+        calls = []
+
+        first = await cache.get_or_run(ALERT, counting_run(calls))
+        assert "idempotency" not in first
+
+        again = await cache.get_or_run(ALERT, counting_run(calls))
+        assert again["idempotency"]["matched_by"] == "alert_id"
+        renamed = await cache.get_or_run({**ALERT, "alert_id": "alert_2"}, counting_run(calls))
+        assert renamed["idempotency"]["matched_by"] == "fingerprint"
+        assert len(calls) == 1
+
+        # Same alert_id with changed features is analyzed again
+        await cache.get_or_run({**ALERT, "amount": 250.0}, counting_run(calls))
+        assert len(calls) == 2
+
+        await asyncio.sleep(0.06)
+        assert (await cache.get_or_run({**ALERT, "alert_id": "alert_3"}, counting_run(calls)))["final_recommendation"] == {"overall_risk_score": 3}
+        await asyncio.sleep(0.25)
+        assert cache.lookup(ALERT) is None
+        assert cache.get_stats()["expirations"] > 0
+
+    @pytest.mark.asyncio
+    async def test_concurrent_submissions_join_one_analysis(self):
+        """Test re-submissions while an analysis runs wait for it instead of starting their own"""
+        cache = AlertResultCache()
+        calls = []
+
+        results = await asyncio.gather(*[cache.get_or_run(ALERT, counting_run(calls, delay=0.02)) for _ in range(5)])
+
+        assert len(calls) == 1
+        assert [r.get("idempotency", {}).get("matched_by") for r in results].count("in_progress") == 4
+        assert cache.get_stats()["joined"] == 4
+
+    @pytest.mark.asyncio
+    async def test_running_analysis_not_joined_with_changed_features(self):
+        """Test an alert_id re-sent with new features during its analysis gets its own analysis"""
+        cache = AlertResultCache()
+        calls = []
+
+        first, changed = await asyncio.gather(
+            cache.get_or_run(ALERT, counting_run(calls, delay=0.02)),
+            cache.get_or_run({**ALERT, "amount": 250.0}, counting_run(calls, delay=0.02))
+        )
+
+        assert len(calls) == 2
+        assert "idempotency" not in first and "idempotency" not in changed
+        assert cache.get_stats()["joined"] == 0
+
+    @pytest.mark.asyncio
+    async def test_invalidation_and_failures_are_not_reused(self):
+        """Test genuine confirmations drop stored and running analyses and failures are never stored"""
+        cache = AlertResultCache()
+        calls = []
+
+        await cache.get_or_run(ALERT, counting_run(calls))
+        assert cache.invalidate_user("user123") == 2
+        assert cache.lookup(ALERT) is None
+
+        running = asyncio.ensure_future(cache.get_or_run(ALERT, counting_run(calls, delay=0.02)))
+        await asyncio.sleep(0)
+        cache.invalidate_user("user123")
+        await running
+        assert cache.lookup(ALERT) is None
+
+        await cache.get_or_run({**ALERT, "alert_id": "alert_9"}, counting_run(calls, status="failed"))
+        assert cache.lookup({**ALERT, "alert_id": "alert_9"}) is None
+
+    @pytest.mark.asyncio
+    async def test_degraded_results_are_not_reused(self):
+        """Test analyses with a fallback, rules-only or failed stage are analyzed again on re-submission"""
+        cache = AlertResultCache()
+
+        for n, stage3 in enumerate([{"riskRating": 8, "fallback": True}, {"riskRating": 3, "rulesOnly": True},
+                                    {"error": "Invalid stage3 response"}]):
+            alert = {**ALERT, "alert_id": f"degraded_{n}", "amount": 100.0 + n}
+            result = {"status": "completed", "analysis": {"stage1_genuine_correlation": {"classification": "Likely Genuine"},
+                                                          "stage3_risk_assessment": stage3}}
+            cache.store(alert, result)
+            assert cache.lookup(alert) is None
+
+        cache.store(ALERT, {"status": "completed", "analysis": {"stage3_risk_assessment": {"riskRating": 3}}})
+        assert cache.lookup(ALERT) is not None
+        assert cache.get_stats()["degraded_not_stored"] == 3
+
+    @pytest.mark.asyncio
+    async def test_agent_reuses_result_for_resubmitted_alert(self):
+        """Test the agent skips every LLM call for a re-submitted alert until the user is invalidated"""
+        agent = TAMSAgent(config={"stage1_prematch": False, "short_circuit": False})
+        calls = []
+
+        async def fake_call(prompt, stage="stage1", use_cache=True):
+            calls.append(stage)
+            return json.dumps({"classification": "Requires Further Analysis", "riskRating": 6})
+
+        agent.llm_provider = StubProvider(call_with_fallback=fake_call)
+
+        first = await agent.execute(ALERT)
+        second = await agent.execute(ALERT)
+        assert len(calls) == 3
+        assert second["idempotency"]["matched_by"] == "alert_id"
+        assert second["final_recommendation"] == first["final_recommendation"]
+
+        agent.invalidate_cached_results("user123")
+        await agent.execute(ALERT)
+        assert len(calls) == 6
@@ -0,0 +1,133 @@
+import pytest
+import asyncio
+import json
+import re
+from src.agents.tams_agent import TAMSAgent
+from src.core.alert_packing import parse_packed_response, split_shared_features
+from src.core.stage_policy import ShortCircuitPolicy
+from tests.unit.stubs import StubProvider
+
+AMOUNTS = [5.0, 250.0, 12.5, 999.0, 40.0, 150.0]
+
+def burst():
+    return [{
+        "timestamp": f"2024-12-16T14:{30 + i:02d}:00Z",
+        "merchant": "Card Tester",
+        "amount": amount,
+        "transaction_type": "Card-Not-Present",
+        "user_id": "user_burst",
+        "alert_id": f"burst_{i}"
+    } for i, amount in enumerate(AMOUNTS)]
+
+def verdict(stage, amount):
+    """Deterministic stand-in for the model: large amounts are suspicious"""
+    high = amount >= 100
+    classification = "Requires Further Analysis" if high else "Likely Genuine"
+    if stage == "stage1":
+        return {"classification": classification, "confidenceScore": "Low" if high else "High",
+                "rationale": f"amount {amount}"}
+    if stage == "stage2":
+        return {"classification": classification, "anomalyRating": "High" if high else "Low",
+                "keyAnomalousObservations": [f"amount {amount}"], "behavioralSummary": "burst"}
+    return {"keyFindings": [f"amount {amount}"], "riskFactors": [], "recommendations": ["Review"],
+            "riskRating": 8 if high else 3}
+
+def stub_agent(packing, calls, drop_stage3_alert=None, number_stage3=True):
+    agent = TAMSAgent(config={"stage1_prematch": False, "short_circuit": False, "packing": packing})
+
+    async def fake_call(prompt, stage="stage1", use_cache=True):
+        calls.append(stage)
+        if '{"alerts": [...]}' not in prompt:
+            return json.dumps(verdict(stage, float(re.search(r"Amount: ([\d.]+)", prompt).group(1))))
+        if stage == "stage3":
+            found = re.findall(r"ALERT (\d+):\n- Merchant: .*\n- Transaction Amount: ([\d.]+)", prompt)
+        else:
+            found = re.findall(r"^(\d+),[^,]+,[^,]+,([\d.]+),", prompt, re.M)
+        entries = [{"alert": int(n), **verdict(stage, float(amount))} for n, amount in found
+                   if not (stage == "stage3" and int(n) == drop_stage3_alert)]
+        if stage == "stage3" and not number_stage3:
+            for entry in entries:
+                del entry["alert"]
+        # Out of order on purpose: entries are matched by alert number
+        return json.dumps({"alerts": entries[::-1]})
+
+    agent.llm_provider = StubProvider(call_with_fallback=fake_call)
+    return agent
+
+class TestAlertPacking:
+    """Test packing bursts of alerts from one user into one LLM call per stage"""
+
+    @pytest.mark.asyncio
+    async def test_packed_verdicts_match_unpacked(self):
+        """Test packed analysis gives every alert the same result as analyzing it alone, with fewer calls"""
+        unpacked_calls, packed_calls = [], []
+        unpacked = stub_agent(False, unpacked_calls)
+        packed = stub_agent(True, packed_calls, drop_stage3_alert=2)
+
+        expected = [await unpacked.execute(alert) for alert in burst()]
+        results = await asyncio.gather(*[packed.execute(alert) for alert in burst()])
+
+        for alone, together in zip(expected, results):
+            assert together["status"] == "completed"
+            assert together["analysis"] == alone["analysis"]
+            assert together["final_recommendation"] == alone["final_recommendation"]
+        assert len(unpacked_calls) == 3 * len(AMOUNTS)
+        # One packed call per stage, plus one unpacked retry for the alert left out of the Stage 3 reply
+        assert sorted(packed_calls) == ["stage1", "stage2", "stage3", "stage3"]
+
+        stats = packed.packer.get_stats()
+        assert stats["packs"] == 3 and stats["packed_alerts"] == 3 * len(AMOUNTS)
+        assert stats["fallbacks"] == 1 and stats["llm_calls_saved"] == 3 * len(AMOUNTS) - 4
+
+    @pytest.mark.asyncio
+    async def test_unnumbered_reply_with_missing_alert_is_rerun(self):
+        """Test entries without alert numbers are not matched by position when the reply is short"""
+        unpacked_calls, packed_calls = [], []
+        unpacked = stub_agent(False, unpacked_calls)
+        packed = stub_agent(True, packed_calls, drop_stage3_alert=2, number_stage3=False)
+
+        expected = [await unpacked.execute(alert) for alert in burst()]
+        results = await asyncio.gather(*[packed.execute(alert) for alert in burst()])
+
+        for alone, together in zip(expected, results):
+            assert together["analysis"]["stage3_risk_assessment"] == alone["analysis"]["stage3_risk_assessment"]
+        # Every alert's Stage 3 is re-run on its own
+        assert packed_calls.count("stage3") == 1 + len(AMOUNTS)
+        assert packed.packer.get_stats()["fallbacks"] == len(AMOUNTS)
+
+    @pytest.mark.asyncio
+    async def test_single_alert_and_v1_3_use_ordinary_prompts(self):
+        """Test a lone alert and pre-v1.4 prompts are never packed"""
+        calls = []
+        agent = stub_agent(True, calls)
+        await agent.execute(burst()[0])
+        assert len(calls) == 3 and agent.packer.get_stats()["single_alerts"] == 3
+
+        calls.clear()
+        agent.prompt_version = "v1.3"
+        await asyncio.gather(*[agent.execute(alert) for alert in burst()[1:3]])
+        assert len(calls) == 6 and agent.packer.get_stats()["packs"] == 0
+
+    @pytest.mark.asyncio
+    async def test_packed_call_cost_averaged_over_its_alerts(self):
+        """Test a packed call feeds the short-circuit averages once, split across the alerts it answered"""
+        agent = stub_agent(True, [])
+        agent.short_circuit = ShortCircuitPolicy.from_config({"short_circuit": True})
+        items = [{"input": alert} for alert in burst()]
+
+        await agent._run_pack("stage1", items)
+
+        usage = agent.short_circuit._usage
+        assert list(usage) == ["stage1"] and usage["stage1"]["count"] == len(AMOUNTS)
+
+    def test_packed_response_parsing(self):
+        """Test entries map by alert number and invalid or missing ones are reported as None"""
+        text = 'Results: {"alerts": [{"alert": 2, "riskRating": 4}, {"alert": 1, "riskRating": "high"}, {"riskRating": 9}]}'
+        assert parse_packed_response("stage3", text, 3) == [None, {"riskRating": 4}, {"riskRating": 9}]
+        assert parse_packed_response("stage3", "no json here", 2) == [None, None]
+        # Without a number, a short reply cannot say which alert an entry answers
+        text = '{"alerts": [{"alert": 3, "riskRating": 4}, {"riskRating": 9}]}'
+        assert parse_packed_response("stage3", text, 3) == [None, None, {"riskRating": 4}]
+
+        shared, varying = split_shared_features([{"count": 5, "z": 1.0}, {"count": 5, "z": 2.0, "new": True}])
+        assert shared == {"count": 5} and varying == ["z", "new"]
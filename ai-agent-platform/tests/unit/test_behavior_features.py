@@ -0,0 +1,88 @@
+import pytest
+from src.core.behavior_features import BehavioralFeatureExtractor, circular_stats
+from src.agents.tams_agent import create_tams_agent
+from src.core.feature_store import UserFeatureStore
+import numpy as np
+
+HISTORY = [
+    {"timestamp": "2024-12-09T09:00:00Z", "merchant": "Amazon", "amount": 40.0, "transaction_type": "Card-Not-Present", "mcc": "5399"},
+    {"timestamp": "2024-12-10T10:00:00Z", "merchant": "Amazon", "amount": 60.0, "transaction_type": "Card-Not-Present", "mcc": "5399"},
+    {"timestamp": "2024-12-11T08:00:00Z", "merchant": "Starbucks", "amount": 5.0, "transaction_type": "Card-Present", "mcc": "5814"},
+    {"timestamp": "2024-12-12T09:00:00Z", "merchant": "Starbucks", "amount": 7.0, "transaction_type": "Card-Present", "mcc": "5814"}
+]
+
+class TestBehavioralFeatures:
+    """Test Stage 2 feature extraction"""
+    
+    def test_amount_and_novelty_features(self):
+        """Test amount statistics and merchant/MCC novelty are exact"""
+        alert = {"timestamp": "2024-12-13T09:30:00Z", "merchant": "amazon", "amount": 100.0, "transaction_type": "Card-Not-Present"}
+        
+        features = BehavioralFeatureExtractor().extract(alert, HISTORY)
+        
+        amounts = np.array([40.0, 60.0, 5.0, 7.0])
+        assert features["user_amount_mean"] == pytest.approx(amounts.mean())
+        assert features["user_amount_z"] == pytest.approx((100.0 - amounts.mean()) / amounts.std())
+        assert features["merchant_seen_before"] is True
+        assert features["mcc"] == "5399"
+        assert features["mcc_amount_mean"] == pytest.approx(50.0)
+        assert features["mcc_amount_z"] == pytest.approx(5.0)
+        assert features["cnp_share"] == pytest.approx(0.5)
+        assert features["txns_today"] == 1
+    
+    def test_new_merchant_and_time_deviation(self):
+        """Test a new merchant at an unusual hour is flagged"""
+        alert = {"timestamp": "2024-12-13T21:00:00Z", "merchant": "Unknown Store", "amount": 20.0, "transaction_type": "Card-Present"}
+        
+        features = BehavioralFeatureExtractor().extract(alert, HISTORY)
+        
+        assert features["merchant_seen_before"] is False
+        assert features["mcc_seen_before"] is False
+        assert features["hour_deviation"] == pytest.approx(12.0, abs=0.1)
+        assert features["hour_share_within_2h"] == 0.0
+    
+    def test_circular_mean_wraps_midnight(self):
+        """Test hours either side of midnight average to midnight"""
+        mean, gap, concentration = circular_stats(np.array([23.0, 1.0]), 0.0, 24.0)
+        
+        assert min(mean, 24 - mean) == pytest.approx(0.0, abs=1e-9)
+        assert gap == pytest.approx(0.0, abs=1e-9)
+        assert concentration > 0.9
+    
+    @pytest.mark.asyncio
+    async def test_stage2_prompt_uses_feature_table(self):
+        """Test the default prompt sends features, v1.1 sends raw history"""
+        agent = create_tams_agent()
+        
+        async def get_history(user_id):
+            return HISTORY
+        
+        agent._get_transaction_history = get_history
+        agent.feature_store = UserFeatureStore()
+        alert = {"timestamp": "2024-12-13T09:30:00Z", "merchant": "Amazon", "amount": 100.0, "transaction_type": "Card-Not-Present", "user_id": "u1"}
+        
+        agent.prompt_version = "v1.2"
+        features_prompt = await agent._build_stage2_prompt(alert)
+        agent.prompt_version = "v1.1"
+        raw_prompt = await agent._build_stage2_prompt(alert)
+        
+        assert "user_amount_z |" in features_prompt
+        assert "2024-12-09T09:00:00Z" not in features_prompt
+        assert "2024-12-09T09:00:00Z" in raw_prompt
+    
+    @pytest.mark.asyncio
+    async def test_unparseable_timestamp_falls_back_to_raw_history(self):
+        """Test a non-ISO alert timestamp sends the raw history instead of failing Stage 2"""
+        agent = create_tams_agent()
+        
+        async def get_history(user_id):
+            return HISTORY
+        
+        agent._get_transaction_history = get_history
+        alert = {"timestamp": "16/12/2024 14:30", "merchant": "Amazon", "amount": 100.0, "transaction_type": "Card-Not-Present", "user_id": "u_bad_ts"}
+        
+        for store in (UserFeatureStore(), None):
+            agent.feature_store = store
+            prompt = await agent._build_stage2_prompt(alert)
+            assert "user_amount_z |" not in prompt
+            assert "2024-12-09T09:00:00Z" in prompt
@@ -0,0 +1,106 @@
+import pytest
+import asyncio
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from src.agents.base import BaseAgent, AgentType, AgentStatus
+from src.agents.execution_history import ExecutionHistory, DatabaseExecutionSpill
+from src.agents.tams_agent import TAMSAgent
+from src.core.database import Base
+from src.core.models import AgentExecution
+from tests.unit.stubs import StubProvider
+
+class SleepyAgent(BaseAgent):
+    """Agent whose executions overlap"""
+    
+    async def execute(self, input_data):
+        self.start_execution(input_data)
+        await asyncio.sleep(input_data["delay"])
+        seen = self.last_execution["input_data"]["n"]
+        if input_data["n"] % 2:
+            self.fail_execution("odd input")
+        else:
+            self.complete_execution({"n": input_data["n"]})
+        return {"seen": seen}
+    
+    def validate_input(self, input_data):
+        return True
+
+class TestExecutionHistory:
+    """Test per-execution contexts and the bounded history"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_executions_keep_their_own_context(self):
+        """Test overlapping executions do not overwrite each other's state"""
+        agent = SleepyAgent("sleepy", AgentType.AUTOMATION, {"execution_history_size": 3})
+        
+        tasks = [asyncio.ensure_future(agent.execute({"n": n, "delay": 0.01 * (5 - n)})) for n in range(5)]
+        await asyncio.sleep(0)
+        assert agent.status == AgentStatus.RUNNING
+        results = await asyncio.gather(*tasks)
+        
+        assert [r["seen"] for r in results] == [0, 1, 2, 3, 4]
+        assert agent.status == AgentStatus.COMPLETED  # n=0 finished last
+        assert len(agent.execution_history) == 3 and agent.execution_history.total == 5
+        assert [e["input_data"]["n"] for e in agent.execution_history] == [2, 1, 0]
+        assert agent.execution_history[-1]["output_data"] == {"n": 0}
+        assert agent.execution_history[1]["error"] == "odd input"
+        assert agent.get_status()["execution_count"] == 5
+    
+    def test_evicted_entries_spill_to_agent_executions(self):
+        """Test entries pushed out of the ring buffer are written to the database"""
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        spill = DatabaseExecutionSpill("sleepy", session_factory=sessionmaker(bind=engine), batch_size=4)
+        history = ExecutionHistory(maxlen=2, spill=spill)
+        
+        for n in range(10):
+            history.append({"id": str(n), "status": "completed", "input_data": {"n": n}, "output_data": {"ok": True}})
+        spill.flush()
+        
+        db = sessionmaker(bind=engine)()
+        rows = db.query(AgentExecution).order_by(AgentExecution.id).all()
+        assert [row.input_data["n"] for row in rows] == list(range(8))
+        assert [e["input_data"]["n"] for e in history] == [8, 9]
+        assert spill.stats == {"spilled": 8, "dropped": 0, "errors": 0}
+        db.close()
+    
+    def test_zero_size_history_spills_every_entry(self):
+        """Test a history that keeps nothing hands each new entry straight to the spill"""
+        spilled = []
+        history = ExecutionHistory(maxlen=0, spill=type("ListSpill", (), {"put": staticmethod(spilled.append)})())
+        
+        for n in range(3):
+            history.append({"id": str(n)})
+        
+        assert [e["id"] for e in spilled] == ["0", "1", "2"]
+        assert len(history) == 0 and history.total == 3
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_executions_do_not_stay_running(self):
+        """Test a cancelled analysis and an abandoned stream are recorded as failed"""
+        agent = TAMSAgent(config={"stage1_prematch": False, "short_circuit": False, "alert_cache": False})
+        
+        async def hang(prompt, stage="stage1", use_cache=True):
+            await asyncio.sleep(10)
+        
+        agent.llm_provider = StubProvider(call_with_fallback=hang)
+        alert = {"timestamp": "2024-12-16T14:30:00Z", "merchant": "Test Merchant", "amount": 100.0,
+                 "transaction_type": "Card-Present", "user_id": "user123"}
+        
+        task = asyncio.ensure_future(agent.execute(alert))
+        await asyncio.sleep(0.01)
+        assert agent.status == AgentStatus.RUNNING
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        
+        assert agent.status == AgentStatus.FAILED
+        assert agent.execution_history[-1]["error"] == "TAMS analysis cancelled"
+        
+        stream = agent.execute_stream(alert)
+        assert (await stream.__anext__())["event"] == "stage_started"
+        assert agent.status == AgentStatus.RUNNING
+        await stream.aclose()
+        
+        assert agent.status == AgentStatus.FAILED and agent.execution_history.total == 2
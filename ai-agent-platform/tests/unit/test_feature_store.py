@@ -0,0 +1,129 @@
+import pytest
+from src.core.feature_store import UserFeatureStore, _bucket_fields, _bucket_from_fields
+from src.core.behavior_features import BehavioralFeatureExtractor
+from src.agents.tams_agent import TAMSAgent
+
+def make_history():
+    return [
+        {"timestamp": f"2024-{month:02d}-{day:02d}T{8 + day % 5:02d}:15:00Z",
+         "merchant": "Amazon" if day % 3 else "Starbucks", "amount": 10.0 + day * (month - 8),
+         "transaction_type": "Card-Not-Present" if day % 2 else "Card-Present",
+         "mcc": "5399" if day % 3 else "5814"}
+        for month in (10, 11, 12) for day in range(1, 29) if day % 7 < 3
+    ]
+
+ALERT = {"timestamp": "2024-12-29T12:00:00Z", "merchant": "Amazon", "amount": 75.0,
+         "transaction_type": "Card-Not-Present", "user_id": "u1"}
+
+class TestUserFeatureStore:
+    """Test the incremental per-user feature store"""
+    
+    @pytest.mark.asyncio
+    async def test_incremental_features_match_full_scan(self):
+        """Test aggregates built one transaction at a time match the batch extractor"""
+        store = UserFeatureStore(window_days=90)
+        history = make_history()
+        for txn in history:
+            await store.ingest_transaction("u1", txn)
+        
+        incremental = store.features_for(ALERT)
+        full = BehavioralFeatureExtractor().extract(ALERT, history)
+        
+        assert set(incremental) == set(full)
+        for name, value in full.items():
+            if name == "hour_share_within_2h":
+                continue
+            if isinstance(value, float):
+                assert incremental[name] == pytest.approx(value, rel=1e-6, abs=1e-9), name
+            else:
+                assert incremental[name] == value, name
+    
+    @pytest.mark.asyncio
+    async def test_window_expiry(self):
+        """Test transactions older than the window stop counting"""
+        store = UserFeatureStore(window_days=30)
+        for txn in make_history():
+            await store.ingest_transaction("u1", txn)
+        
+        features = store.features_for(ALERT)
+        in_window = [t for t in make_history() if t["timestamp"] >= "2024-11-29"]
+        
+        assert features["history_count"] == len(in_window)
+        assert store.stats["expired_days"] > 0
+    
+    @pytest.mark.asyncio
+    async def test_genuine_alerts_bounded(self):
+        """Test only the most recent genuine alerts are kept"""
+        store = UserFeatureStore(genuine_limit=3)
+        for day in range(1, 6):
+            await store.ingest_genuine_alert("u1", {"timestamp": f"2024-12-0{day}T10:00:00Z", "merchant": "Amazon"})
+        
+        alerts = store.genuine_alerts("u1")
+        
+        assert [a["timestamp"][:10] for a in alerts] == ["2024-12-03", "2024-12-04", "2024-12-05"]
+    
+    @pytest.mark.asyncio
+    async def test_snapshot_restore(self, tmp_path):
+        """Test state survives a snapshot to disk and restore"""
+        store = UserFeatureStore()
+        await store.load("u1", make_history(), [{"timestamp": "2024-12-01T10:00:00Z", "merchant": "Amazon"}], {"credit_limit": 5000.0})
+        path = str(tmp_path / "features.json")
+        store.snapshot(path)
+        
+        restored = UserFeatureStore()
+        await restored.restore(path=path)
+        
+        assert restored.features_for(ALERT) == store.features_for(ALERT)
+        assert restored.genuine_alerts("u1") == store.genuine_alerts("u1")
+        assert restored.profile("u1") == {"credit_limit": 5000.0}
+    
+    @pytest.mark.asyncio
+    async def test_ingest_before_first_alert_still_loads_user(self):
+        """Test updates for a never-loaded user do not stand in for the initial history and profile load"""
+        history = make_history()
+        agent = TAMSAgent(config={"feature_store": True})
+        agent.feature_store = UserFeatureStore(window_days=90)
+        
+        async def get_history(user_id):
+            return history
+        
+        agent._get_transaction_history = get_history
+        new_txn = {"timestamp": "2024-12-28T20:00:00Z", "merchant": "Corner Cafe", "amount": 12.0,
+                   "transaction_type": "Card-Present", "mcc": "5814"}
+        await agent.feature_store.ingest_transaction("u1", new_txn)
+        await agent.feature_store.ingest_transaction("u1", history[-1])
+        await agent.feature_store.ingest_genuine_alert("u1", {"timestamp": "2024-12-28T09:00:00Z", "merchant": "Corner Cafe"})
+        assert not await agent.feature_store.has_user("u1")
+        
+        profile = await agent._user_profile_for("u1")
+        features = agent.feature_store.features_for(ALERT)
+        
+        assert profile["credit_limit"] == 5000.00
+        # The re-sent history row is counted once
+        assert features["history_count"] == len(history) + 1
+        assert agent.feature_store.genuine_alerts("u1")[-1]["merchant"] == "Corner Cafe"
+        assert await agent.feature_store.has_user("u1")
+    
+    @pytest.mark.asyncio
+    async def test_least_recently_used_user_evicted_and_reloaded(self):
+        """Test the in-process users are capped and an evicted user is loaded again on next use"""
+        store = UserFeatureStore(max_users=2)
+        for user_id in ("u1", "u2"):
+            await store.load(user_id, make_history())
+        assert await store.has_user("u1")
+        await store.load("u3", make_history())
+        
+        assert not await store.has_user("u2")
+        assert await store.has_user("u1") and await store.has_user("u3")
+        assert store.get_stats()["evictions"] == 1 and store.get_stats()["users"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_bucket_hash_fields_round_trip(self):
+        """Test a daily bucket survives the flat field form written to Redis"""
+        store = UserFeatureStore()
+        await store.load("u1", make_history())
+        
+        for day, bucket in store.users["u1"]["days"].items():
+            counts, sums = _bucket_fields(bucket)
+            fields = {name: str(value) for name, value in {**counts, **sums}.items()}
+            assert _bucket_from_fields(fields, bucket["max"], bucket["first_ts"]) == bucket, day
@@ -0,0 +1,67 @@
+import pytest
+import json
+from src.core.html_render import render_stage1_html, render_stage2_html, render_stage3_html, rating_color
+from src.agents.tams_agent import create_tams_agent
+from src.core.feature_store import UserFeatureStore
+from tests.unit.stubs import StubProvider
+
+ALERT = {
+    "timestamp": "2024-12-16T10:00:00Z",
+    "merchant": "Amazon",
+    "amount": 50.00,
+    "transaction_type": "Card-Not-Present",
+    "user_id": "user123"
+}
+
+STAGE_RESPONSES = {
+    "stage1": {"classification": "Requires Further Analysis", "confidenceScore": None, "rationale": "Two attributes match"},
+    "stage2": {"classification": "Requires Further Analysis", "anomalyRating": "High",
+               "keyAnomalousObservations": ["First purchase at <script>"], "behavioralSummary": "Unusual."},
+    "stage3": {"keyFindings": ["Large amount"], "riskFactors": ["New merchant"],
+               "recommendations": ["Call the cardholder"], "riskRating": 8}
+}
+
+class TestHTMLRender:
+    """Test server-side htmlContent rendering"""
+    
+    def test_templates(self):
+        """Test headings, colors, escaping and the risk circle"""
+        stage1 = render_stage1_html(ALERT, "Likely Genuine", {"merchant": "Amazon", "amount": 48.0}, [True, False, True, False])
+        assert "color: green" in stage1 and stage1.count("✅ Match") == 2 and stage1.count("❌ No Match") == 2
+        
+        stage2 = render_stage2_html(STAGE_RESPONSES["stage2"])
+        assert "<span style='color: red;'>High</span>" in stage2
+        assert "&lt;script&gt;" in stage2 and "<script>" not in stage2
+        
+        stage3 = render_stage3_html(STAGE_RESPONSES["stage3"])
+        assert "border-radius: 50%; background: red" in stage3
+        assert stage3.index("Key Findings") < stage3.index("Recommendations") < stage3.index("Risk Factors")
+        assert [rating_color(r) for r in (2, 5, 9, None)] == ["green", "orange", "red", "gray"]
+    
+    @pytest.mark.asyncio
+    async def test_structured_prompts_and_server_html(self):
+        """Test v1.4 prompts omit htmlContent and results get it from the server; v1.3 is unchanged"""
+        agent = create_tams_agent()
+        agent.feature_store = UserFeatureStore()
+        agent.stage1_matcher = None
+        prompts = {}
+        
+        async def fake_call(prompt, stage="stage1", use_cache=True):
+            prompts[stage] = prompt
+            return json.dumps(STAGE_RESPONSES[stage])
+        
+        agent.llm_provider = StubProvider(call_with_fallback=fake_call)
+        
+        result = await agent.execute(ALERT)
+        assert result["status"] == "completed"
+        for stage, key in (("stage1", "stage1_genuine_correlation"), ("stage2", "stage2_behavioral_analysis"),
+                           ("stage3", "stage3_risk_assessment")):
+            assert "htmlContent" not in prompts[stage] and "HTML" not in prompts[stage]
+            assert result["analysis"][key]["htmlContent"].startswith(("<h4", "<div"))
+        assert "Anomaly Rating: <span style='color: red;'>High</span>" in result["analysis"]["stage2_behavioral_analysis"]["htmlContent"]
+        
+        agent.prompt_version = "v1.3"
+        result = await agent.execute(ALERT)
+        for stage in ("stage1", "stage2", "stage3"):
+            assert '"htmlContent": "HTML Preview of final result"' in prompts[stage]
+        assert "htmlContent" not in result["analysis"]["stage3_risk_assessment"]
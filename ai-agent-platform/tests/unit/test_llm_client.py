@@ -0,0 +1,593 @@
+import pytest
+import asyncio
+import random
+import time
+from src.core.llm_pool import LLMSessionPool
+from src.core.llm_cache import LLMResponseCache
+from src.core.llm_singleflight import SingleFlight
+from src.core.llm_limits import ProviderLimiter, LLMRateLimiter, RateLimitTimeout
+from src.core.llm_routing import CircuitBreaker, LLMRouter
+from src.core.llm_batch import ConcurrentBatchBackend
+from src.core.llm_client import CustomLLMClient, LLMProvider
+from src.core.mock_llm import MockLLMServer, FixedLatency, HistogramLatency
+
+class UnreachablePool:
+    """Session pool stub that fails any attempt to reach the network"""
+    
+    async def get_session(self, provider):
+        raise ConnectionError("network disabled in tests")
+    
+    async def close(self):
+        pass
+
+class TestLLMSessionPool:
+    """Test pooled LLM HTTP sessions"""
+    
+    @pytest.mark.asyncio
+    async def test_session_reused_per_provider(self):
+        """Test the same session is returned for repeated calls"""
+        pool = LLMSessionPool(limit=10, limit_per_host=5)
+        
+        first = await pool.get_session("openai")
+        second = await pool.get_session("openai")
+        other = await pool.get_session("anthropic")
+        
+        assert first is second
+        assert first is not other
+        assert first.connector.limit == 10
+        assert first.connector.limit_per_host == 5
+        
+        await pool.close()
+        assert first.closed
+        assert pool.sessions == {}
+    
+    @pytest.mark.asyncio
+    async def test_pool_stats(self):
+        """Test connection stats are reported per provider"""
+        pool = LLMSessionPool()
+        await pool.get_session("custom")
+        await pool.get_session("custom")
+        
+        stats = pool.get_stats()
+        custom = stats["providers"]["custom"]
+        assert custom["requests_total"] == 2
+        assert custom["open_connections"] == custom["idle_connections"] + custom["in_use_connections"]
+        
+        await pool.close()
+    
+    @pytest.mark.asyncio
+    async def test_client_uses_shared_pool(self):
+        """Test the client draws sessions from its configured pool"""
+        pool = LLMSessionPool()
+        client = CustomLLMClient({"session_pool": pool})
+        
+        assert client.session_pool is pool
+        await client.close()
+
+
+class TestLLMResponseCache:
+    """Test the LLM response cache"""
+    
+    def test_lru_eviction(self):
+        """Test least recently used entries are evicted past the size cap"""
+        cache = LLMResponseCache(max_entries=2, enabled=True, db_path="")
+        cache.set("a", "1")
+        cache.set("b", "2")
+        cache.get("a")
+        cache.set("c", "3")
+        
+        assert cache.get("a") == "1"
+        assert cache.get("b") is None
+        assert cache.get_stats()["evictions"] == 1
+    
+    def test_ttl_expiry(self):
+        """Test entries expire after their TTL"""
+        cache = LLMResponseCache(enabled=True, db_path="")
+        cache.set("key", "value", ttl=0.01)
+        time.sleep(0.02)
+        
+        assert cache.get("key") is None
+        assert cache.get_stats()["expirations"] == 1
+    
+    def test_disk_tier_persists(self, tmp_path):
+        """Test the SQLite tier survives a new cache instance"""
+        db_path = str(tmp_path / "llm_cache.db")
+        LLMResponseCache(enabled=True, db_path=db_path).set("key", "value")
+        
+        cache = LLMResponseCache(enabled=True, db_path=db_path)
+        assert cache.get("key") == "value"
+        assert cache.get_stats()["disk_hits"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_async_disk_tier_trimmed_every_interval(self, tmp_path):
+        """Test aget/aset reach the SQLite tier and the row cap is enforced every few writes"""
+        cache = LLMResponseCache(enabled=True, db_path=str(tmp_path / "llm_cache.db"), max_entries=1,
+                                 max_disk_entries=2, disk_trim_interval=3)
+        for key in ("a", "b"):
+            await cache.aset(key, key.upper())
+        
+        assert await cache.aget("a") == "A"
+        assert cache.get_stats()["disk_hits"] == 1
+        
+        await cache.aset("c", "C")
+        await cache.aset("d", "D")
+        # The third write trimmed the least recently used row; the fourth waits for the next trim
+        assert cache.get_stats()["disk_entries"] == 3
+        assert await cache.aget("b") is None
+        assert await cache.aget("a") == "A"
+    
+    def test_key_depends_on_sampling_params(self):
+        """Test sampling parameters are part of the cache key"""
+        key1 = LLMResponseCache.make_key("openai", "gpt-4", {"prompt": "x", "temperature": 0.1})
+        key2 = LLMResponseCache.make_key("openai", "gpt-4", {"temperature": 0.1, "prompt": "x"})
+        key3 = LLMResponseCache.make_key("openai", "gpt-4", {"prompt": "x", "temperature": 0.7})
+        
+        assert key1 == key2
+        assert key1 != key3
+    
+    @pytest.mark.asyncio
+    async def test_client_serves_cached_response(self):
+        """Test a cache hit never reaches the network and bypass skips it"""
+        cache = LLMResponseCache(enabled=True, db_path="")
+        client = CustomLLMClient({"session_pool": UnreachablePool(), "cache": cache})
+        config = client.providers["custom"]
+        key = LLMResponseCache.make_key("custom", config["model"], client._build_payload("hello", config))
+        cache.set(key, '{"cached": true}')
+        
+        assert await client.call_llm("hello", provider="custom") == '{"cached": true}'
+        with pytest.raises(ConnectionError):
+            await client.call_llm("hello", provider="custom", use_cache=False)
+    
+    @pytest.mark.asyncio
+    async def test_fallback_not_cached(self):
+        """Test fallback responses are never written to the cache"""
+        cache = LLMResponseCache(enabled=True, db_path="")
+        provider = LLMProvider()
+        provider.client = CustomLLMClient({"session_pool": UnreachablePool(), "cache": cache})
+        
+        response = await provider.call_with_fallback("hello", "stage1")
+        
+        assert "Requires Further Analysis" in response
+        assert cache.get_stats()["sets"] == 0
+
+class TestLLMStreaming:
+    """Test streamed LLM output"""
+    
+    def test_stream_payloads(self):
+        """Test streaming is requested only for streamed calls"""
+        client = CustomLLMClient()
+        
+        assert "stream" not in client._build_payload("x", client.providers["openai"])
+        assert client._build_payload("x", client.providers["openai"], stream=True)["stream"] is True
+        assert client._build_payload("x", client.providers["anthropic"], stream=True)["stream"] is True
+        assert client._build_payload("x", client.providers["custom"])["stream"] is False
+        assert client._build_payload("x", client.providers["custom"], stream=True)["stream"] is True
+    
+    def test_extract_stream_delta(self):
+        """Test delta extraction for each wire format"""
+        client = CustomLLMClient()
+        
+        assert client._extract_stream_delta('data: {"choices": [{"delta": {"content": "Hi"}, "finish_reason": null}]}', "openai") == ("Hi", False)
+        assert client._extract_stream_delta("data: [DONE]", "openai") == (None, True)
+        assert client._extract_stream_delta('data: {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "Hi"}}', "anthropic") == ("Hi", False)
+        assert client._extract_stream_delta("event: content_block_delta", "anthropic") == (None, False)
+        assert client._extract_stream_delta('data: {"type": "message_stop"}', "anthropic") == (None, True)
+        assert client._extract_stream_delta('{"response": "Hi", "done": false}', "ollama") == ("Hi", False)
+        assert client._extract_stream_delta('{"response": "", "done": true}', "ollama") == ("", True)
+    
+    @pytest.mark.asyncio
+    async def test_stream_with_fallback(self):
+        """Test a failed stream ends with the fallback response"""
+        provider = LLMProvider()
+        provider.client = CustomLLMClient({"session_pool": UnreachablePool(), "cache": LLMResponseCache(enabled=False)})
+        
+        events = [event async for event in provider.stream_with_fallback("hello", "stage2")]
+        
+        assert events == [{"text": provider.get_fallback_response("stage2"), "fallback": True}]
+
+class TestSingleFlight:
+    """Test coalescing of identical in-flight requests"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_coalesced(self):
+        """Test concurrent callers with one key share a single call"""
+        group = SingleFlight()
+        calls = []
+        
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+        
+        results = await asyncio.gather(*(group.do("key", fetch) for _ in range(5)))
+        
+        assert results == ["result"] * 5
+        assert len(calls) == 1
+        assert group.get_stats()["coalesced"] == 4
+        assert group.get_stats()["in_flight"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_errors_shared_and_not_sticky(self):
+        """Test followers see the leader's error and later calls retry"""
+        group = SingleFlight()
+        
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("provider down")
+        
+        results = await asyncio.gather(group.do("key", fail), group.do("key", fail), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        
+        async def succeed():
+            return "ok"
+        
+        assert await group.do("key", succeed) == "ok"
+
+class TestProviderLimiter:
+    """Test rate limiting and adaptive concurrency"""
+    
+    def make_limiter(self, **overrides):
+        settings = dict(name="test:nokey", rpm=600, tpm=100000, initial_concurrency=2,
+                        min_concurrency=1, max_concurrency=4, queue_timeout=1.0)
+        settings.update(overrides)
+        return ProviderLimiter(**settings)
+    
+    def test_aimd_adjustment(self):
+        """Test the limit halves on throttling and creeps up on success"""
+        limiter = self.make_limiter(initial_concurrency=4)
+        
+        limiter.in_flight = 1
+        limiter.release("throttled")
+        assert limiter.limit == 2.0
+        
+        limiter.in_flight = 1
+        limiter.release("success")
+        assert limiter.limit == 2.5
+    
+    @pytest.mark.asyncio
+    async def test_callers_queue_for_slot(self):
+        """Test callers beyond the concurrency limit wait for a release"""
+        limiter = self.make_limiter(initial_concurrency=1)
+        await limiter.acquire()
+        
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        assert limiter.get_stats()["queue_depth"] == 1
+        
+        limiter.release("success")
+        waited = await asyncio.wait_for(waiter, 1.0)
+        assert waited > 0
+        assert limiter.in_flight == 1
+    
+    @pytest.mark.asyncio
+    async def test_queue_deadline(self):
+        """Test a caller gives up when budget does not refill before its deadline"""
+        limiter = self.make_limiter(rpm=1)
+        await limiter.acquire()
+        limiter.release("success")
+        
+        with pytest.raises(RateLimitTimeout):
+            await limiter.acquire(timeout=0.05)
+        assert limiter.get_stats()["timeouts"] == 1
+    
+    def test_limiters_keyed_by_provider_and_key(self):
+        """Test separate limiters per provider and API key"""
+        registry = LLMRateLimiter()
+        
+        assert registry.get_limiter("openai", "key1") is registry.get_limiter("openai", "key1")
+        assert registry.get_limiter("openai", "key1") is not registry.get_limiter("openai", "key2")
+        assert "key1" not in "".join(registry.get_stats().keys())
+
+class TestLLMRouting:
+    """Test circuit breakers and provider routing"""
+    
+    def test_breaker_opens_and_recovers(self):
+        """Test closed -> open -> half-open -> closed transitions"""
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.01)
+        
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.allow_request() is False
+        
+        time.sleep(0.02)
+        assert breaker.allow_request() is True
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.allow_request() is False
+        
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+    
+    def test_rank_prefers_fast_healthy_providers(self):
+        """Test ranking by EWMA latency and skipping open circuits"""
+        router = LLMRouter()
+        router.record("openai", 2.0, True)
+        router.record("anthropic", 0.5, True)
+        
+        assert router.rank(["openai", "anthropic"]) == ["anthropic", "openai"]
+        
+        for _ in range(router.get_breaker("anthropic").failure_threshold):
+            router.record("anthropic", 0.5, False)
+        assert router.rank(["openai", "anthropic"]) == ["openai"]
+    
+    @pytest.mark.asyncio
+    async def test_client_fails_over(self):
+        """Test call_llm moves to the next provider when one fails"""
+        client = CustomLLMClient({"cache": LLMResponseCache(enabled=False), "router": LLMRouter()})
+        client._configured_providers = lambda: ["openai", "anthropic"]
+        
+        async def send(provider, config, payload, priority="interactive"):
+            if provider == "openai":
+                raise ConnectionError("openai down")
+            return "from " + provider
+        
+        client._send_request = send
+        assert await client.call_llm("hello") == "from anthropic"
+    
+    @pytest.mark.asyncio
+    async def test_half_open_slot_released_without_outcome(self):
+        """Test a trial call that times out in the queue or is cancelled leaves the provider routable"""
+        router = LLMRouter()
+        breaker = router.breakers["openai"] = CircuitBreaker(failure_threshold=1, recovery_timeout=0.01)
+        
+        class StalledLimiter:
+            def __init__(self, error=None):
+                self.error = error
+            
+            def get_limiter(self, provider, api_key):
+                return self
+            
+            async def acquire(self, tokens=0, priority="interactive"):
+                if self.error:
+                    raise self.error
+                await asyncio.sleep(1)
+        
+        client = CustomLLMClient({"cache": LLMResponseCache(enabled=False), "router": router,
+                                  "rate_limiter": StalledLimiter(RateLimitTimeout("queue deadline"))})
+        breaker.record_failure()
+        time.sleep(0.02)
+        
+        with pytest.raises(RateLimitTimeout):
+            await client.call_llm("hello", provider="openai")
+        assert breaker.state == CircuitBreaker.HALF_OPEN and breaker.is_available()
+        
+        client.rate_limiter = StalledLimiter()
+        call = asyncio.ensure_future(client.call_llm("hello", provider="openai"))
+        await asyncio.sleep(0.01)
+        assert not breaker.is_available()
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        assert breaker.is_available()
+        assert router.rank(["openai"]) == ["openai"]
+
+class TestHedgedRequests:
+    """Test hedged LLM requests"""
+    
+    def make_client(self):
+        client = CustomLLMClient({"cache": LLMResponseCache(enabled=False), "router": LLMRouter(), "hedge_enabled": True})
+        client._configured_providers = lambda: ["openai", "anthropic"]
+        return client
+    
+    @pytest.mark.asyncio
+    async def test_hedge_wins_against_slow_primary(self):
+        """Test a delayed duplicate answers first and the primary is cancelled"""
+        client = self.make_client()
+        cancelled = []
+        
+        async def call_provider(prompt, provider, use_cache, coalesce=True, priority="interactive"):
+            if provider == "openai":
+                try:
+                    await asyncio.sleep(1)
+                except asyncio.CancelledError:
+                    cancelled.append(provider)
+                    raise
+            return provider
+        
+        client._call_provider = call_provider
+        assert await client.call_llm("hello", hedge_delay=0.01) == "anthropic"
+        await asyncio.sleep(0)
+        
+        assert client.hedge_stats == {"fired": 1, "won": 1, "lost": 0}
+        assert cancelled == ["openai"]
+    
+    @pytest.mark.asyncio
+    async def test_no_hedge_for_fast_primary(self):
+        """Test no duplicate is sent when the primary answers within the delay"""
+        client = self.make_client()
+        
+        async def call_provider(prompt, provider, use_cache, coalesce=True, priority="interactive"):
+            return provider
+        
+        client._call_provider = call_provider
+        assert await client.call_llm("hello", hedge_delay=0.5) == "openai"
+        assert client.hedge_stats["fired"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_fast_primary_failure_fails_over_to_hedge_provider(self):
+        """Test the hedge provider is still tried when the primary fails before the hedge fires"""
+        client = self.make_client()
+        called = []
+        
+        async def call_provider(prompt, provider, use_cache, coalesce=True, priority="interactive"):
+            called.append(provider)
+            if provider == "openai":
+                raise ConnectionError("openai down")
+            return provider
+        
+        client._call_provider = call_provider
+        assert await client.call_llm("hello", hedge_delay=0.5) == "anthropic"
+        assert called == ["openai", "anthropic"]
+        assert client.hedge_stats["fired"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_no_hedge_without_latency_samples(self):
+        """Test percentile-based hedging waits for enough latency samples"""
+        client = self.make_client()
+        assert client._hedge_delay("openai") is None
+        
+        for _ in range(client.hedge_min_samples):
+            client.router.record("openai", 0.2, True)
+        assert client._hedge_delay("openai") == pytest.approx(0.2)
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_caller_does_not_cancel_followers(self):
+        """Test a coalesced call survives cancellation of the first caller"""
+        group = SingleFlight()
+        
+        async def fetch():
+            await asyncio.sleep(0.02)
+            return "result"
+        
+        first = asyncio.ensure_future(group.do("key", fetch))
+        second = asyncio.ensure_future(group.do("key", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        
+        assert await second == "result"
+
+class TestLLMBatch:
+    """Test batch LLM execution"""
+    
+    def make_client(self):
+        client = CustomLLMClient({"cache": LLMResponseCache(enabled=False)})
+        client.default_batch_backend = ConcurrentBatchBackend(retry_backoff=0)
+        return client
+    
+    @pytest.mark.asyncio
+    async def test_results_carry_index_and_respect_concurrency(self):
+        """Test every prompt is answered once with bounded concurrency"""
+        client = self.make_client()
+        active = []
+        peak = []
+        
+        async def call_llm(prompt, provider=None, use_cache=True, priority="interactive"):
+            assert priority == "batch"
+            active.append(prompt)
+            peak.append(len(active))
+            await asyncio.sleep(0.01 if prompt != "p0" else 0.03)
+            active.remove(prompt)
+            return prompt.upper()
+        
+        client.call_llm = call_llm
+        results = [r async for r in client.call_llm_batch([f"p{i}" for i in range(6)], concurrency=2)]
+        
+        assert sorted(r["index"] for r in results) == list(range(6))
+        assert all(r["response"] == f"P{r['index']}" for r in results)
+        assert results[0]["index"] != 0
+        assert max(peak) == 2
+    
+    @pytest.mark.asyncio
+    async def test_per_item_retry(self):
+        """Test a failing item is retried without affecting others"""
+        client = self.make_client()
+        attempts = {}
+        
+        async def call_llm(prompt, provider=None, use_cache=True, priority="interactive"):
+            attempts[prompt] = attempts.get(prompt, 0) + 1
+            if prompt == "flaky" and attempts[prompt] < 2:
+                raise ConnectionError("transient")
+            if prompt == "broken":
+                raise ConnectionError("permanent")
+            return "ok"
+        
+        client.call_llm = call_llm
+        results = {r["index"]: r async for r in client.call_llm_batch(["flaky", "broken", "fine"], retries=1)}
+        
+        assert results[0]["response"] == "ok" and results[0]["attempts"] == 2
+        assert results[1]["error"] == "permanent" and results[1]["attempts"] == 2
+        assert results[2]["response"] == "ok"
+    
+    @pytest.mark.asyncio
+    async def test_deadline_reports_unfinished(self):
+        """Test unfinished items are reported as errors at the deadline"""
+        client = self.make_client()
+        
+        async def call_llm(prompt, provider=None, use_cache=True, priority="interactive"):
+            await asyncio.sleep(1 if prompt == "slow" else 0)
+            return "ok"
+        
+        client.call_llm = call_llm
+        results = [r async for r in client.call_llm_batch(["fast", "slow"], deadline=0.05)]
+        
+        assert results[0] == {"index": 0, "response": "ok", "error": None, "attempts": 1}
+        assert results[1]["index"] == 1 and results[1]["error"] == "Batch deadline exceeded"
+    
+    @pytest.mark.asyncio
+    async def test_batch_yields_to_interactive(self):
+        """Test batch callers wait while interactive callers are queued"""
+        limiter = ProviderLimiter(name="test:nokey", rpm=600, tpm=100000, initial_concurrency=2,
+                                  min_concurrency=1, max_concurrency=4, queue_timeout=1.0)
+        await limiter.acquire()
+        
+        batch = asyncio.ensure_future(limiter.acquire(priority="batch"))
+        await asyncio.sleep(0.01)
+        assert not batch.done()
+        
+        limiter.release("success")
+        await asyncio.wait_for(batch, 1.0)
+        assert limiter.in_flight == 1
+
+class TestMockLLMServer:
+    """Test the mock LLM server through the real client"""
+    
+    async def start(self, **kwargs):
+        server = MockLLMServer(latency=FixedLatency(5), seed=1, **kwargs)
+        base_url = await server.start(port=0)
+        client = CustomLLMClient({
+            "session_pool": LLMSessionPool(),
+            "cache": LLMResponseCache(enabled=False),
+            "rate_limiter": LLMRateLimiter(),
+            "router": LLMRouter(),
+            "max_retries": 0
+        })
+        return server, base_url, client
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("format_type,path", [
+        ("openai", "/v1/chat/completions"),
+        ("anthropic", "/v1/messages"),
+        ("ollama", "/api/generate")
+    ])
+    async def test_wire_formats(self, format_type, path):
+        """Test whole and streamed responses in each wire format"""
+        server, base_url, client = await self.start()
+        client.providers["custom"].update({"url": base_url + path, "payload_format": format_type})
+        prompt = "You are an AI assistant specializing in detecting behavioral anomalies in financial transactions."
+        
+        try:
+            response = await client.call_llm(prompt, provider="custom")
+            streamed = "".join([delta async for delta in client.call_llm_stream(prompt, provider="custom")])
+        finally:
+            await client.close()
+            await server.stop()
+        
+        assert '"anomalyRating"' in response
+        assert streamed == response
+        assert server.stats["streamed"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_fault_injection(self):
+        """Test injected 429s surface as throttling errors"""
+        server, base_url, client = await self.start(error_429_rate=1.0)
+        client.providers["custom"].update({"url": base_url + "/v1/chat/completions", "payload_format": "openai"})
+        
+        try:
+            with pytest.raises(Exception, match="429"):
+                await client.call_llm("hello", provider="custom")
+        finally:
+            await client.close()
+            await server.stop()
+        
+        assert server.stats["429"] == 1
+    
+    def test_histogram_latency_replay(self):
+        """Test histogram sampling only returns recorded latencies"""
+        histogram = HistogramLatency([(100, 9), (2000, 1)])
+        rng = random.Random(0)
+        
+        samples = {histogram.sample(rng) for _ in range(200)}
+        
+        assert samples == {0.1, 2.0}
@@ -0,0 +1,70 @@
+import pytest
+import csv
+import io
+import json
+from src.core.prompt_format import CompactPromptSerializer, serializer_for, prompt_version_at_least
+from src.core.tokens import TokenCounter, HeuristicTokenizer
+from src.agents.tams_agent import create_tams_agent
+from run_prompt_benchmark import synthetic_history
+
+class TestPromptFormat:
+    """Test compact prompt serialization"""
+    
+    def test_v11_keeps_pretty_json(self):
+        """Test the v1.1 serializer reproduces the original json.dumps output"""
+        rows = [{"merchant": "Amazon", "amount": 45.99}]
+        
+        assert serializer_for("v1.1").records(rows) == json.dumps(rows, indent=2)
+        assert serializer_for("v1.1").items(["a", "b"]) == json.dumps(["a", "b"], indent=2)
+    
+    def test_compact_only_from_v13(self):
+        """Test v1.2 keeps JSON, later versions are compact and unknown versions behave as v1.1"""
+        assert serializer_for("v1.2").name == "json"
+        assert serializer_for("v1.3").name == "compact"
+        assert serializer_for("v9.9").name == "json"
+        assert prompt_version_at_least("v1.3", "v1.2")
+        assert not prompt_version_at_least("v9.9", "v1.2")
+    
+    def test_compact_table_round_trips(self):
+        """Test header, rounding, quoting and merchant codes preserve every value"""
+        rows = [
+            {"merchant": "Whole Foods, Inc", "amount": 12.3456, "mcc": "5411"},
+            {"merchant": "Amazon", "amount": 8.0, "mcc": "5399"},
+            {"merchant": "Whole Foods, Inc", "amount": 99.999, "mcc": None}
+        ]
+        
+        text = CompactPromptSerializer().records(rows, dictionary=("merchant",))
+        lines = text.splitlines()
+        assert lines[0] == "merchant codes:"
+        codes = dict(list(csv.reader(io.StringIO("\n".join(lines[1:3]))))[1:])
+        parsed = list(csv.DictReader(io.StringIO("\n".join(lines[3:]))))
+        
+        assert codes == {"m1": "Whole Foods, Inc"}
+        assert [codes.get(r["merchant"], r["merchant"]) for r in parsed] == ["Whole Foods, Inc", "Amazon", "Whole Foods, Inc"]
+        assert [r["amount"] for r in parsed] == ["12.35", "8", "100"]
+        assert [r["mcc"] for r in parsed] == ["5411", "5399", ""]
+    
+    def test_compact_saves_tokens(self):
+        """Test compact tables cost well under half the tokens of v1.1 JSON on a synthetic history"""
+        counter = TokenCounter(HeuristicTokenizer())
+        history = synthetic_history(200)
+        
+        before = counter.count(serializer_for("v1.1").records(history, dictionary=("merchant",)))
+        after = counter.count(serializer_for("v1.3").records(history, dictionary=("merchant",)))
+        
+        assert after < 0.5 * before
+    
+    @pytest.mark.asyncio
+    async def test_stage1_prompt_switches_with_prompt_version(self):
+        """Test the prompt version selects the serialization of embedded data"""
+        agent = create_tams_agent()
+        alert = {"timestamp": "2024-12-16T10:00:00Z", "merchant": "Amazon", "amount": 50.0,
+                 "transaction_type": "Card-Not-Present", "user_id": "user123"}
+        genuine_alerts = await agent._get_genuine_alerts("user123")
+        
+        prompt = await agent._build_stage1_prompt(alert, genuine_alerts)
+        assert "timestamp,merchant,amount,transaction_type,status\n2024-12-14T10:30:00Z,Amazon,45.99" in prompt
+        
+        agent.prompt_version = "v1.1"
+        prompt = await agent._build_stage1_prompt(alert, genuine_alerts)
+        assert json.dumps(genuine_alerts, indent=2) in prompt
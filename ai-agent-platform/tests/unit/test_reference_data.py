@@ -0,0 +1,87 @@
+import pytest
+import asyncio
+from src.core.reference_data import MerchantMatcher, ReferenceData, ReferenceDataCache
+from src.agents.tams_agent import create_tams_agent
+
+RISK_INTELLIGENCE = {
+    "high_risk_merchants": ["SuspiciousMerchant1", "FraudulentStore2", "Bet"],
+    "high_risk_countries": ["NG", "ru"],
+    "risky_currencies": ["XAU"],
+    "mcc_risk_data": {"7995": "High Risk", "5399": "Medium Risk", "5814": "Low Risk"}
+}
+
+class TestMerchantMatcher:
+    """Test normalized high-risk merchant matching"""
+    
+    def test_matches_descriptor_variants(self):
+        """Test case, spacing and punctuation variants hit; unrelated and too-short names do not"""
+        matcher = MerchantMatcher(RISK_INTELLIGENCE["high_risk_merchants"])
+        
+        assert matcher.find("FRAUDULENT STORE-2 LDN*1234") == ["FraudulentStore2"]
+        assert matcher.find("suspicious merchant 1") == ["SuspiciousMerchant1"]
+        assert matcher.find("Amazon") == []
+        assert matcher.find("Alphabet Inc") == []
+    
+    def test_overlapping_patterns(self):
+        """Test patterns that are suffixes of other patterns are reported via failure links"""
+        matcher = MerchantMatcher(["abcd", "bcde", "cdefgh"])
+        
+        assert matcher.find("xabcdefghx") == ["abcd", "bcde", "cdefgh"]
+
+class TestReferenceData:
+    """Test compiled lookup tables and the TTL cache"""
+    
+    def test_flags_for_alert(self):
+        """Test exact country, currency and dense MCC lookups"""
+        reference = ReferenceData(RISK_INTELLIGENCE, [])
+        
+        flags = reference.flags_for({"merchant": "Amazon", "merchant_country": "RU", "currency": "usd", "mcc": "7995"})
+        
+        assert flags == {"high_risk_merchant": False, "matched_merchants": [], "high_risk_country": True,
+                         "risky_currency": False, "mcc_risk": "High Risk"}
+        assert reference.flags_for({"merchant": "Amazon", "mcc": "0000"})["mcc_risk"] == "Unknown"
+        assert reference.flags_for({"merchant": "Amazon"})["high_risk_country"] is None
+    
+    @pytest.mark.asyncio
+    async def test_cache_reloads_after_ttl_and_keeps_snapshot_on_failure(self):
+        """Test concurrent gets share one load, expiry reloads and a failed refresh serves the old tables"""
+        loads = []
+        
+        async def loader():
+            loads.append(1)
+            if len(loads) == 3:
+                raise RuntimeError("risk database unavailable")
+            await asyncio.sleep(0.01)
+            return ReferenceData(RISK_INTELLIGENCE, ["check"])
+        
+        cache = ReferenceDataCache(loader, ttl_seconds=0.05)
+        first = await asyncio.gather(*[cache.get() for _ in range(5)])
+        assert len(loads) == 1 and all(r is first[0] for r in first)
+        
+        await asyncio.sleep(0.06)
+        second = await cache.get()
+        assert len(loads) == 2 and second is not first[0]
+        
+        assert await cache.refresh() is second
+        assert cache.get_stats()["refresh_errors"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_stage3_prompt_uses_flags(self):
+        """Test v1.2 sends check results while v1.1 keeps the raw lists"""
+        agent = create_tams_agent()
+        
+        async def mock_risk_intelligence():
+            return RISK_INTELLIGENCE
+        
+        agent._get_risk_intelligence_data = mock_risk_intelligence
+        alert = {"timestamp": "2024-12-16T10:00:00Z", "merchant": "Fraudulent Store 2", "amount": 50.0,
+                 "transaction_type": "Card-Not-Present", "user_id": "user123", "currency": "XAU"}
+        
+        prompt = await agent._build_stage3_prompt(alert, {})
+        assert "- Merchant On High-Risk Merchant List: Yes (matches FraudulentStore2)" in prompt
+        assert "- Currency Is Risky For User: Yes" in prompt
+        assert "High-Risk Merchants:" not in prompt
+        
+        agent.prompt_version = "v1.1"
+        prompt = await agent._build_stage3_prompt(alert, {})
+        assert "- High-Risk Merchants: ['SuspiciousMerchant1', 'FraudulentStore2', 'Bet']" in prompt
@@ -0,0 +1,59 @@
+import pytest
+import asyncio
+from src.core.stage_dag import StageDAG
+
+class TestStageDAG:
+    """Test dependency-ordered parallel stage execution"""
+    
+    @pytest.mark.asyncio
+    async def test_independent_stages_run_concurrently(self):
+        """Test stages without dependencies overlap and dependents wait"""
+        events = []
+        
+        def stage(name, delay):
+            async def run(deps):
+                events.append(f"{name}:start")
+                await asyncio.sleep(delay)
+                events.append(f"{name}:end")
+                return {"name": name, "deps": sorted(deps)}
+            return run
+        
+        dag = (StageDAG()
+            .add_stage("a", stage("a", 0.03))
+            .add_stage("b", stage("b", 0.01))
+            .add_stage("c", stage("c", 0.0), depends_on=["b"]))
+        results, timings = await dag.run()
+        
+        assert events[:2] == ["a:start", "b:start"]
+        assert events.index("c:start") > events.index("b:end")
+        assert events.index("c:start") < events.index("a:end")
+        assert results["c"]["deps"] == ["b"]
+        assert set(timings) == {"a", "b", "c"}
+        assert timings["a"] >= 25
+    
+    @pytest.mark.asyncio
+    async def test_failure_cancels_running_stages(self):
+        """Test a failing stage cancels its siblings and propagates"""
+        cancelled = []
+        
+        async def slow(deps):
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+        
+        async def broken(deps):
+            raise ValueError("stage failed")
+        
+        dag = StageDAG().add_stage("slow", slow).add_stage("broken", broken)
+        
+        with pytest.raises(ValueError, match="stage failed"):
+            await dag.run()
+        await asyncio.sleep(0)
+        assert cancelled == [True]
+    
+    def test_undefined_dependency_rejected(self):
+        """Test stages must be declared after their dependencies"""
+        with pytest.raises(ValueError):
+            StageDAG().add_stage("b", lambda deps: None, depends_on=["a"])
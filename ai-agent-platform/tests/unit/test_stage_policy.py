@@ -0,0 +1,137 @@
+import pytest
+import json
+from src.agents.tams_agent import TAMSAgent
+from src.core.stage_policy import ShortCircuitPolicy, ShortCircuitRule
+from tests.unit.stubs import StubProvider
+
+RESPONSES = {
+    "stage1": {"classification": "Likely Genuine", "confidenceScore": "High", "rationale": "Same merchant"},
+    "stage2": {"classification": "Likely Genuine", "anomalyRating": "Low", "keyAnomalousObservations": []},
+    "stage3": {"keyFindings": ["Routine"], "riskRating": 3}
+}
+
+INPUT = {
+    "timestamp": "2024-12-16T14:30:00Z",
+    "merchant": "Test Merchant",
+    "amount": 100.00,
+    "transaction_type": "Card-Present",
+    "user_id": "user123"
+}
+
+def stub_agent(config=None, responses=None):
+    agent = TAMSAgent(config={"stage1_prematch": False, "short_circuit": True, **(config or {})})
+    responses = responses or RESPONSES
+    calls = []
+
+    async def fake_call(prompt, stage="stage1", use_cache=True):
+        calls.append(stage)
+        return json.dumps(responses[stage])
+
+    agent.llm_provider = StubProvider(call_with_fallback=fake_call)
+    return agent, calls
+
+class TestShortCircuitPolicy:
+    """Test declarative skipping of later TAMS stages"""
+
+    @pytest.mark.asyncio
+    async def test_default_rule_skips_stage3_and_counts_savings(self):
+        """Test a confident genuine match with low anomaly never calls the Stage 3 LLM"""
+        agent, calls = stub_agent()
+        # A Stage 3 run seen earlier gives the policy a cost to credit to the skip
+        agent.short_circuit.observe("stage3", "x " * 400, json.dumps(RESPONSES["stage3"]))
+
+        result = await agent.execute(INPUT)
+
+        assert result["status"] == "completed"
+        assert sorted(calls) == ["stage1", "stage2"]
+        assert result["skipped_stages"] == {"stage3": "genuine_match_low_anomaly"}
+        assert result["analysis"]["stage3_risk_assessment"]["skipped"] is True
+        assert result["analysis"]["stage3_risk_assessment"]["assumedFields"] == ["riskRating"]
+        assert "genuine_match_low_anomaly" in result["analysis"]["stage3_risk_assessment"]["htmlContent"]
+        assert result["final_recommendation"]["overall_risk_score"] == 2
+
+        stats = agent.short_circuit.get_stats()["rules"]["genuine_match_low_anomaly"]
+        assert stats["fired"] == 1 and stats["llm_calls_saved"] == 1
+        assert stats["prompt_tokens_saved"] > 0 and stats["completion_tokens_saved"] > 0
+
+    @pytest.mark.asyncio
+    async def test_non_matching_and_disabled_policy_run_every_stage(self):
+        """Test stage 3 still runs when a condition fails or the policy is off"""
+        responses = {**RESPONSES, "stage2": {**RESPONSES["stage2"], "anomalyRating": "Medium"}}
+        agent, calls = stub_agent(responses=responses)
+        result = await agent.execute(INPUT)
+        assert sorted(calls) == ["stage1", "stage2", "stage3"]
+        assert result["skipped_stages"] == {}
+        assert agent.short_circuit.get_stats()["rules"]["genuine_match_low_anomaly"]["fired"] == 0
+
+        agent, calls = stub_agent({"short_circuit": False})
+        result = await agent.execute(INPUT)
+        assert agent.short_circuit is None
+        assert sorted(calls) == ["stage1", "stage2", "stage3"]
+
+    def test_policy_off_by_default(self, monkeypatch):
+        """Test the policy is only built when enabled in config or TAMS_SHORT_CIRCUIT"""
+        monkeypatch.delenv("TAMS_SHORT_CIRCUIT", raising=False)
+        assert ShortCircuitPolicy.from_config({}) is None
+        assert ShortCircuitPolicy.from_config({"short_circuit": True}).rules[0].name == "genuine_match_low_anomaly"
+
+        monkeypatch.setenv("TAMS_SHORT_CIRCUIT", "true")
+        assert ShortCircuitPolicy.from_config({}) is not None
+        assert ShortCircuitPolicy.from_config({"short_circuit": False}) is None
+
+    @pytest.mark.asyncio
+    async def test_fired_sop_rule_blocks_skip(self):
+        """Test an alert that trips an SOP check always gets a Stage 3 assessment"""
+        agent, calls = stub_agent()
+
+        # 4000 of a 5000 credit limit is above the 70% utilization threshold
+        result = await agent.execute({**INPUT, "amount": 4000.0})
+
+        assert sorted(calls) == ["stage1", "stage2", "stage3"]
+        assert result["skipped_stages"] == {}
+        stats = agent.short_circuit.get_stats()["rules"]["genuine_match_low_anomaly"]
+        assert stats["fired"] == 0 and stats["blocked"] == 1
+
+    @pytest.mark.asyncio
+    async def test_medium_risk_mcc_does_not_block_skip(self):
+        """Test an alert whose only fired SOP rule is a medium-risk MCC can still skip Stage 3"""
+        agent, calls = stub_agent()
+
+        result = await agent.execute({**INPUT, "mcc": "5399"})
+
+        assert sorted(calls) == ["stage1", "stage2"]
+        assert result["skipped_stages"] == {"stage3": "genuine_match_low_anomaly"}
+        assert agent.short_circuit.get_stats()["rules"]["genuine_match_low_anomaly"]["blocked"] == 0
+
+    @pytest.mark.asyncio
+    async def test_stream_emits_stage_skipped(self):
+        """Test streamed execution reports the skipped stage instead of starting it"""
+        agent, _ = stub_agent()
+
+        async def fake_stream(prompt, stage="stage1", use_cache=True):
+            yield {"text": json.dumps(RESPONSES[stage]), "fallback": False}
+
+        agent.llm_provider.stream_with_fallback = fake_stream
+        events = [event async for event in agent.execute_stream(INPUT)]
+
+        assert [e["event"] for e in events] == ["stage_started", "stage_completed", "stage_started",
+                                                "stage_completed", "stage_skipped", "completed"]
+        assert events[4]["rule"] == "genuine_match_low_anomaly"
+        assert events[-1]["result"]["skipped_stages"] == {"stage3": "genuine_match_low_anomaly"}
+
+    def test_rule_conditions_and_validation(self):
+        """Test list and range conditions, and that rules cannot look at the stage they skip"""
+        rule = ShortCircuitRule("low_risk", ["stage3"], {"stage2.anomalyRating": ["Low", "Medium"],
+                                                          "stage1.score": {"min": 0, "max": 0.3}})
+        assert rule.matches({"stage1": {"score": "0.2"}, "stage2": {"anomalyRating": "Medium"}})
+        assert not rule.matches({"stage1": {"score": 0.5}, "stage2": {"anomalyRating": "Low"}})
+        assert not rule.matches({"stage1": {"score": 0.1}, "stage2": {"anomalyRating": "Low", "skipped": True}})
+
+        with pytest.raises(ValueError):
+            ShortCircuitRule("bad", ["stage2"], {"stage2.anomalyRating": "Low"})
+        with pytest.raises(ValueError):
+            ShortCircuitRule("always", ["stage3"], {})
+
+        policy = ShortCircuitPolicy([{"name": "r", "skip": ["stage3"], "when": {"stage1.classification": "x"}}])
+        assert policy.dependencies("stage3") == {"stage1"}
+        assert policy.dependencies("stage2") == set()
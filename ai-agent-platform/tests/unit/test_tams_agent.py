@@ -1,6 +1,8 @@
 import pytest
+import asyncio
 from src.agents.tams_agent import TAMSAgent, create_tams_agent
 from src.agents.base import AgentType, AgentStatus
+from tests.unit.stubs import StubProvider
 
 class TestTAMSAgent:
     """Test TAMS AI-Assist agent functionality"""
@@ -147,4 +149,95 @@ class TestTAMSAgent:
         # Low priority actions
         actions = agent._determine_next_actions("Low Priority - Likely Genuine", 2)
         assert "Mark as reviewed - likely genuine" in actions[0]
-        assert len(actions) == 3
\ No newline at end of file
+        assert len(actions) == 3
+    
+    @pytest.mark.asyncio
+    async def test_execute_stream_events(self):
+        """Test streamed execution emits stage events in order"""
+        agent = create_tams_agent()
+        
+        async def fake_stream(prompt, stage="stage1", use_cache=True):
+            yield {"delta": '{"classification": '}
+            yield {"delta": '"Likely Genuine"}'}
+            yield {"text": '{"classification": "Likely Genuine", "riskRating": 2}', "fallback": False}
+        
+        agent.llm_provider = StubProvider(stream_with_fallback=fake_stream)
+        
+        input_data = {
+            "timestamp": "2024-12-16T14:30:00Z",
+            "merchant": "Test Merchant",
+            "amount": 100.00,
+            "transaction_type": "Card-Present",
+            "user_id": "user123"
+        }
+        events = [event async for event in agent.execute_stream(input_data)]
+        
+        completed = [e["stage"] for e in events if e["event"] == "stage_completed"]
+        assert completed == ["stage1", "stage2", "stage3"]
+        assert events[0] == {"event": "stage_started", "stage": "stage1"}
+        assert events[1]["event"] == "stage_partial"
+        assert events[-1]["event"] == "completed"
+        assert events[-1]["result"]["final_recommendation"]["overall_risk_score"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_execute_runs_stage1_and_stage2_concurrently(self):
+        """Test Stage 1 and Stage 2 overlap and timings are reported"""
+        agent = create_tams_agent()
+        in_flight = []
+        overlap = []
+        
+        async def fake_call(prompt, stage="stage1", use_cache=True):
+            in_flight.append(stage)
+            overlap.append(set(in_flight))
+            await asyncio.sleep(0.02)
+            in_flight.remove(stage)
+            return '{"classification": "Likely Genuine", "riskRating": 2}'
+        
+        agent.llm_provider = StubProvider(call_with_fallback=fake_call)
+        
+        input_data = {
+            "timestamp": "2024-12-16T14:30:00Z",
+            "merchant": "Test Merchant",
+            "amount": 100.00,
+            "transaction_type": "Card-Present",
+            "user_id": "user123"
+        }
+        result = await agent.execute(input_data)
+        
+        assert result["status"] == "completed"
+        assert {"stage1", "stage2"} in overlap
+        assert "stage3" not in set().union(*overlap[:2])
+        assert set(result["stage_timings_ms"]) == {"stage1", "stage2", "stage3"}
+    
+    @pytest.mark.asyncio
+    async def test_execute_batch_isolates_errors_and_tracks_cursor(self):
+        """Test batch results stream as completed with a contiguous cursor"""
+        agent = create_tams_agent()
+        
+        async def fake_execute(item):
+            await asyncio.sleep(item["amount"] / 1000)
+            if item["merchant"] == "Broken":
+                raise RuntimeError("upstream failure")
+            return {"status": "completed", "amount": item["amount"]}
+        
+        agent.execute = fake_execute
+        base = {"timestamp": "2024-12-16T14:30:00Z", "merchant": "Test Merchant", "transaction_type": "Card-Present", "user_id": "user123"}
+        items = [{**base, "amount": 30}, {**base, "amount": 5, "merchant": "Broken"}, {"merchant": "incomplete"}, {**base, "amount": 1, "alert_id": "A4"}]
+        
+        async def source():
+            for item in items:
+                yield item
+        
+        lines = [line async for line in agent.execute_batch(source(), concurrency=2)]
+        
+        assert sorted(line["index"] for line in lines) == [0, 1, 2, 3]
+        by_index = {line["index"]: line for line in lines}
+        assert by_index[0]["status"] == "completed"
+        assert by_index[1]["error"] == "TAMS analysis failed: upstream failure"
+        assert by_index[2]["status"] == "error"
+        assert by_index[3]["alert_id"] == "A4"
+        assert lines[0]["cursor"] == 0
+        assert lines[-1]["cursor"] == 4
+        
+        resumed = [line async for line in agent.execute_batch(source(), concurrency=2, start=3)]
+        assert [line["index"] for line in resumed] == [3]
@@ -0,0 +1,78 @@
+import pytest
+import asyncio
+from src.core.alert_queue import SQLiteQueue
+from src.agents.tams_worker import TAMSWorkerPool
+from src.agents.tams_agent import create_tams_agent
+
+ALERT = {
+    "timestamp": "2024-12-16T14:30:00Z",
+    "merchant": "Test Merchant",
+    "amount": 100.00,
+    "transaction_type": "Card-Present",
+    "user_id": "user123"
+}
+
+class TestSQLiteQueue:
+    """Test the local SQLite alert queue"""
+    
+    @pytest.mark.asyncio
+    async def test_lease_is_exclusive_until_visibility_timeout(self, tmp_path):
+        """Test a leased message is hidden from other consumers until its lease expires"""
+        queue = SQLiteQueue(str(tmp_path / "queue.db"), visibility_timeout=0.05, poll_interval=0.01)
+        await queue.publish(ALERT)
+        
+        first = await queue.read("worker-a", block_ms=0)
+        hidden = await queue.read("worker-b", block_ms=0)
+        await asyncio.sleep(0.06)
+        redelivered = await queue.read("worker-b", block_ms=0)
+        
+        assert len(first) == 1 and hidden == []
+        assert redelivered[0].id == first[0].id
+        await queue.ack(redelivered[0])
+        assert await queue.read("worker-a", block_ms=0) == []
+        await queue.close()
+
+class TestTAMSWorkerPool:
+    """Test queue-driven TAMS workers"""
+    
+    def make_pool(self, tmp_path, execute):
+        queue = SQLiteQueue(str(tmp_path / "queue.db"), poll_interval=0.01)
+        agent = create_tams_agent()
+        agent.execute = execute
+        return queue, TAMSWorkerPool(queue, agent=agent, concurrency=2, max_attempts=2, retry_backoff=0, consumer_name="test")
+    
+    @pytest.mark.asyncio
+    async def test_results_retry_and_dead_letter(self, tmp_path):
+        """Test successes are published, failures retried then dead-lettered"""
+        calls = {}
+        
+        async def execute(alert):
+            calls[alert["merchant"]] = calls.get(alert["merchant"], 0) + 1
+            if alert["merchant"] == "Always Fails":
+                return {"status": "failed", "error": "LLM unavailable"}
+            if alert["merchant"] == "Fails Once" and calls["Fails Once"] == 1:
+                raise RuntimeError("transient")
+            return {"status": "completed", "merchant": alert["merchant"]}
+        
+        queue, pool = self.make_pool(tmp_path, execute)
+        await queue.publish({**ALERT, "alert_id": "ok"})
+        await queue.publish({**ALERT, "merchant": "Fails Once", "alert_id": "retry"})
+        await queue.publish({**ALERT, "merchant": "Always Fails", "alert_id": "dead"})
+        await queue.publish({"merchant": "incomplete"})
+        
+        runner = asyncio.ensure_future(pool.run())
+        for _ in range(200):
+            if pool.stats["completed"] + pool.stats["dead_lettered"] == 4:
+                break
+            await asyncio.sleep(0.01)
+        pool.stop()
+        await asyncio.wait_for(runner, 5)
+        
+        results = {r["alert_id"]: r for r in queue.results()}
+        dead = queue.dead_letters()
+        assert set(results) == {"ok", "retry"}
+        assert results["retry"]["attempts"] == 2
+        assert calls["Always Fails"] == 2
+        assert [d["payload"].get("alert_id") for d in dead] == ["dead", None]
+        assert dead[0]["error"] == "LLM unavailable"
+        await queue.close()
@@ -0,0 +1,103 @@
+import pytest
+from src.core.tokens import HeuristicTokenizer, TokenCounter, TokenAccountant, PromptSizeGuard
+from src.core.llm_client import CustomLLMClient
+from src.agents.tams_agent import create_tams_agent
+
+class TestTokenCounting:
+    """Test token counting and accounting"""
+    
+    def test_heuristic_tokenizer(self):
+        """Test the offline tokenizer splits words, numbers and punctuation"""
+        tokenizer = HeuristicTokenizer()
+        
+        assert tokenizer.count("") == 0
+        assert tokenizer.count("Hi there!") == 3
+        assert tokenizer.count("internationalization") == 4
+        assert tokenizer.count("1250.00") == 4
+    
+    def test_counts_are_cached(self):
+        """Test repeated text is counted once"""
+        counter = TokenCounter(HeuristicTokenizer())
+        counter.count("same text")
+        counter.count("same text")
+        
+        assert counter.cache_info()["hits"] == 1
+    
+    def test_tokenizer_created_lazily_and_cache_bounded(self):
+        """Test no tokenizer is built until the first count and the cache evicts past its size"""
+        counter = TokenCounter(cache_size=2)
+        assert counter._tokenizer is None
+        
+        for text in ("one", "two", "three", "one"):
+            counter.count(text)
+        
+        assert counter._tokenizer is not None
+        assert counter.cache_info() == {"hits": 0, "misses": 4, "size": 2}
+    
+    def test_usage_recorded_per_model(self):
+        """Test prompt and completion tokens accumulate per provider and model"""
+        accountant = TokenAccountant()
+        accountant.record("openai", "gpt-4", 100, 20)
+        accountant.record("openai", "gpt-4", 50, 10)
+        
+        assert accountant.usage["openai:gpt-4"] == {"calls": 2, "prompt_tokens": 150, "completion_tokens": 30}
+    
+    def test_provider_reported_usage(self):
+        """Test usage extraction for each wire format"""
+        client = CustomLLMClient()
+        
+        assert client._extract_usage({"usage": {"prompt_tokens": 10, "completion_tokens": 5}}, "openai") == (10, 5)
+        assert client._extract_usage({"usage": {"input_tokens": 10, "output_tokens": 5}}, "anthropic") == (10, 5)
+        assert client._extract_usage({"prompt_eval_count": 10, "eval_count": 5}, "ollama") == (10, 5)
+        assert client._extract_usage({}, "openai") is None
+
+class TestPromptSizeGuard:
+    """Test prompt trimming to a token budget"""
+    
+    def make_rows(self, count):
+        return [{"timestamp": f"2024-12-{day:02d}T10:00:00Z", "merchant": f"Merchant {day}"} for day in range(1, count + 1)]
+    
+    def test_fitting_prompt_untouched(self):
+        """Test prompts within budget are rendered unchanged"""
+        guard = PromptSizeGuard(TokenCounter(HeuristicTokenizer()))
+        prompt, trimmed = guard.fit(lambda rows: str(rows), {"rows": self.make_rows(3)}, 10000)
+        
+        assert trimmed == {}
+        assert "Merchant 3" in prompt
+    
+    def test_oldest_rows_trimmed_first(self):
+        """Test the oldest rows are dropped and the newest kept in order"""
+        guard = PromptSizeGuard(TokenCounter(HeuristicTokenizer()))
+        rows = self.make_rows(20)
+        render = lambda rows: "\n".join(row["merchant"] for row in rows)
+        budget = guard.counter.count(render(rows[-5:]))
+        
+        prompt, trimmed = guard.fit(render, {"rows": rows}, budget)
+        
+        assert trimmed == {"rows": 15}
+        assert prompt == render(rows[-5:])
+        assert guard.stats["rows_trimmed"] == 15
+    
+    @pytest.mark.asyncio
+    async def test_tams_history_trimmed_to_budget(self):
+        """Test Stage 2 drops old history rows under a small context budget"""
+        agent = create_tams_agent()
+        agent.prompt_version = "v1.1"
+        history = [
+            {"timestamp": f"2024-{month:02d}-{day:02d}T09:00:00Z", "merchant": "Amazon", "amount": 10.0 + day, "transaction_type": "Card-Not-Present", "mcc": "5399"}
+            for month in (10, 11, 12) for day in range(1, 29)
+        ]
+        
+        async def get_history(user_id):
+            return history
+        
+        agent._get_transaction_history = get_history
+        input_data = {"timestamp": "2024-12-29T10:00:00Z", "merchant": "Amazon", "amount": 20.0, "transaction_type": "Card-Not-Present", "user_id": "u1"}
+        full_prompt = agent._render_stage2_prompt(input_data, history)
+        agent.config["prompt_token_budget"] = agent.prompt_guard.counter.count(full_prompt) // 2
+        
+        prompt = await agent._build_stage2_prompt(input_data)
+        
+        assert agent.prompt_guard.counter.count(prompt) <= agent.config["prompt_token_budget"]
+        assert "2024-12-28T09:00:00Z" in prompt
+        assert "2024-10-01T09:00:00Z" not in prompt